@@ -1,3 +1,8 @@
+# Divide the host's cores among worker processes and their thread pools
+# before NumPy, OpenCV or TensorFlow size their own
+from app.utils.thread_budget import apply_thread_budget
+apply_thread_budget()
+
 from flask import Flask
 from flask_jwt_extended import JWTManager
 from flask_cors import CORS
@@ -28,8 +33,8 @@ def create_app(config_name='development'):
     
     # Test MongoDB connection
     try:
-        from pymongo import MongoClient
-        client = MongoClient(app.config['MONGO_URI'])
+        from app.utils.db import get_client
+        client = get_client(app.config['MONGO_URI'])
         db = client.get_default_database()
         # Test connection
         client.server_info()
@@ -41,8 +46,10 @@ def create_app(config_name='development'):
     # Register blueprints
     from app.routes.auth import auth_bp
     from app.routes.upload import upload_bp
+    from app.routes.metrics import metrics_bp
     
     app.register_blueprint(auth_bp, url_prefix='/api/auth')
     app.register_blueprint(upload_bp, url_prefix='/api/upload')
+    app.register_blueprint(metrics_bp, url_prefix='/api/metrics')
     
     return app
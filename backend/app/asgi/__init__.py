@@ -0,0 +1,70 @@
+import os
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+def create_asgi_app(config_name='development'):
+    """Create the async (ASGI) variant of the API
+
+    Serves the same /api/auth and /api/upload endpoints with async handlers
+    on Quart: request bodies and Mongo calls are awaited on the event loop,
+    and face detection/embedding runs on a bounded executor, so slow
+    clients and database round-trips no longer pin a thread each.
+    Run with e.g. `hypercorn asgi:app` from the backend directory.
+    """
+    from quart import Quart
+
+    app = Quart(__name__)
+
+    # Load configuration
+    from config import config
+    app.config.from_object(config[config_name])
+    # Slow mobile uploads may legitimately take a while to arrive
+    app.config['BODY_TIMEOUT'] = app.config['ASYNC_BODY_TIMEOUT']
+
+    # Ensure upload directories exist
+    upload_dir = app.config['UPLOAD_FOLDER']
+    os.makedirs(os.path.join(upload_dir, 'profiles'), exist_ok=True)
+    os.makedirs(os.path.join(upload_dir, 'groups'), exist_ok=True)
+
+    try:
+        from quart_cors import cors
+        app = cors(app)
+    except ImportError:
+        logging.getLogger(__name__).warning("⚠️ quart-cors not installed - CORS headers disabled")
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+
+    # Register blueprints
+    from app.asgi.auth import auth_bp
+    from app.asgi.upload import upload_bp
+    from app.asgi.metrics import metrics_bp
+
+    app.register_blueprint(auth_bp, url_prefix='/api/auth')
+    app.register_blueprint(upload_bp, url_prefix='/api/upload')
+    app.register_blueprint(metrics_bp, url_prefix='/api/metrics')
+
+    # ML work is offloaded here. Its threads mostly wait for an ML scheduler
+    # slot, so there must be more of them than slots: jobs then queue in the
+    # scheduler (priority, aging, fair share, load shedding) rather than in
+    # the executor's own FIFO. The ML stack was initialized by the imports above.
+    from app.utils import ml_processor
+    slots = ml_processor.ml_scheduler.slots
+    app.extensions['ml_executor'] = ThreadPoolExecutor(
+        max_workers=app.config['ASYNC_ML_WORKERS'] or slots + (app.config['ML_SHED_MAX_QUEUED'] or 4 * slots),
+        thread_name_prefix='ml'
+    )
+    # Photo store and database calls get their own threads, so they never queue behind ML jobs
+    app.extensions['io_executor'] = ThreadPoolExecutor(
+        max_workers=app.config['ASYNC_IO_WORKERS'],
+        thread_name_prefix='io'
+    )
+
+    @app.after_serving
+    async def shutdown_executor():
+        app.extensions['ml_executor'].shutdown(wait=False)
+        app.extensions['io_executor'].shutdown(wait=False)
+
+    return app
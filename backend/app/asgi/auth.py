@@ -0,0 +1,151 @@
+import logging
+from quart import Blueprint, request, jsonify
+from app.asgi.runtime import get_adb
+from app.asgi.security import create_access_token, jwt_required, get_jwt_identity, rate_limited
+from app.routes.auth import validate_registration, new_user_document, busy_response
+from app.utils.password_hashing import password_hasher, PasswordHashingBusy
+from app.utils.user_cache import get_user_async
+
+logger = logging.getLogger(__name__)
+
+auth_bp = Blueprint('async_auth', __name__)
+
+@auth_bp.route('/register', methods=['POST'])
+@rate_limited('register')
+async def register():
+    """Register a new user"""
+    try:
+        data = await request.get_json()
+        
+        # Validate input
+        error = validate_registration(data)
+        if error:
+            return jsonify({
+                'status': 'error',
+                'message': error
+            }), 400
+        
+        username = data['username'].strip()
+        email = data['email'].strip().lower()
+        password = data['password']
+        
+        db = get_adb()
+        
+        # Check if user already exists
+        if await db.users.find_one({'$or': [{'username': username}, {'email': email}]}):
+            return jsonify({
+                'status': 'error',
+                'message': 'Username or email already exists'
+            }), 400
+        
+        # Hash on the bounded pool without holding an event-loop thread
+        password_hash = await password_hasher.hash_password_async(password)
+        
+        result = await db.users.insert_one(new_user_document(username, email, password_hash))
+        user_id = str(result.inserted_id)
+        
+        return jsonify({
+            'status': 'success',
+            'message': 'User registered successfully',
+            'data': {
+                'user_id': user_id,
+                'username': username,
+                'email': email,
+                'access_token': create_access_token(user_id)
+            }
+        }), 201
+        
+    except PasswordHashingBusy:
+        return busy_response()
+    except Exception as e:
+        logger.error(f"Registration error: {e}")
+        return jsonify({
+            'status': 'error',
+            'message': f'Registration failed: {str(e)}'
+        }), 500
+
+@auth_bp.route('/login', methods=['POST'])
+@rate_limited('login')
+async def login():
+    """Login user"""
+    try:
+        data = await request.get_json()
+        
+        # Validate required fields
+        if not data or not all(k in data for k in ('username', 'password')):
+            return jsonify({
+                'status': 'error',
+                'message': 'Username and password are required'
+            }), 400
+        
+        username = data['username'].strip()
+        password = data['password']
+        
+        user = await get_adb().users.find_one({'username': username})
+        
+        valid = False
+        if user:
+            valid = await password_hasher.verify_password_async(user['password_hash'], password)
+        if not valid:
+            return jsonify({
+                'status': 'error',
+                'message': 'Invalid username or password'
+            }), 401
+        
+        user_id = str(user['_id'])
+        return jsonify({
+            'status': 'success',
+            'message': 'Login successful',
+            'data': {
+                'user_id': user_id,
+                'username': user['username'],
+                'email': user['email'],
+                'access_token': create_access_token(user_id),
+                'has_profile_photo': user.get('profile_photo') is not None,
+                'has_face_embedding': user.get('face_embedding') is not None
+            }
+        }), 200
+        
+    except PasswordHashingBusy:
+        return busy_response()
+    except Exception as e:
+        logger.error(f"Login error: {e}")
+        return jsonify({
+            'status': 'error',
+            'message': f'Login failed: {str(e)}'
+        }), 500
+
+@auth_bp.route('/profile', methods=['GET'])
+@jwt_required
+@rate_limited('profile')
+async def get_profile():
+    """Get current user profile"""
+    try:
+        user_id = get_jwt_identity()
+        
+        user = await get_user_async(get_adb(), user_id)
+        if not user:
+            return jsonify({
+                'status': 'error',
+                'message': 'User not found'
+            }), 404
+        
+        return jsonify({
+            'status': 'success',
+            'message': 'Profile retrieved successfully',
+            'data': {
+                'user_id': str(user['_id']),
+                'username': user['username'],
+                'email': user['email'],
+                'profile_photo': user.get('profile_photo'),
+                'has_face_embedding': user.get('face_embedding') is not None,
+                'face_confidence': user.get('face_confidence')
+            }
+        }), 200
+        
+    except Exception as e:
+        logger.error(f"Get profile error: {e}")
+        return jsonify({
+            'status': 'error',
+            'message': f'Failed to retrieve profile: {str(e)}'
+        }), 500
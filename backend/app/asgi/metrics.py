@@ -0,0 +1,94 @@
+from quart import Blueprint, request, jsonify, Response
+from bson import ObjectId
+from bson.errors import InvalidId
+from app.asgi.runtime import get_adb
+from app.asgi.security import jwt_required
+from app.utils.metrics import collect_metrics
+from app.utils.profiling import request_profiler, PROFILE_HEADER, PROFILES_COLLECTION, profile_summary
+
+metrics_bp = Blueprint('async_metrics', __name__)
+
+@metrics_bp.route('/', methods=['GET'])
+@jwt_required
+async def get_metrics():
+    """Get runtime metrics of the ML pipeline and caches"""
+    names = request.args.get('only')
+    names = set(names.split(',')) if names else None
+    return jsonify({
+        'status': 'success',
+        'message': 'Metrics collected',
+        'data': collect_metrics(names)
+    }), 200
+
+def profiling_forbidden():
+    """403 unless the request carries the profiling token"""
+    if request_profiler.authorized(request.headers.get(PROFILE_HEADER)):
+        return None
+    return jsonify({
+        'status': 'error',
+        'message': 'Profiling requires a valid X-Profile-Token header'
+    }), 403
+
+@metrics_bp.route('/profiling', methods=['GET', 'POST'])
+@jwt_required
+async def profiling_settings():
+    """Show or change request profiling (sample rate, next N requests, mode)"""
+    forbidden = profiling_forbidden()
+    if forbidden:
+        return forbidden
+    try:
+        if request.method == 'POST':
+            data = await request.get_json(silent=True) or {}
+            request_profiler.configure(
+                sample_rate=data.get('sample_rate'),
+                next_requests=data.get('next_requests'),
+                mode=data.get('mode')
+            )
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    return jsonify({
+        'status': 'success',
+        'message': 'Profiling settings',
+        'data': request_profiler.settings()
+    }), 200
+
+@metrics_bp.route('/profiles', methods=['GET'])
+@jwt_required
+async def list_profiles():
+    """Recent stored profiles, optionally for one photo or user (?target_id=)"""
+    forbidden = profiling_forbidden()
+    if forbidden:
+        return forbidden
+    query = {}
+    if request.args.get('target_id'):
+        query['target_id'] = request.args['target_id']
+    limit = min(request.args.get('limit', 20, type=int), 100)
+    profiles = await get_adb()[PROFILES_COLLECTION].find(query, {'collapsed': 0, 'top_functions': 0}) \
+        .sort('created_at', -1).limit(limit).to_list()
+    return jsonify({
+        'status': 'success',
+        'message': 'Profiles retrieved',
+        'data': [profile_summary(doc) for doc in profiles]
+    }), 200
+
+@metrics_bp.route('/profiles/<profile_id>', methods=['GET'])
+@jwt_required
+async def get_profile(profile_id):
+    """One profile; ?format=collapsed returns flamegraph-ready collapsed stacks as text"""
+    forbidden = profiling_forbidden()
+    if forbidden:
+        return forbidden
+    try:
+        doc = await get_adb()[PROFILES_COLLECTION].find_one({'_id': ObjectId(profile_id)})
+    except InvalidId:
+        doc = None
+    if doc is None:
+        return jsonify({'status': 'error', 'message': 'Profile not found'}), 404
+    
+    if request.args.get('format') == 'collapsed':
+        return Response(doc['collapsed'] + '\n', mimetype='text/plain')
+    return jsonify({
+        'status': 'success',
+        'message': 'Profile retrieved',
+        'data': dict(profile_summary(doc), collapsed=doc['collapsed'], top_functions=doc.get('top_functions'))
+    }), 200
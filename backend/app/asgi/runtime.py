@@ -0,0 +1,25 @@
+import asyncio
+import functools
+from quart import current_app
+from app.utils.async_db import get_async_db
+from app.utils.db import get_client
+
+def get_adb():
+    """Async database handle for the current app"""
+    return get_async_db(current_app.config['MONGO_URI'])
+
+def get_sync_db():
+    """Synchronous database handle for code running on executor threads"""
+    return get_client(current_app.config['MONGO_URI']).get_default_database()
+
+async def run_blocking(fn, *args, **kwargs):
+    """Run ML work on the app's ML executor, where its threads wait for a scheduler slot"""
+    executor = current_app.extensions['ml_executor']
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, functools.partial(fn, *args, **kwargs))
+
+async def run_io(fn, *args, **kwargs):
+    """Run blocking storage or database calls on the app's I/O executor, never behind ML jobs"""
+    executor = current_app.extensions['io_executor']
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, functools.partial(fn, *args, **kwargs))
@@ -0,0 +1,71 @@
+import uuid
+import asyncio
+import functools
+from datetime import datetime, timezone
+import jwt
+from quart import request, jsonify, current_app, g
+from app.utils.rate_limit import rate_limiter, load_shedder, client_ip, too_many_requests, overloaded_response
+
+# Tokens use the same claims and signing as flask_jwt_extended, so a token
+# issued by either serving mode is accepted by the other.
+
+def create_access_token(identity):
+    """Create a JWT access token for a user id"""
+    now = datetime.now(timezone.utc)
+    claims = {
+        'fresh': False,
+        'iat': now,
+        'jti': str(uuid.uuid4()),
+        'type': 'access',
+        'sub': identity,
+        'nbf': now,
+        'exp': now + current_app.config['JWT_ACCESS_TOKEN_EXPIRES']
+    }
+    return jwt.encode(claims, current_app.config['JWT_SECRET_KEY'], algorithm='HS256')
+
+def decode_access_token(token):
+    """Decode and verify an access token; raises jwt.InvalidTokenError"""
+    claims = jwt.decode(token, current_app.config['JWT_SECRET_KEY'], algorithms=['HS256'])
+    if claims.get('type') != 'access':
+        raise jwt.InvalidTokenError('Only access tokens are allowed')
+    return claims
+
+def jwt_required(view):
+    """Async counterpart of flask_jwt_extended.jwt_required()"""
+    @functools.wraps(view)
+    async def wrapper(*args, **kwargs):
+        header = request.headers.get('Authorization', '')
+        if not header.startswith('Bearer '):
+            return jsonify({'msg': 'Missing Authorization Header'}), 401
+        try:
+            g.jwt_identity = decode_access_token(header[len('Bearer '):])['sub']
+        except jwt.ExpiredSignatureError:
+            return jsonify({'msg': 'Token has expired'}), 401
+        except jwt.InvalidTokenError as e:
+            return jsonify({'msg': str(e)}), 422
+        return await view(*args, **kwargs)
+    return wrapper
+
+def get_jwt_identity():
+    """Identity of the verified token of the current request"""
+    return g.get('jwt_identity')
+
+def rate_limited(endpoint, shed=False):
+    """Async counterpart of app.utils.rate_limit.rate_limited (goes below @jwt_required)"""
+    def decorator(view):
+        @functools.wraps(view)
+        async def wrapper(*args, **kwargs):
+            ip = client_ip(request.remote_addr, request.headers.get('X-Forwarded-For'),
+                           current_app.config['RATE_LIMIT_TRUST_FORWARDED'])
+            check = functools.partial(rate_limiter.check, endpoint, get_jwt_identity(), ip)
+            # A shared store is a database round-trip; keep it off the event loop
+            limited = await asyncio.to_thread(check) if rate_limiter.store.blocking else check()
+            if limited:
+                return too_many_requests(limited)
+            if shed:
+                retry_after = load_shedder.check()
+                if retry_after:
+                    return overloaded_response(retry_after)
+            return await view(*args, **kwargs)
+        return wrapper
+    return decorator
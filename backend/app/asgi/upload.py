@@ -0,0 +1,330 @@
+import asyncio
+import logging
+from datetime import datetime
+from bson import ObjectId
+from quart import Blueprint, request, jsonify, current_app
+from app.asgi.runtime import get_adb, get_sync_db, run_blocking, run_io
+from app.asgi.security import jwt_required, get_jwt_identity, rate_limited
+from app.routes.upload import (
+    allowed_file, my_photos_cache, my_photos_query, format_my_photo,
+    parse_pagination, paginate_photos, discard_upload, process_stored_photo, process_group_upload,
+    build_user_stats, busy_response, cancelled_response
+)
+from app.utils.ml_processor import (
+    process_profile_photo, test_ml_setup, record_enrollment
+)
+from app.utils.ml_scheduler import INTERACTIVE_ENROLLMENT, SchedulerBusy
+from app.utils.match_versions import get_match_version_async
+from app.utils.user_cache import get_user_async, invalidate_user
+from app.utils.storage import photo_store
+from app.utils.user_stats import STATS_COLLECTION
+from app.utils.profiling import request_profiler, PROFILE_HEADER
+from app.utils.deadlines import Deadline, RequestCancelled, CLIENT_DISCONNECTED
+from config import get_active_config
+
+logger = logging.getLogger(__name__)
+
+upload_bp = Blueprint('async_upload', __name__)
+
+async def receive_upload(user_id, kind):
+    """Validate the multipart upload and store it; returns its key or an error response"""
+    files = await request.files
+    if 'file' not in files:
+        return None, (jsonify({
+            'status': 'error',
+            'message': 'No file provided'
+        }), 400)
+    
+    file = files['file']
+    if file.filename == '':
+        return None, (jsonify({
+            'status': 'error',
+            'message': 'No file selected'
+        }), 400)
+    
+    # Validate file type
+    if not allowed_file(file.filename):
+        return None, (jsonify({
+            'status': 'error',
+            'message': 'Invalid file type. Allowed: png, jpg, jpeg, gif, bmp'
+        }), 400)
+    
+    # Make sure the account behind the token still exists (cached by id)
+    if await get_user_async(get_adb(), user_id) is None:
+        return None, (jsonify({
+            'status': 'error',
+            'message': 'User not found'
+        }), 404)
+    
+    # Hashing and the atomic write run off the event loop
+    file_extension = file.filename.rsplit('.', 1)[1].lower()
+    filename = await run_io(photo_store.save, get_sync_db(), file.read(), file_extension, kind)
+    return filename, None
+
+@upload_bp.route('/test-ml', methods=['GET'])
+@jwt_required
+@rate_limited('test_ml')
+async def test_ml():
+    """Test ML setup endpoint"""
+    try:
+        result = test_ml_setup()
+        
+        try:
+            await get_adb().users.find_one({}, {'_id': 1})
+            result['database_available'] = True
+        except Exception:
+            result['database_available'] = False
+        
+        return jsonify({
+            'status': 'success',
+            'message': 'ML setup test completed',
+            'data': result
+        }), 200
+    except Exception as e:
+        return jsonify({
+            'status': 'error',
+            'message': f'ML test failed: {str(e)}'
+        }), 500
+
+@upload_bp.route('/profile', methods=['POST'])
+@jwt_required
+@rate_limited('upload_profile', shed=True)
+async def upload_profile():
+    """Upload and process profile photo"""
+    try:
+        user_id = get_jwt_identity()
+        
+        filename, error = await receive_upload(user_id, 'profiles')
+        if error:
+            return error
+        logger.info(f"✅ Profile photo saved: {filename}")
+        
+        # Detection and embedding run on the ML executor once scheduled
+        try:
+            profile_target = (
+                (get_sync_db(), 'users', user_id)
+                if request_profiler.should_profile(request.headers.get(PROFILE_HEADER)) else None
+            )
+            ml_result = await run_blocking(
+                process_stored_photo, filename, INTERACTIVE_ENROLLMENT, user_id, process_profile_photo, user_id,
+                profile_target=profile_target
+            )
+        except SchedulerBusy:
+            await run_io(discard_upload, get_sync_db(), filename)
+            return busy_response()
+        
+        if ml_result is None:
+            # Release the stored photo if processing failed
+            await run_io(discard_upload, get_sync_db(), filename)
+            
+            return jsonify({
+                'status': 'error',
+                'message': 'No face detected in the uploaded image. Please upload a clear photo with a visible face.'
+            }), 400
+        
+        # Update user document with face embedding
+        try:
+            previous = await get_adb().users.find_one_and_update(
+                {'_id': ObjectId(user_id)},
+                {
+                    '$set': {
+                        'profile_photo': filename,
+                        'face_embedding': ml_result['embedding'],
+                        'face_embedding_version': ml_result['model_version'],
+                        'face_embeddings': ml_result['embeddings'],
+                        'face_confidence': ml_result['confidence']
+                    }
+                },
+                projection={'profile_photo': 1, 'username': 1}
+            )
+            invalidate_user(user_id)
+            if previous:
+                await run_io(
+                    record_enrollment, get_sync_db(), user_id, previous['username'], ml_result['embeddings']
+                )
+            # The replaced profile photo loses this user's reference
+            if previous and previous.get('profile_photo'):
+                await run_io(discard_upload, get_sync_db(), previous['profile_photo'])
+            logger.info(f"✅ User profile updated with embedding")
+            
+        except Exception as db_error:
+            logger.error(f"❌ Database update error: {db_error}")
+        
+        return jsonify({
+            'status': 'success',
+            'message': 'Profile photo uploaded and processed successfully',
+            'data': {
+                'filename': filename,
+                'faces_detected': ml_result['faces_detected'],
+                'confidence': round(ml_result['confidence'], 3),
+                'embedding_generated': True
+            }
+        }), 200
+        
+    except Exception as e:
+        logger.error(f"❌ Profile upload error: {e}")
+        return jsonify({
+            'status': 'error',
+            'message': f'Upload failed: {str(e)}'
+        }), 500
+
+@upload_bp.route('/group', methods=['POST'])
+@jwt_required
+@rate_limited('upload_group', shed=True)
+async def upload_group():
+    """Upload and process group photo"""
+    # Always set, so a client disconnect can cancel processing even without a time limit
+    deadline = Deadline.from_headers(
+        request.headers, get_active_config().GROUP_UPLOAD_DEADLINE_S
+    ) or Deadline(float('inf'))
+    try:
+        user_id = get_jwt_identity()
+        
+        filename, error = await receive_upload(user_id, 'groups')
+        if error:
+            return error
+        logger.info(f"✅ Group photo saved: {filename}")
+        
+        group_photo_doc = {
+            'filename': filename,
+            'uploaded_by': ObjectId(user_id),
+            'upload_date': datetime.utcnow(),
+            'processed': False,
+            'faces_detected': [],
+            'matches_count': 0,
+            'matched_users': []
+        }
+        
+        insert_result = await get_adb().group_photos.insert_one(group_photo_doc)
+        photo_id = insert_result.inserted_id
+        logger.info(f"✅ Group photo document created: {photo_id}")
+        
+        # The whole ML pipeline (including its own matching queries) runs on
+        # the ML executor with a synchronous client
+        try:
+            profile_target = (
+                (get_sync_db(), 'group_photos', photo_id)
+                if request_profiler.should_profile(request.headers.get(PROFILE_HEADER)) else None
+            )
+            ml_result = await run_blocking(
+                process_group_upload, filename, user_id, photo_id, get_sync_db(),
+                profile_target=profile_target, deadline=deadline
+            )
+        except asyncio.CancelledError:
+            # The client went away; the pipeline stops at its next stage and rolls back
+            deadline.cancel(CLIENT_DISCONNECTED)
+            raise
+        except SchedulerBusy:
+            await get_adb().group_photos.delete_one({'_id': photo_id})
+            await run_io(discard_upload, get_sync_db(), filename)
+            return busy_response()
+        except RequestCancelled as e:
+            return cancelled_response(e)
+        
+        return jsonify({
+            'status': 'success',
+            'message': 'Group photo uploaded and processed',
+            'data': {
+                'photo_id': str(photo_id),
+                'filename': filename,
+                'faces_detected': ml_result['faces_detected'],
+                'matches_found': ml_result['matches_found'],
+                'matched_users': ml_result['matched_users'],
+                'faces_skipped': (ml_result.get('quality') or {}).get('skipped', 0),
+                'processing_success': ml_result['processing_success'],
+                'error': ml_result['error']
+            }
+        }), 200
+        
+    except Exception as e:
+        logger.error(f"❌ Group upload error: {e}")
+        return jsonify({
+            'status': 'error',
+            'message': f'Upload failed: {str(e)}'
+        }), 500
+
+@upload_bp.route('/my-photos', methods=['GET'])
+@jwt_required
+@rate_limited('my_photos')
+async def get_my_photos():
+    """Get photos that contain the current user"""
+    try:
+        user_id = get_jwt_identity()
+        
+        try:
+            page, per_page = parse_pagination(request.args, current_app.config)
+        except ValueError:
+            return jsonify({
+                'status': 'error',
+                'message': 'page and per_page must be integers'
+            }), 400
+        
+        db = get_adb()
+        
+        # The match version changes only when a new match lands for this user
+        match_version = await get_match_version_async(db, user_id)
+        if match_version is None:
+            return jsonify({
+                'status': 'error',
+                'message': 'User not found'
+            }), 404
+        
+        etag = f"{user_id}-{match_version}-{page}-{per_page}"
+        if request.if_none_match.contains(etag):
+            response = current_app.response_class('', status=304)
+            response.set_etag(etag)
+            return response
+        
+        photos_data = my_photos_cache.get(user_id, match_version)
+        if photos_data is None:
+            query, projection = my_photos_query(user_id)
+            photos = await db.group_photos.find(query, projection).sort('upload_date', -1).to_list(None)
+            photos_data = [format_my_photo(photo) for photo in photos]
+            my_photos_cache.put(user_id, match_version, photos_data)
+        
+        data = paginate_photos(photos_data, page, per_page)
+        response = jsonify({
+            'status': 'success',
+            'message': f"Found {data['total_count']} photos containing you",
+            'data': data
+        })
+        response.set_etag(etag)
+        # Clients may keep the response but must revalidate it with If-None-Match
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response, 200
+        
+    except Exception as e:
+        logger.error(f"❌ Get photos error: {e}")
+        return jsonify({
+            'status': 'error',
+            'message': f'Failed to retrieve photos: {str(e)}'
+        }), 500
+
+@upload_bp.route('/stats', methods=['GET'])
+@jwt_required
+@rate_limited('stats')
+async def get_stats():
+    """Get upload and match statistics for the current user (precomputed counters)"""
+    try:
+        user_id = get_jwt_identity()
+        db = get_adb()
+        
+        user = await get_user_async(db, user_id)
+        if user is None:
+            return jsonify({
+                'status': 'error',
+                'message': 'User not found'
+            }), 404
+        
+        return jsonify({
+            'status': 'success',
+            'message': 'User statistics retrieved',
+            'data': build_user_stats(user, await db[STATS_COLLECTION].find_one({'_id': user_id}))
+        }), 200
+        
+    except Exception as e:
+        logger.error(f"❌ Get stats error: {e}")
+        return jsonify({
+            'status': 'error',
+            'message': f'Failed to retrieve statistics: {str(e)}'
+        }), 500
@@ -1,53 +1,67 @@
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, request, jsonify
 from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
-from pymongo import MongoClient
-from werkzeug.security import generate_password_hash, check_password_hash
-from bson import ObjectId
+from app.utils.db import get_db
+from app.utils.password_hashing import password_hasher, PasswordHashingBusy
+from app.utils.user_cache import get_user
+from app.utils.rate_limit import rate_limited
 import logging
 
 logger = logging.getLogger(__name__)
 
 auth_bp = Blueprint('auth', __name__)
 
-def get_db():
-    """Get database connection"""
-    try:
-        client = MongoClient(current_app.config['MONGO_URI'])
-        return client.get_default_database()
-    except Exception as e:
-        logger.error(f"Database connection error: {e}")
-        return None
+def busy_response():
+    """503 returned when the password hashing pool is saturated (shared with the ASGI views)"""
+    return {
+        'status': 'error',
+        'message': 'Too many login attempts in progress, please retry shortly'
+    }, 503, {'Retry-After': '1'}
+
+def validate_registration(data):
+    """Return an error message for invalid registration input, else None"""
+    # Validate required fields
+    if not data or not all(k in data for k in ('username', 'email', 'password')):
+        return 'Username, email, and password are required'
+    
+    # Basic validation
+    if len(data['username'].strip()) < 3:
+        return 'Username must be at least 3 characters long'
+    
+    if len(data['password']) < 6:
+        return 'Password must be at least 6 characters long'
+    
+    return None
+
+def new_user_document(username, email, password_hash):
+    """Build the users document for a new account"""
+    return {
+        'username': username,
+        'email': email,
+        'password_hash': password_hash,
+        'profile_photo': None,
+        'face_embedding': None,
+        'face_confidence': None
+    }
 
 @auth_bp.route('/register', methods=['POST'])
+@rate_limited('register')
 def register():
     """Register a new user"""
     try:
         data = request.get_json()
         
-        # Validate required fields
-        if not data or not all(k in data for k in ('username', 'email', 'password')):
+        # Validate input
+        error = validate_registration(data)
+        if error:
             return jsonify({
                 'status': 'error',
-                'message': 'Username, email, and password are required'
+                'message': error
             }), 400
         
         username = data['username'].strip()
         email = data['email'].strip().lower()
         password = data['password']
         
-        # Basic validation
-        if len(username) < 3:
-            return jsonify({
-                'status': 'error',
-                'message': 'Username must be at least 3 characters long'
-            }), 400
-        
-        if len(password) < 6:
-            return jsonify({
-                'status': 'error',
-                'message': 'Password must be at least 6 characters long'
-            }), 400
-        
         # Get database connection
         db = get_db()
         if db is None:
@@ -64,14 +78,7 @@ def register():
             }), 400
         
         # Create new user
-        user_data = {
-            'username': username,
-            'email': email,
-            'password_hash': generate_password_hash(password),
-            'profile_photo': None,
-            'face_embedding': None,
-            'face_confidence': None
-        }
+        user_data = new_user_document(username, email, password_hasher.hash_password(password))
         
         result = db.users.insert_one(user_data)
         user_id = str(result.inserted_id)
@@ -90,6 +97,8 @@ def register():
             }
         }), 201
         
+    except PasswordHashingBusy:
+        return busy_response()
     except Exception as e:
         logger.error(f"Registration error: {e}")
         return jsonify({
@@ -98,6 +107,7 @@ def register():
         }), 500
 
 @auth_bp.route('/login', methods=['POST'])
+@rate_limited('login')
 def login():
     """Login user"""
     try:
@@ -124,7 +134,7 @@ def login():
         # Find user
         user = db.users.find_one({'username': username})
         
-        if not user or not check_password_hash(user['password_hash'], password):
+        if not user or not password_hasher.verify_password(user['password_hash'], password):
             return jsonify({
                 'status': 'error',
                 'message': 'Invalid username or password'
@@ -146,6 +156,8 @@ def login():
             }
         }), 200
         
+    except PasswordHashingBusy:
+        return busy_response()
     except Exception as e:
         logger.error(f"Login error: {e}")
         return jsonify({
@@ -155,6 +167,7 @@ def login():
 
 @auth_bp.route('/profile', methods=['GET'])
 @jwt_required()
+@rate_limited('profile')
 def get_profile():
     """Get current user profile"""
     try:
@@ -168,8 +181,8 @@ def get_profile():
                 'message': 'Database connection failed'
             }), 500
         
-        # Find user
-        user = db.users.find_one({'_id': ObjectId(user_id)})
+        # Find user (cached by id)
+        user = get_user(db, user_id)
         
         if not user:
             return jsonify({
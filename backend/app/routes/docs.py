@@ -1,10 +1,13 @@
 from flask import Blueprint, jsonify
+from config import get_active_config
 
 docs_bp = Blueprint('docs', __name__)
 
 @docs_bp.route('/', methods=['GET'])
 def api_documentation():
     """API Documentation endpoint"""
+    # The limits enforced by app.utils.rate_limit
+    limits = get_active_config().RATE_LIMITS
     docs = {
         "title": "Facial Recognition API",
         "version": "1.0.0",
@@ -20,7 +23,7 @@ def api_documentation():
                         "email": "string (valid email, required)",
                         "password": "string (6-128 chars, required)"
                     },
-                    "rate_limit": "5 per minute",
+                    "rate_limit": limits['register'],
                     "response": "Returns user data and access token"
                 },
                 "POST /api/auth/login": {
@@ -29,13 +32,13 @@ def api_documentation():
                         "username": "string (required)",
                         "password": "string (required)"
                     },
-                    "rate_limit": "10 per minute",
+                    "rate_limit": limits['login'],
                     "response": "Returns user data and access token"
                 },
                 "GET /api/auth/profile": {
                     "description": "Get current user profile information",
                     "auth": "JWT Bearer Token required",
-                    "rate_limit": "100 per hour",
+                    "rate_limit": limits['profile'],
                     "response": "Returns user profile data"
                 }
             },
@@ -45,7 +48,7 @@ def api_documentation():
                     "auth": "JWT Bearer Token required",
                     "body": "multipart/form-data with 'file' field",
                     "file_limits": "Max 5MB, formats: jpg, jpeg, png, gif, bmp",
-                    "rate_limit": "20 per hour",
+                    "rate_limit": limits['upload_profile'],
                     "response": "Face detection results and embedding generation status"
                 },
                 "POST /api/upload/group": {
@@ -53,26 +56,26 @@ def api_documentation():
                     "auth": "JWT Bearer Token required", 
                     "body": "multipart/form-data with 'file' field",
                     "file_limits": "Max 10MB, formats: jpg, jpeg, png, gif, bmp",
-                    "rate_limit": "50 per hour",
+                    "rate_limit": limits['upload_group'],
                     "response": "Face detection and matching results"
                 },
                 "GET /api/upload/my-photos": {
                     "description": "Get all group photos containing current user",
                     "auth": "JWT Bearer Token required",
-                    "rate_limit": "100 per hour",
+                    "rate_limit": limits['my_photos'],
                     "response": "List of photos with similarity scores"
                 },
                 "GET /api/upload/test-ml": {
                     "description": "Test ML components and database connectivity",
                     "auth": "JWT Bearer Token required",
-                    "rate_limit": "10 per minute",
+                    "rate_limit": limits['test_ml'],
                     "response": "Status of ML models and database connection"
                 },
                 "GET /api/upload/stats": {
-                    "description": "Get upload statistics for current user",
+                    "description": "Get upload and match statistics for current user (precomputed, one lookup)",
                     "auth": "JWT Bearer Token required",
-                    "rate_limit": "50 per hour",
-                    "response": "User statistics and activity data"
+                    "rate_limit": limits['stats'],
+                    "response": "Photos uploaded/matched, faces detected, face appearances, best similarity and last match time"
                 }
             },
             "documentation": {
@@ -93,13 +96,13 @@ def api_documentation():
         },
         "error_handling": {
             "validation": "Input validation with detailed error messages",
-            "rate_limiting": "Per-endpoint rate limits to prevent abuse",
+            "rate_limiting": "Per-endpoint token-bucket limits (429 + Retry-After); uploads get 503 + Retry-After while ML processing is overloaded",
             "file_validation": "File type and size validation",
             "ml_fallbacks": "Graceful handling of ML component failures"
         },
         "security_features": {
             "jwt_authentication": "Secure token-based authentication",
-            "rate_limiting": "Per-IP and per-endpoint rate limits", 
+            "rate_limiting": "Per-user and per-IP token-bucket rate limits", 
             "input_validation": "Marshmallow schema validation",
             "file_security": "File type and size validation",
             "environment_variables": "Secure configuration management"
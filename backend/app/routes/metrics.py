@@ -0,0 +1,113 @@
+from flask import Blueprint, request, jsonify, Response
+from flask_jwt_extended import jwt_required
+from bson import ObjectId
+from bson.errors import InvalidId
+from app.utils.metrics import collect_metrics
+from app.utils.db import get_db
+from app.utils.profiling import request_profiler, PROFILE_HEADER, PROFILES_COLLECTION, profile_summary
+import logging
+
+logger = logging.getLogger(__name__)
+
+metrics_bp = Blueprint('metrics', __name__)
+
+@metrics_bp.route('/', methods=['GET'])
+@jwt_required()
+def get_metrics():
+    """Get runtime metrics of the ML pipeline and caches"""
+    try:
+        names = request.args.get('only')
+        names = set(names.split(',')) if names else None
+        
+        return jsonify({
+            'status': 'success',
+            'message': 'Metrics collected',
+            'data': collect_metrics(names)
+        }), 200
+        
+    except Exception as e:
+        logger.error(f"❌ Metrics error: {e}")
+        return jsonify({
+            'status': 'error',
+            'message': f'Failed to collect metrics: {str(e)}'
+        }), 500
+
+def profiling_forbidden():
+    """403 unless the request carries the profiling token"""
+    if request_profiler.authorized(request.headers.get(PROFILE_HEADER)):
+        return None
+    return jsonify({
+        'status': 'error',
+        'message': 'Profiling requires a valid X-Profile-Token header'
+    }), 403
+
+@metrics_bp.route('/profiling', methods=['GET', 'POST'])
+@jwt_required()
+def profiling_settings():
+    """Show or change request profiling (sample rate, next N requests, mode)"""
+    forbidden = profiling_forbidden()
+    if forbidden:
+        return forbidden
+    try:
+        if request.method == 'POST':
+            data = request.get_json(silent=True) or {}
+            request_profiler.configure(
+                sample_rate=data.get('sample_rate'),
+                next_requests=data.get('next_requests'),
+                mode=data.get('mode')
+            )
+        return jsonify({
+            'status': 'success',
+            'message': 'Profiling settings',
+            'data': request_profiler.settings()
+        }), 200
+        
+    except ValueError as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 400
+
+@metrics_bp.route('/profiles', methods=['GET'])
+@jwt_required()
+def list_profiles():
+    """Recent stored profiles, optionally for one photo or user (?target_id=)"""
+    forbidden = profiling_forbidden()
+    if forbidden:
+        return forbidden
+    query = {}
+    if request.args.get('target_id'):
+        query['target_id'] = request.args['target_id']
+    limit = min(request.args.get('limit', 20, type=int), 100)
+    profiles = get_db()[PROFILES_COLLECTION].find(query, {'collapsed': 0, 'top_functions': 0}) \
+        .sort('created_at', -1).limit(limit)
+    return jsonify({
+        'status': 'success',
+        'message': 'Profiles retrieved',
+        'data': [profile_summary(doc) for doc in profiles]
+    }), 200
+
+@metrics_bp.route('/profiles/<profile_id>', methods=['GET'])
+@jwt_required()
+def get_profile(profile_id):
+    """One profile; ?format=collapsed returns flamegraph-ready collapsed stacks as text"""
+    forbidden = profiling_forbidden()
+    if forbidden:
+        return forbidden
+    try:
+        doc = get_db()[PROFILES_COLLECTION].find_one({'_id': ObjectId(profile_id)})
+    except InvalidId:
+        doc = None
+    if doc is None:
+        return jsonify({
+            'status': 'error',
+            'message': 'Profile not found'
+        }), 404
+    
+    if request.args.get('format') == 'collapsed':
+        return Response(doc['collapsed'] + '\n', mimetype='text/plain')
+    return jsonify({
+        'status': 'success',
+        'message': 'Profile retrieved',
+        'data': dict(profile_summary(doc), collapsed=doc['collapsed'], top_functions=doc.get('top_functions'))
+    }), 200
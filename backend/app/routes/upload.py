@@ -1,11 +1,24 @@
 import os
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, request, jsonify, current_app, make_response
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from werkzeug.utils import secure_filename
 import uuid
-from pymongo import MongoClient
 from bson import ObjectId
-from app.utils.ml_processor import process_profile_photo, process_group_photo, test_ml_setup
+from app.utils.ml_processor import (
+    process_profile_photo, process_group_photo, test_ml_setup, record_enrollment, run_scheduled
+)
+from app.utils.ml_scheduler import INTERACTIVE_ENROLLMENT, INTERACTIVE_GROUP, SchedulerBusy
+from app.utils.cache import VersionedLRUCache
+from app.utils.db import get_db
+from app.utils.storage import photo_store
+from app.utils.user_cache import get_user, invalidate_user
+from app.utils.match_versions import get_match_version
+from app.utils.user_stats import STATS_COLLECTION, format_user_stats
+from app.utils.metrics import register_metrics_provider
+from app.utils.profiling import request_profiler, PROFILE_HEADER
+from app.utils.rate_limit import rate_limited
+from app.utils.deadlines import Deadline, RequestCancelled, DEADLINE_EXCEEDED, cancellation_stats
+from config import get_active_config
 from datetime import datetime
 import logging
 
@@ -13,29 +26,83 @@ logger = logging.getLogger(__name__)
 
 upload_bp = Blueprint('upload', __name__)
 
+# Per-user /my-photos results, valid for one match version
+my_photos_cache = VersionedLRUCache(maxsize=get_active_config().MY_PHOTOS_CACHE_SIZE)
+register_metrics_provider('my_photos_cache', my_photos_cache.stats)
+
 def allowed_file(filename):
     """Check if file extension is allowed"""
     ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'bmp'}
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def get_db():
-    """Get database connection with better error handling"""
+# Error responses are (body, status, headers) so the ASGI views can share them
+
+def busy_response():
+    """503 returned when an ML job waited too long for a scheduler slot"""
+    return {
+        'status': 'error',
+        'message': 'Photo processing is at capacity, please retry shortly'
+    }, 503, {'Retry-After': '5'}
+
+def cancelled_response(cancelled):
+    """503 returned when an upload was cancelled by its deadline before it was processed"""
+    return {
+        'status': 'error',
+        'message': 'Photo processing did not finish in time, please retry'
+        if cancelled.reason == DEADLINE_EXCEEDED else 'Photo processing was cancelled, please retry'
+    }, 503, {'Retry-After': '5'}
+
+def discard_upload(db, key):
+    """Drop the reference to a stored upload that will not be kept"""
     try:
-        mongo_uri = current_app.config.get('MONGO_URI')
-        if not mongo_uri:
-            logger.error("MONGO_URI not found in app config")
-            return None
-            
-        client = MongoClient(mongo_uri)
-        # Test connection
-        client.server_info()
-        return client.get_default_database()
+        photo_store.release(db, key)
     except Exception as e:
-        logger.error(f"Database connection error: {e}")
-        return None
+        logger.error(f"❌ Could not release photo {key}: {e}")
+
+def process_stored_photo(key, job_class, user_id, process, *args, profile_target=None, deadline=None):
+    """Run an ML job on a stored photo once the scheduler grants it a slot
+    
+    With profile_target (db, collection, document id) the whole job, queueing
+    included, is profiled and the profile stored for that document, also
+    when the job fails or is turned away (with the exception type). A
+    deadline is handed to the job (see run_scheduled).
+    """
+    if profile_target is None:
+        with photo_store.local_path(key) as filepath:
+            return run_scheduled(job_class, user_id, process, filepath, *args, deadline=deadline)
+    
+    profile = None
+    try:
+        with request_profiler.capture() as profile:
+            with photo_store.local_path(key) as filepath:
+                return run_scheduled(job_class, user_id, process, filepath, *args, deadline=deadline)
+    finally:
+        # Slow and failed requests are the ones most worth a profile
+        if profile is not None:
+            request_profiler.save(*profile_target, profile)
+
+def process_group_upload(key, user_id, photo_id, db, profile_target=None, deadline=None):
+    """Run the ML pipeline on an uploaded group photo, rolling it back if cancelled
+    
+    A cancelled upload leaves nothing behind (document deleted, stored photo
+    released), the same state as a 503 before processing, so the client can
+    simply upload it again. Runs on the processing thread, so the rollback
+    also happens when the request that started it is gone.
+    """
+    try:
+        return process_stored_photo(
+            key, INTERACTIVE_GROUP, user_id, process_group_photo, photo_id, db,
+            profile_target=profile_target, deadline=deadline
+        )
+    except RequestCancelled as e:
+        db.group_photos.delete_one({'_id': photo_id})
+        discard_upload(db, key)
+        cancellation_stats.record_cancelled(e)
+        raise
 
 @upload_bp.route('/test-ml', methods=['GET'])
 @jwt_required()
+@rate_limited('test_ml')
 def test_ml():
     """Test ML setup endpoint"""
     try:
@@ -60,6 +127,7 @@ def test_ml():
 
 @upload_bp.route('/profile', methods=['POST'])
 @jwt_required()
+@rate_limited('upload_profile', shed=True)
 def upload_profile():
     """Upload and process profile photo"""
     try:
@@ -100,28 +168,34 @@ def upload_profile():
                 'message': 'Database connection failed'
             }), 500
         
-        # Generate unique filename
-        file_extension = file.filename.rsplit('.', 1)[1].lower()
-        filename = f"{user_id}_{uuid.uuid4().hex}.{file_extension}"
-        
-        # Ensure upload directory exists
-        upload_dir = os.path.join(current_app.config['UPLOAD_FOLDER'], 'profiles')
-        os.makedirs(upload_dir, exist_ok=True)
+        # Make sure the account behind the token still exists (cached by id)
+        if get_user(db, user_id) is None:
+            return jsonify({
+                'status': 'error',
+                'message': 'User not found'
+            }), 404
         
-        # Save file
-        filepath = os.path.join(upload_dir, filename)
-        file.save(filepath)
-        logger.info(f"✅ Profile photo saved: {filepath}")
+        # Store under its content hash (identical photos are kept once)
+        file_extension = file.filename.rsplit('.', 1)[1].lower()
+        filename = photo_store.save(db, file.read(), file_extension, 'profiles')
+        logger.info(f"✅ Profile photo saved: {filename}")
         
-        # Process the image with ML
-        ml_result = process_profile_photo(filepath, user_id)
+        # Process the image with ML (enrollment is the most urgent job class)
+        try:
+            profile_target = (
+                (db, 'users', user_id) if request_profiler.should_profile(request.headers.get(PROFILE_HEADER)) else None
+            )
+            ml_result = process_stored_photo(
+                filename, INTERACTIVE_ENROLLMENT, user_id, process_profile_photo, user_id,
+                profile_target=profile_target
+            )
+        except SchedulerBusy:
+            discard_upload(db, filename)
+            return busy_response()
         
         if ml_result is None:
-            # Remove the saved file if processing failed
-            try:
-                os.remove(filepath)
-            except:
-                pass
+            # Release the stored photo if processing failed
+            discard_upload(db, filename)
             
             return jsonify({
                 'status': 'error',
@@ -130,16 +204,25 @@ def upload_profile():
         
         # Update user document with face embedding
         try:
-            db.users.update_one(
+            previous = db.users.find_one_and_update(
                 {'_id': ObjectId(user_id)},
                 {
                     '$set': {
                         'profile_photo': filename,
                         'face_embedding': ml_result['embedding'],
+                        'face_embedding_version': ml_result['model_version'],
+                        'face_embeddings': ml_result['embeddings'],
                         'face_confidence': ml_result['confidence']
                     }
-                }
+                },
+                projection={'profile_photo': 1, 'username': 1}
             )
+            invalidate_user(user_id)
+            if previous:
+                record_enrollment(db, user_id, previous['username'], ml_result['embeddings'])
+            # The replaced profile photo loses this user's reference
+            if previous and previous.get('profile_photo'):
+                discard_upload(db, previous['profile_photo'])
             logger.info(f"✅ User profile updated with embedding")
             
         except Exception as db_error:
@@ -166,8 +249,11 @@ def upload_profile():
 
 @upload_bp.route('/group', methods=['POST'])
 @jwt_required()
+@rate_limited('upload_group', shed=True)
 def upload_group():
     """Upload and process group photo"""
+    # Time the client or gateway will wait; processing stops once it has passed
+    deadline = Deadline.from_headers(request.headers, get_active_config().GROUP_UPLOAD_DEADLINE_S)
     try:
         # Get current user
         user_id = get_jwt_identity()
@@ -206,18 +292,17 @@ def upload_group():
                 'message': 'Database connection failed'
             }), 500
         
-        # Generate unique filename
-        file_extension = file.filename.rsplit('.', 1)[1].lower()
-        filename = f"group_{uuid.uuid4().hex}.{file_extension}"
-        
-        # Ensure upload directory exists
-        upload_dir = os.path.join(current_app.config['UPLOAD_FOLDER'], 'groups')
-        os.makedirs(upload_dir, exist_ok=True)
+        # Make sure the account behind the token still exists (cached by id)
+        if get_user(db, user_id) is None:
+            return jsonify({
+                'status': 'error',
+                'message': 'User not found'
+            }), 404
         
-        # Save file
-        filepath = os.path.join(upload_dir, filename)
-        file.save(filepath)
-        logger.info(f"✅ Group photo saved: {filepath}")
+        # Store under its content hash (identical photos are kept once)
+        file_extension = file.filename.rsplit('.', 1)[1].lower()
+        filename = photo_store.save(db, file.read(), file_extension, 'groups')
+        logger.info(f"✅ Group photo saved: {filename}")
         
         # Create group photo document in database
         group_photo_doc = {
@@ -235,7 +320,20 @@ def upload_group():
         logger.info(f"✅ Group photo document created: {photo_id}")
         
         # Process the image with ML
-        ml_result = process_group_photo(filepath, photo_id, db)
+        try:
+            profile_target = (
+                (db, 'group_photos', photo_id) if request_profiler.should_profile(request.headers.get(PROFILE_HEADER))
+                else None
+            )
+            ml_result = process_group_upload(
+                filename, user_id, photo_id, db, profile_target=profile_target, deadline=deadline
+            )
+        except SchedulerBusy:
+            db.group_photos.delete_one({'_id': photo_id})
+            discard_upload(db, filename)
+            return busy_response()
+        except RequestCancelled as e:
+            return cancelled_response(e)
         
         return jsonify({
             'status': 'success',
@@ -246,6 +344,7 @@ def upload_group():
                 'faces_detected': ml_result['faces_detected'],
                 'matches_found': ml_result['matches_found'],
                 'matched_users': ml_result['matched_users'],
+                'faces_skipped': (ml_result.get('quality') or {}).get('skipped', 0),
                 'processing_success': ml_result['processing_success'],
                 'error': ml_result['error']
             }
@@ -258,13 +357,76 @@ def upload_group():
             'message': f'Upload failed: {str(e)}'
         }), 500
 
+def my_photos_query(user_id):
+    """Filter and projection for the photos a user was matched in"""
+    # $elemMatch projection returns only this user's matched_users entry, and
+    # face_index alone is enough to count faces without pulling embeddings
+    return (
+        {'matched_users.user_id': user_id, 'processed': True},
+        {
+            'filename': 1,
+            'upload_date': 1,
+            'matches_count': 1,
+            'faces_detected.face_index': 1,
+            'matched_users': {'$elemMatch': {'user_id': user_id}}
+        }
+    )
+
+def format_my_photo(photo):
+    """Format one matched photo for the /my-photos response"""
+    user_match = (photo.get('matched_users') or [None])[0]
+    return {
+        'photo_id': str(photo['_id']),
+        'filename': photo['filename'],
+        'upload_date': photo.get('upload_date'),
+        'faces_detected': len(photo.get('faces_detected', [])),
+        'matches_found': photo.get('matches_count', 0),
+        'similarity_score': user_match['similarity'] if user_match else None
+    }
+
+def load_my_photos(db, user_id):
+    """Build the full, newest-first list of photos a user was matched in"""
+    query, projection = my_photos_query(user_id)
+    return [
+        format_my_photo(photo)
+        for photo in db.group_photos.find(query, projection).sort('upload_date', -1)
+    ]
+
+def parse_pagination(args, config):
+    """Read page/per_page query parameters; raises ValueError when invalid"""
+    page = max(1, int(args.get('page', 1)))
+    per_page = int(args.get('per_page', config['MY_PHOTOS_DEFAULT_PER_PAGE']))
+    return page, min(max(1, per_page), config['MY_PHOTOS_MAX_PER_PAGE'])
+
+def paginate_photos(photos_data, page, per_page):
+    """Slice a cached photo list into the /my-photos response payload"""
+    total_count = len(photos_data)
+    start = (page - 1) * per_page
+    return {
+        'photos': photos_data[start:start + per_page],
+        'total_count': total_count,
+        'page': page,
+        'per_page': per_page,
+        'total_pages': (total_count + per_page - 1) // per_page
+    }
+
 @upload_bp.route('/my-photos', methods=['GET'])
 @jwt_required()
+@rate_limited('my_photos')
 def get_my_photos():
     """Get photos that contain the current user"""
     try:
         user_id = get_jwt_identity()
         
+        # Pagination parameters
+        try:
+            page, per_page = parse_pagination(request.args, current_app.config)
+        except ValueError:
+            return jsonify({
+                'status': 'error',
+                'message': 'page and per_page must be integers'
+            }), 400
+        
         # Get database connection
         db = get_db()
         if db is None:
@@ -273,40 +435,84 @@ def get_my_photos():
                 'message': 'Database connection failed'
             }), 500
         
-        # Find group photos where user appears
-        matched_photos = list(db.group_photos.find({
-            'matched_users.user_id': user_id,
-            'processed': True
-        }))
-        
-        # Format response
-        photos_data = []
-        for photo in matched_photos:
-            # Find user's similarity score in this photo
-            user_match = next((match for match in photo.get('matched_users', []) 
-                             if match['user_id'] == user_id), None)
-            
-            photos_data.append({
-                'photo_id': str(photo['_id']),
-                'filename': photo['filename'],
-                'upload_date': photo.get('upload_date'),
-                'faces_detected': len(photo.get('faces_detected', [])),
-                'matches_found': photo.get('matches_count', 0),
-                'similarity_score': user_match['similarity'] if user_match else None
-            })
+        # The match version changes only when a new match lands for this user
+        match_version = get_match_version(db, user_id)
+        if match_version is None:
+            return jsonify({
+                'status': 'error',
+                'message': 'User not found'
+            }), 404
+        
+        etag = f"{user_id}-{match_version}-{page}-{per_page}"
+        if request.if_none_match.contains(etag):
+            response = make_response('', 304)
+            response.set_etag(etag)
+            return response
+        
+        photos_data = my_photos_cache.get(user_id, match_version)
+        if photos_data is None:
+            photos_data = load_my_photos(db, user_id)
+            my_photos_cache.put(user_id, match_version, photos_data)
+        
+        data = paginate_photos(photos_data, page, per_page)
+        response = jsonify({
+            'status': 'success',
+            'message': f"Found {data['total_count']} photos containing you",
+            'data': data
+        })
+        response.set_etag(etag)
+        # Clients may keep the response but must revalidate it with If-None-Match
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response, 200
+        
+    except Exception as e:
+        logger.error(f"❌ Get photos error: {e}")
+        return jsonify({
+            'status': 'error',
+            'message': f'Failed to retrieve photos: {str(e)}'
+        }), 500
+
+def build_user_stats(user, stats):
+    """The /stats payload from the cached user record and its stats document"""
+    data = format_user_stats(stats or {})
+    data['has_profile_photo'] = bool(user.get('profile_photo'))
+    # Names documented in API_ENDPOINTS.md
+    data['photos_appeared_in'] = data['photos_matched']
+    data['total_face_appearances'] = data['face_appearances']
+    data['total_accessible_photos'] = data['photos_uploaded'] + data['photos_matched']
+    return data
+
+@upload_bp.route('/stats', methods=['GET'])
+@jwt_required()
+@rate_limited('stats')
+def get_stats():
+    """Get upload and match statistics for the current user (precomputed counters)"""
+    try:
+        user_id = get_jwt_identity()
+        
+        db = get_db()
+        if db is None:
+            return jsonify({
+                'status': 'error',
+                'message': 'Database connection failed'
+            }), 500
+        
+        user = get_user(db, user_id)
+        if user is None:
+            return jsonify({
+                'status': 'error',
+                'message': 'User not found'
+            }), 404
         
         return jsonify({
             'status': 'success',
-            'message': f'Found {len(photos_data)} photos containing you',
-            'data': {
-                'photos': photos_data,
-                'total_count': len(photos_data)
-            }
+            'message': 'User statistics retrieved',
+            'data': build_user_stats(user, db[STATS_COLLECTION].find_one({'_id': user_id}))
         }), 200
         
     except Exception as e:
-        logger.error(f"❌ Get photos error: {e}")
+        logger.error(f"❌ Get stats error: {e}")
         return jsonify({
             'status': 'error',
-            'message': f'Failed to retrieve photos: {str(e)}'
+            'message': f'Failed to retrieve statistics: {str(e)}'
         }), 500
@@ -0,0 +1,107 @@
+import asyncio
+import threading
+import logging
+from app.utils.db import get_client, is_standin_uri
+
+logger = logging.getLogger(__name__)
+
+# One motor client per (URI, event loop); motor clients are bound to a loop
+_clients = {}
+_clients_lock = threading.Lock()
+
+class AsyncCursor:
+    """Awaitable cursor over the synchronous stand-in"""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def sort(self, *args, **kwargs):
+        self._cursor = self._cursor.sort(*args, **kwargs)
+        return self
+
+    def skip(self, count):
+        self._cursor = self._cursor.skip(count)
+        return self
+
+    def limit(self, count):
+        self._cursor = self._cursor.limit(count)
+        return self
+
+    async def to_list(self, length=None):
+        documents = []
+        for document in self._cursor:
+            documents.append(document)
+            if length is not None and len(documents) >= length:
+                break
+        return documents
+
+class AsyncCollection:
+    """Motor-compatible subset of a collection over the in-process stand-in
+
+    The stand-in works purely in memory, so operations run inline on the
+    event loop; it exists so the async serving mode can be exercised in
+    tests and load runs without a MongoDB server.
+    """
+
+    def __init__(self, collection):
+        self._collection = collection
+
+    def find(self, *args, **kwargs):
+        return AsyncCursor(self._collection.find(*args, **kwargs))
+
+    async def find_one(self, *args, **kwargs):
+        return self._collection.find_one(*args, **kwargs)
+
+    async def insert_one(self, *args, **kwargs):
+        return self._collection.insert_one(*args, **kwargs)
+
+    async def update_one(self, *args, **kwargs):
+        return self._collection.update_one(*args, **kwargs)
+
+    async def update_many(self, *args, **kwargs):
+        return self._collection.update_many(*args, **kwargs)
+
+    async def find_one_and_update(self, *args, **kwargs):
+        return self._collection.find_one_and_update(*args, **kwargs)
+
+    async def delete_one(self, *args, **kwargs):
+        return self._collection.delete_one(*args, **kwargs)
+
+    async def count_documents(self, *args, **kwargs):
+        return self._collection.count_documents(*args, **kwargs)
+
+class AsyncDatabase:
+    """Motor-compatible database over the in-process stand-in"""
+
+    def __init__(self, database):
+        self._database = database
+        self.name = database.name
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return AsyncCollection(self._database[name])
+
+    def __getitem__(self, name):
+        return AsyncCollection(self._database[name])
+
+def get_async_db(mongo_uri):
+    """Get an async database handle for the running event loop
+
+    Real URIs use motor. Stand-in URIs wrap the same in-process client the
+    synchronous code uses, so work offloaded to executors sees the same data.
+    """
+    if is_standin_uri(mongo_uri):
+        return AsyncDatabase(get_client(mongo_uri).get_default_database())
+
+    loop = asyncio.get_running_loop()
+    key = (mongo_uri, id(loop))
+    client = _clients.get(key)
+    if client is None:
+        from motor.motor_asyncio import AsyncIOMotorClient
+        with _clients_lock:
+            client = _clients.get(key)
+            if client is None:
+                client = AsyncIOMotorClient(mongo_uri, io_loop=loop)
+                _clients[key] = client
+    return client.get_default_database()
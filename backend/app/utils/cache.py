@@ -0,0 +1,132 @@
+import time
+import threading
+from collections import OrderedDict
+
+
+class VersionedLRUCache:
+    """LRU cache holding one value per key, tagged with a version
+
+    A lookup only hits when the caller's current version matches the stored
+    one, so bumping the version (e.g. a user's match_version in Mongo)
+    invalidates the entry everywhere without any cross-process messaging.
+    """
+
+    def __init__(self, maxsize=10000):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, version):
+        """Return the cached value for key at version, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, version, value):
+        """Store value for key at version, replacing any older version"""
+        with self._lock:
+            current = self._entries.get(key)
+            # Never let a slow request overwrite a newer result
+            if current is not None and current[0] > version:
+                return
+            self._entries[key] = (version, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        """Drop the cached value for key"""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def stats(self):
+        """Size and hit/miss counters"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+
+class TTLLRUCache:
+    """Thread-safe LRU cache whose entries also expire after ttl seconds"""
+
+    def __init__(self, maxsize=10000, ttl=60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        # Recent invalidation times, so a load that raced an update is not cached
+        self._invalidated_at = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        """Return the cached value for key, or None if missing or expired"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def get_or_load(self, key, loader):
+        """Return the cached value, or call loader() and cache a non-None result"""
+        value = self.get(key)
+        if value is None:
+            loaded_at = time.monotonic()
+            value = loader()
+            if value is not None:
+                self.put(key, value, loaded_at)
+        return value
+
+    def put(self, key, value, loaded_at=None):
+        """Store value for key for the next ttl seconds"""
+        with self._lock:
+            if loaded_at is not None and self._invalidated_at.get(key, float('-inf')) >= loaded_at:
+                return
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        """Drop the cached value for key"""
+        with self._lock:
+            if self._entries.pop(key, None) is not None:
+                self.invalidations += 1
+            self._invalidated_at[key] = time.monotonic()
+            self._invalidated_at.move_to_end(key)
+            while len(self._invalidated_at) > self.maxsize:
+                self._invalidated_at.popitem(last=False)
+
+    def stats(self):
+        """Size and hit/miss counters"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0
+            }
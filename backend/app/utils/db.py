@@ -0,0 +1,49 @@
+import threading
+import logging
+from flask import current_app
+from pymongo import MongoClient
+
+logger = logging.getLogger(__name__)
+
+# URIs with this scheme are served by an in-process mongomock stand-in
+# (e.g. mongomock://localhost/facial_recognition) for tests and load runs
+STANDIN_SCHEME = 'mongomock://'
+
+# One pooled, thread-safe client per URI for the whole process
+_clients = {}
+_clients_lock = threading.Lock()
+
+def is_standin_uri(mongo_uri):
+    """Check whether a URI selects the in-process Mongo stand-in"""
+    return mongo_uri.startswith(STANDIN_SCHEME)
+
+def create_client(mongo_uri):
+    """Create a MongoClient, or a mongomock client for stand-in URIs"""
+    if is_standin_uri(mongo_uri):
+        import mongomock
+        return mongomock.MongoClient('mongodb://' + mongo_uri[len(STANDIN_SCHEME):])
+    return MongoClient(mongo_uri)
+
+def get_client(mongo_uri):
+    """Get the shared MongoClient for a URI, creating it on first use"""
+    client = _clients.get(mongo_uri)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(mongo_uri)
+            if client is None:
+                client = create_client(mongo_uri)
+                _clients[mongo_uri] = client
+    return client
+
+def get_db():
+    """Get database connection from the shared client"""
+    try:
+        mongo_uri = current_app.config.get('MONGO_URI')
+        if not mongo_uri:
+            logger.error("MONGO_URI not found in app config")
+            return None
+        
+        return get_client(mongo_uri).get_default_database()
+    except Exception as e:
+        logger.error(f"Database connection error: {e}")
+        return None
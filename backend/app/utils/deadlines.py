@@ -0,0 +1,127 @@
+import time
+import logging
+import threading
+from app.utils.metrics import register_metrics_provider
+
+logger = logging.getLogger(__name__)
+
+# Request header with the time the caller (or gateway) will still wait, in ms
+DEADLINE_HEADER = 'X-Request-Timeout-Ms'
+
+# Pipeline stages a job can be cancelled at, in order
+STAGES = ('queued', 'decode', 'detect', 'embed', 'match', 'store')
+
+DEADLINE_EXCEEDED = 'deadline_exceeded'
+CLIENT_DISCONNECTED = 'client_disconnected'
+
+
+class RequestCancelled(Exception):
+    """Raised at a stage boundary once a request's deadline has passed or it was cancelled
+
+    cpu_seconds is the CPU the job had used by then (filled in by the job).
+    """
+
+    def __init__(self, stage, reason):
+        super().__init__(f"Request cancelled before {stage}: {reason}")
+        self.stage = stage
+        self.reason = reason
+        self.cpu_seconds = 0.0
+
+
+class Deadline:
+    """Time budget of one request, checked cooperatively by the ML pipeline
+
+    Stages call check(stage) between units of work; nothing is interrupted
+    mid-inference. cancel() marks the request abandoned (e.g. the client
+    disconnected) and is safe to call from another thread.
+    """
+
+    def __init__(self, timeout_s):
+        self.started_at = time.monotonic()
+        self.expires_at = self.started_at + timeout_s
+        self._reason = None
+
+    @classmethod
+    def from_headers(cls, headers, default_s):
+        """The request's deadline: default_s, shortened by DEADLINE_HEADER; None if neither is set"""
+        timeout_s = default_s or None
+        try:
+            requested = float(headers.get(DEADLINE_HEADER)) / 1000
+        except (TypeError, ValueError):
+            requested = None
+        if requested is not None and requested > 0:
+            timeout_s = min(timeout_s, requested) if timeout_s else requested
+        return cls(timeout_s) if timeout_s else None
+
+    def remaining(self):
+        return self.expires_at - time.monotonic()
+
+    def cancel(self, reason=CLIENT_DISCONNECTED):
+        self._reason = reason
+
+    def reason(self):
+        """Why the request should stop, or None"""
+        if self._reason is not None:
+            return self._reason
+        if time.monotonic() >= self.expires_at:
+            return DEADLINE_EXCEEDED
+        return None
+
+    def check(self, stage):
+        reason = self.reason()
+        if reason is not None:
+            raise RequestCancelled(stage, reason)
+
+
+class CancellationStats:
+    """Completed and cancelled ML jobs, and the CPU time cancellation saved
+
+    The saving of a cancelled job is estimated as the mean CPU time of a
+    completed job minus what the cancelled one had used; CPU time is that
+    of the request thread (inference in batcher or BLAS threads is not
+    included), so the estimate is conservative.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._completed = 0
+        self._completed_cpu = 0.0
+        self._by_stage = {stage: 0 for stage in STAGES}
+        self._by_reason = {DEADLINE_EXCEEDED: 0, CLIENT_DISCONNECTED: 0}
+        self._cancelled_cpu = 0.0
+        self._saved_cpu = 0.0
+
+    def record_completed(self, cpu_seconds):
+        with self._lock:
+            self._completed += 1
+            self._completed_cpu += cpu_seconds
+
+    def record_cancelled(self, cancelled):
+        with self._lock:
+            self._by_stage[cancelled.stage] = self._by_stage.get(cancelled.stage, 0) + 1
+            self._by_reason[cancelled.reason] = self._by_reason.get(cancelled.reason, 0) + 1
+            self._cancelled_cpu += cancelled.cpu_seconds
+            if self._completed:
+                self._saved_cpu += max(0.0, self._completed_cpu / self._completed - cancelled.cpu_seconds)
+        logger.info(
+            f"ℹ️ ML job cancelled before {cancelled.stage} ({cancelled.reason}) "
+            f"after {cancelled.cpu_seconds * 1000:.0f} ms CPU"
+        )
+
+    def stats(self):
+        with self._lock:
+            cancelled = sum(self._by_stage.values())
+            return {
+                'completed': self._completed,
+                'cancelled': cancelled,
+                'cancelled_by_stage': dict(self._by_stage),
+                'cancelled_by_reason': dict(self._by_reason),
+                'cpu_ms_per_completed_job': round(self._completed_cpu * 1000 / self._completed, 1)
+                if self._completed else None,
+                'cpu_ms_spent_on_cancelled': round(self._cancelled_cpu * 1000, 1),
+                'cpu_ms_saved': round(self._saved_cpu * 1000, 1)
+            }
+
+
+cancellation_stats = CancellationStats()
+register_metrics_provider('cancellations', cancellation_stats.stats)
@@ -0,0 +1,317 @@
+import time
+import logging
+import threading
+from datetime import datetime
+from pymongo import ReturnDocument
+
+logger = logging.getLogger(__name__)
+
+# Which embedding model version is serving, and per-target migration state
+MODELS_COLLECTION = 'embedding_models'
+MIGRATIONS_COLLECTION = 'embedding_migrations'
+
+# Collections holding embeddings, in the order a migration works through them
+MIGRATED_COLLECTIONS = ('users', 'group_photos')
+
+
+def versioned_embedding(doc, version, legacy_version, field='face_embedding'):
+    """Embedding of a user or face for one model version, or None
+
+    Embeddings written since versioning live in doc[field + 's'][version];
+    the plain doc[field] belongs to doc[field + '_version'], which is
+    missing (legacy_version) on documents written before versioning.
+    """
+    embedding = (doc.get(field + 's') or {}).get(version)
+    if embedding is not None:
+        return embedding
+    if doc.get(field) is not None and doc.get(field + '_version', legacy_version) == version:
+        return doc[field]
+    return None
+
+
+def user_embedding_query(version, legacy_version):
+    """Mongo filter for users that have an embedding of a model version"""
+    clauses = [
+        {f'face_embeddings.{version}': {'$exists': True}},
+        {'face_embedding': {'$ne': None}, 'face_embedding_version': version}
+    ]
+    if version == legacy_version:
+        clauses.append({'face_embedding': {'$ne': None}, 'face_embedding_version': {'$exists': False}})
+    return {'$or': clauses}
+
+
+def get_active_version(db, default):
+    """Model version currently serving; the first caller records its default"""
+    doc = db[MODELS_COLLECTION].find_one_and_update(
+        {'_id': 'active'},
+        {'$setOnInsert': {'version': default, 'since': datetime.utcnow()}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    return doc['version'] if doc else default
+
+
+def set_active_version(db, version):
+    db[MODELS_COLLECTION].update_one(
+        {'_id': 'active'},
+        {'$set': {'version': version, 'since': datetime.utcnow()}},
+        upsert=True
+    )
+
+
+class ActiveVersionWatch:
+    """Cached view of the serving model version, re-read every interval seconds"""
+
+    def __init__(self, default, interval=5.0):
+        self.default = default
+        self.interval = interval
+        self._version = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self, db):
+        with self._lock:
+            if self._version is None or time.monotonic() - self._checked_at >= self.interval:
+                try:
+                    self._version = get_active_version(db, self.default)
+                except Exception as e:
+                    logger.warning(f"⚠️ Could not read the active embedding model version: {e}")
+                    self._version = self._version or self.default
+                self._checked_at = time.monotonic()
+            return self._version
+
+
+class ReembedMigration:
+    """Resumable, throttled re-embedding of every stored face for a new model
+
+    Works through users (from their profile photo) and group photos (from
+    the stored original, at the boxes already detected) in _id order and
+    batches, writing the target version next to the existing embeddings.
+    The position, counts and failures live in embedding_migrations, so a
+    stopped or crashed job resumes where it left off. At most
+    max_photos_per_s photos are processed, each as a bulk scheduler job so
+    interactive uploads go first.
+
+    Once every user and group photo has a target embedding the job cuts
+    over: the target becomes the active version and serving nodes switch
+    models on their next check. Documents that could not be re-embedded
+    (original gone, no face found) would stop matching after a cut-over, so
+    while there are any the migration is blocked instead, unless
+    allow_failures is set; retry_failed() queues them again.
+
+    reembed(collection, doc) returns the $set for one document, or None if
+    it cannot be re-embedded; run_job(fn, *args) runs it under the scheduler.
+    An exception (scheduler busy, database error) stops the batch before that
+    document, which is retried after retry_delay.
+    """
+
+    def __init__(self, db, source_version, target_version, reembed, run_job=None,
+                 batch_size=32, max_photos_per_s=5.0, retry_delay=5.0, allow_failures=False):
+        self.db = db
+        self.source_version = source_version
+        self.target_version = target_version
+        self.reembed = reembed
+        self.run_job = run_job or (lambda fn, *args: fn(*args))
+        self.batch_size = batch_size
+        self.max_photos_per_s = max_photos_per_s
+        self.retry_delay = retry_delay
+        self.allow_failures = allow_failures
+        self._run_started = None
+        self._run_processed = 0
+        self._retry = False
+
+    def _state(self):
+        return self.db[MIGRATIONS_COLLECTION].find_one({'_id': self.target_version}) or {}
+
+    def _eligible_query(self, collection):
+        if collection == 'users':
+            return {'profile_photo': {'$ne': None}}
+        return {'processed': True, 'faces_detected.0': {'$exists': True}}
+
+    def _missing_query(self, collection):
+        query = self._eligible_query(collection)
+        if collection == 'users':
+            query[f'face_embeddings.{self.target_version}'] = {'$exists': False}
+        else:
+            query['embedding_versions'] = {'$ne': self.target_version}
+        return query
+
+    def _pending_query(self, collection):
+        return dict(self._missing_query(collection), reembed_failed={'$ne': self.target_version})
+
+    def _failed_query(self, collection):
+        return dict(self._missing_query(collection), reembed_failed=self.target_version)
+
+    def start(self):
+        """Create the migration record if this target has none yet"""
+        self.db[MIGRATIONS_COLLECTION].update_one(
+            {'_id': self.target_version},
+            {'$setOnInsert': {
+                'source_version': self.source_version,
+                'phase': MIGRATED_COLLECTIONS[0],
+                'last_id': None,
+                'processed': {name: 0 for name in MIGRATED_COLLECTIONS},
+                'failed': {name: 0 for name in MIGRATED_COLLECTIONS},
+                'started_at': datetime.utcnow(),
+                'cut_over_at': None
+            }},
+            upsert=True
+        )
+
+    def _throttle(self):
+        if self.max_photos_per_s <= 0:
+            return
+        due = self._run_started + self._run_processed / self.max_photos_per_s
+        delay = due - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    def run_batch(self):
+        """Re-embed the next batch; returns how many documents it handled"""
+        state = self._state()
+        phase = state.get('phase')
+        if phase not in MIGRATED_COLLECTIONS:
+            return 0
+        if self._run_started is None:
+            self._run_started = time.monotonic()
+
+        query = self._pending_query(phase)
+        if state.get('last_id') is not None:
+            query['_id'] = {'$gt': state['last_id']}
+        batch = list(self.db[phase].find(query).sort('_id', 1).limit(self.batch_size))
+        if not batch:
+            # This collection is done, move on to the next one
+            following = MIGRATED_COLLECTIONS.index(phase) + 1
+            next_phase = MIGRATED_COLLECTIONS[following] if following < len(MIGRATED_COLLECTIONS) else 'verify'
+            self.db[MIGRATIONS_COLLECTION].update_one(
+                {'_id': self.target_version}, {'$set': {'phase': next_phase, 'last_id': None}}
+            )
+            return 0
+
+        processed = failed = 0
+        last_id = state.get('last_id')
+        for doc in batch:
+            self._throttle()
+            try:
+                update = self.run_job(self.reembed, phase, doc)
+            except Exception as e:
+                logger.error(f"❌ Re-embedding {phase} {doc['_id']} failed, will retry: {e}")
+                self._retry = True
+                break
+            last_id = doc['_id']
+            if update:
+                self.db[phase].update_one({'_id': doc['_id']}, {'$set': update})
+                processed += 1
+            else:
+                # Blocks the cut-over until retried (or a re-upload embeds it)
+                self.db[phase].update_one({'_id': doc['_id']}, {'$set': {'reembed_failed': self.target_version}})
+                failed += 1
+            self._run_processed += 1
+        self.db[MIGRATIONS_COLLECTION].update_one(
+            {'_id': self.target_version},
+            {
+                '$set': {'last_id': last_id, 'updated_at': datetime.utcnow()},
+                '$inc': {f'processed.{phase}': processed, f'failed.{phase}': failed}
+            }
+        )
+        return processed + failed
+
+    def remaining(self):
+        """Documents per collection still missing a target embedding"""
+        return {name: self.db[name].count_documents(self._pending_query(name)) for name in MIGRATED_COLLECTIONS}
+
+    def failures(self):
+        """Documents per collection that could not be re-embedded and still lack a target embedding"""
+        return {name: self.db[name].count_documents(self._failed_query(name)) for name in MIGRATED_COLLECTIONS}
+
+    def retry_failed(self):
+        """Queue the documents that could not be re-embedded again; returns how many"""
+        retried = 0
+        for name in MIGRATED_COLLECTIONS:
+            result = self.db[name].update_many(self._failed_query(name), {'$unset': {'reembed_failed': ''}})
+            retried += result.modified_count
+        self.db[MIGRATIONS_COLLECTION].update_one(
+            {'_id': self.target_version, 'cut_over_at': None},
+            {'$set': {'phase': MIGRATED_COLLECTIONS[0], 'last_id': None}}
+        )
+        return retried
+
+    def maybe_cut_over(self):
+        """Switch serving to the target version once coverage is complete"""
+        state = self._state()
+        if state.get('cut_over_at'):
+            return True
+        remaining = self.remaining()
+        if any(remaining.values()):
+            # Documents written behind the cursor without the new embedding: sweep again
+            self.db[MIGRATIONS_COLLECTION].update_one(
+                {'_id': self.target_version},
+                {'$set': {'phase': MIGRATED_COLLECTIONS[0], 'last_id': None}}
+            )
+            return False
+        failed = self.failures()
+        if any(failed.values()) and not self.allow_failures:
+            self.db[MIGRATIONS_COLLECTION].update_one({'_id': self.target_version}, {'$set': {'phase': 'blocked'}})
+            logger.warning(
+                f"⚠️ Not cutting over to {self.target_version}: {failed} documents could not be re-embedded "
+                f"and would stop matching (retry them, or allow failures to cut over anyway)"
+            )
+            return False
+        set_active_version(self.db, self.target_version)
+        self.db[MIGRATIONS_COLLECTION].update_one(
+            {'_id': self.target_version}, {'$set': {'phase': 'done', 'cut_over_at': datetime.utcnow()}}
+        )
+        logger.info(f"✅ Embedding model cut over from {self.source_version} to {self.target_version}")
+        return True
+
+    def run(self, stop_event=None, progress_interval=10.0):
+        """Run until cut-over, a blocked cut-over (or stop_event); returns the final progress"""
+        self.start()
+        # A blocked cut-over is checked again (failures may have been retried or allowed)
+        self.db[MIGRATIONS_COLLECTION].update_one(
+            {'_id': self.target_version, 'phase': 'blocked'}, {'$set': {'phase': 'verify'}}
+        )
+        last_report = time.monotonic()
+        while stop_event is None or not stop_event.is_set():
+            handled = self.run_batch()
+            if self._retry:
+                self._retry = False
+                time.sleep(self.retry_delay)
+            elif not handled and self._state().get('phase') == 'verify':
+                if self.maybe_cut_over() or self._state().get('phase') == 'blocked':
+                    break
+            if time.monotonic() - last_report >= progress_interval:
+                progress = self.progress()
+                logger.info(
+                    f"📈 Re-embedding to {self.target_version}: {progress['coverage']:.1%} covered, "
+                    f"{sum(progress['failed'].values())} failed, "
+                    f"{progress['photos_per_s']} photos/s, ETA {progress['eta_s']} s"
+                )
+                last_report = time.monotonic()
+        return self.progress()
+
+    def progress(self):
+        """Coverage, failures, throughput and ETA of the migration
+
+        coverage only counts documents that have a target embedding; failed
+        are those that could not be re-embedded (not counted as covered).
+        """
+        state = self._state()
+        remaining = self.remaining()
+        failed = self.failures()
+        total = sum(self.db[name].count_documents(self._eligible_query(name)) for name in MIGRATED_COLLECTIONS)
+        elapsed = time.monotonic() - self._run_started if self._run_started else 0.0
+        rate = self._run_processed / elapsed if elapsed > 0 else None
+        return {
+            'source_version': self.source_version,
+            'target_version': self.target_version,
+            'phase': state.get('phase'),
+            'processed': state.get('processed'),
+            'failed': failed,
+            'failed_attempts': state.get('failed'),
+            'remaining': remaining,
+            'coverage': (total - sum(remaining.values()) - sum(failed.values())) / total if total else 1.0,
+            'photos_per_s': round(rate, 2) if rate else None,
+            'eta_s': round(sum(remaining.values()) / rate, 1) if rate else None,
+            'cut_over_at': state['cut_over_at'].isoformat() if state.get('cut_over_at') else None
+        }
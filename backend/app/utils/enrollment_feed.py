@@ -0,0 +1,260 @@
+import time
+import logging
+import threading
+from datetime import datetime, timedelta
+from pymongo import ReturnDocument
+
+logger = logging.getLogger(__name__)
+
+# Sequenced log of profile enrollments, and the counter that numbers it
+FEED_COLLECTION = 'enrollment_log'
+COUNTERS_COLLECTION = 'counters'
+
+
+def next_sequence(db):
+    """Allocate the next enrollment feed sequence number"""
+    counter = db[COUNTERS_COLLECTION].find_one_and_update(
+        {'_id': FEED_COLLECTION},
+        {'$inc': {'seq': 1}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    return counter['seq']
+
+
+def latest_sequence(db):
+    """Highest sequence number handed out so far (0 if none)"""
+    counter = db[COUNTERS_COLLECTION].find_one({'_id': FEED_COLLECTION})
+    return counter['seq'] if counter else 0
+
+
+def oldest_sequence(db):
+    """Lowest sequence number still in the feed, or None if it is empty"""
+    entry = db[FEED_COLLECTION].find_one({}, {'_id': 1}, sort=[('_id', 1)])
+    return entry['_id'] if entry else None
+
+
+def publish_enrollment(db, user_id, username, embedding, model_version=None):
+    """Append an enrollment to the feed; returns its sequence number"""
+    seq = next_sequence(db)
+    entry = {
+        '_id': seq,
+        'user_id': str(user_id),
+        'username': username,
+        'embedding': [float(x) for x in embedding],
+        'created_at': datetime.utcnow()
+    }
+    if model_version is not None:
+        entry['model_version'] = model_version
+    db[FEED_COLLECTION].insert_one(entry)
+    return seq
+
+
+def read_after(db, seq, limit=500):
+    """Feed entries with a sequence number above seq, in order"""
+    return [
+        {
+            'seq': entry['_id'],
+            'user_id': entry['user_id'],
+            'username': entry['username'],
+            'embedding': entry['embedding'],
+            'model_version': entry.get('model_version')
+        }
+        for entry in db[FEED_COLLECTION].find({'_id': {'$gt': seq}}).sort('_id', 1).limit(limit)
+    ]
+
+
+def trim_feed(db, retention_seconds):
+    """Drop entries older than the retention window; returns how many"""
+    cutoff = datetime.utcnow() - timedelta(seconds=retention_seconds)
+    return db[FEED_COLLECTION].delete_many({'created_at': {'$lt': cutoff}}).deleted_count
+
+
+class FeedTailer:
+    """Keeps one node's gallery in step with the enrollment feed
+
+    Each pass applies the entries after the gallery's last applied sequence
+    number, in order. A missing sequence number normally means a publisher
+    is between allocating it and inserting; the tailer waits up to
+    gap_timeout for it before skipping it. Skipped sequence numbers are
+    looked up again on later passes for up to skipped_retry_s: one whose
+    write committed late cannot be applied in order any more, so the
+    gallery is rebuilt from db.users when it shows up. A node that was down for longer
+    than the feed retention (entries after its position trimmed, possibly
+    all of them) or has no gallery yet catches up by rebuilding its
+    snapshot from db.users, resuming at the sequence number read just
+    before the rebuild.
+
+    With a replica set, a change stream on the feed wakes the tailer as
+    soon as an entry is inserted; otherwise it polls every poll_interval.
+    sync_once() runs on the tailer thread and on request threads (right
+    after an enrollment), so passes are serialized by a lock.
+    """
+
+    def __init__(self, db, gallery, poll_interval=0.5, batch_size=500, gap_timeout=5.0,
+                 retention_seconds=7 * 24 * 3600, use_change_stream=True, skipped_retry_s=3600.0):
+        self.db = db
+        self.gallery = gallery
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.gap_timeout = gap_timeout
+        self.retention_seconds = retention_seconds
+        self.use_change_stream = use_change_stream
+        self.skipped_retry_s = skipped_retry_s
+        self._lock = threading.Lock()
+        self._gap = None  # (missing sequence number, first seen at)
+        self._empty_since = None  # feed first seen empty while behind the counter
+        self._skipped = {}  # skipped sequence number -> skipped at, looked up again on later passes
+        self._trimmed_at = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+        self._failing = False
+        self.applied = 0
+        self.catch_ups = 0
+        self.gaps_skipped = 0
+        self.late_entries = 0
+        self.last_sync_at = None
+
+    def catch_up_from_snapshot(self):
+        """Rebuild the gallery from Mongo and resume the feed after it"""
+        seq = latest_sequence(self.db)
+        self.gallery.build_from_db(self.db, feed_sequence=seq)
+        # The snapshot holds everything enrolled so far, late entries included
+        self._skipped.clear()
+        self._empty_since = None
+        self.catch_ups += 1
+        logger.info(f"✅ Gallery caught up from snapshot at feed sequence {seq}")
+
+    def _trimmed_past(self, applied):
+        """Whether entries after applied have been trimmed from the feed"""
+        oldest = oldest_sequence(self.db)
+        if oldest is not None:
+            self._empty_since = None
+            return oldest > applied + 1
+        if latest_sequence(self.db) <= applied:
+            self._empty_since = None
+            return False
+        # An empty feed behind the counter was trimmed, unless the next
+        # entry is still being inserted: give that the gap timeout
+        now = time.monotonic()
+        if self._empty_since is None:
+            self._empty_since = now
+        return now - self._empty_since >= self.gap_timeout
+
+    def _contiguous(self, entries, applied):
+        """Entries that may be applied now, honouring the gap timeout"""
+        expected = applied + 1
+        if entries and entries[0]['seq'] != expected:
+            now = time.monotonic()
+            if self._gap is None or self._gap[0] != expected:
+                self._gap = (expected, now)
+            if now - self._gap[1] < self.gap_timeout:
+                return []
+            logger.warning(f"⚠️ Skipping feed sequence numbers {expected}..{entries[0]['seq'] - 1}")
+            self.gaps_skipped += entries[0]['seq'] - expected
+            self._skipped.update((seq, now) for seq in range(expected, entries[0]['seq']))
+            expected = entries[0]['seq']
+        self._gap = None
+        ready = []
+        for entry in entries:
+            if entry['seq'] != expected:
+                break
+            ready.append(entry)
+            expected += 1
+        return ready
+
+    def _recheck_skipped(self):
+        """Rebuild the gallery if a skipped entry has been written since"""
+        now = time.monotonic()
+        for seq, skipped_at in list(self._skipped.items()):
+            if now - skipped_at > self.skipped_retry_s:
+                del self._skipped[seq]
+        if not self._skipped:
+            return
+        late = self.db[FEED_COLLECTION].count_documents({'_id': {'$in': list(self._skipped)}})
+        if late:
+            logger.warning(f"⚠️ {late} skipped enrollment feed entries arrived late, rebuilding the gallery")
+            self.late_entries += late
+            self.catch_up_from_snapshot()
+
+    def sync_once(self):
+        """Apply every entry that is ready; returns the number applied"""
+        with self._lock:
+            applied = self.gallery.applied_sequence()
+            if self.gallery.current_version() is None or applied is None or self._trimmed_past(applied):
+                self.catch_up_from_snapshot()
+                applied = self.gallery.applied_sequence()
+
+            count = 0
+            while True:
+                ready = self._contiguous(read_after(self.db, applied, self.batch_size), applied)
+                if not ready:
+                    break
+                applied = self.gallery.apply_feed(ready)
+                count += len(ready)
+            self._recheck_skipped()
+            self.applied += count
+            self.last_sync_at = datetime.utcnow()
+
+            if self.retention_seconds and time.monotonic() - self._trimmed_at > 3600:
+                trim_feed(self.db, self.retention_seconds)
+                self._trimmed_at = time.monotonic()
+            return count
+
+    def _open_change_stream(self):
+        if not self.use_change_stream:
+            return None
+        try:
+            return self.db[FEED_COLLECTION].watch(
+                [{'$match': {'operationType': 'insert'}}],
+                max_await_time_ms=int(self.poll_interval * 1000)
+            )
+        except Exception as e:
+            # Standalone servers (and the stand-in) have no change streams
+            logger.info(f"ℹ️ Enrollment feed change stream unavailable ({e}), polling instead")
+            return None
+
+    def _run(self):
+        stream = self._open_change_stream()
+        while not self._stop.is_set():
+            try:
+                self.sync_once()
+                self._failing = False
+            except Exception as e:
+                # Log once per outage rather than on every poll
+                if not self._failing:
+                    logger.error(f"❌ Enrollment feed sync failed: {e}")
+                self._failing = True
+            if stream is not None:
+                try:
+                    stream.try_next()
+                    continue
+                except Exception as e:
+                    logger.warning(f"⚠️ Change stream closed ({e}), polling instead")
+                    stream = None
+            self._stop.wait(self.poll_interval)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='enrollment-feed', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self):
+        """Applied and latest sequence numbers and catch-up counters"""
+        applied = self.gallery.applied_sequence()
+        latest = latest_sequence(self.db)
+        # Read without the sync lock, which a gallery rebuild can hold for a while
+        return {
+            'applied_sequence': applied,
+            'latest_sequence': latest,
+            'lag_entries': latest - (applied or 0),
+            'applied': self.applied,
+            'catch_ups': self.catch_ups,
+            'gaps_skipped': self.gaps_skipped,
+            'skipped_pending': len(self._skipped),
+            'late_entries': self.late_entries,
+            'last_sync_at': self.last_sync_at.isoformat() if self.last_sync_at else None
+        }
@@ -0,0 +1,180 @@
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Landmark names shared by every backend (MTCNN naming, image-space left/right)
+KEYPOINT_NAMES = ('left_eye', 'right_eye', 'nose', 'mouth_left', 'mouth_right')
+
+
+def make_detection(box, confidence, keypoints=None):
+    """Build a detection in the common bbox/confidence/landmarks format"""
+    x, y, w, h = box
+    return {
+        'box': [int(round(x)), int(round(y)), int(round(w)), int(round(h))],
+        'confidence': float(confidence),
+        'keypoints': keypoints
+    }
+
+
+class FaceDetector:
+    """Base class for face detector backends
+
+    Backends take an RGB image and return a list of detections built with
+    make_detection(): {'box': [x, y, w, h], 'confidence': float,
+    'keypoints': {name: [x, y]} or None}.
+    """
+
+    name = 'base'
+
+    def detect(self, rgb_image):
+        raise NotImplementedError
+
+
+class MTCNNDetector(FaceDetector):
+    """Multi-stage MTCNN detector from the mtcnn package"""
+
+    name = 'mtcnn'
+
+    def __init__(self):
+        from mtcnn import MTCNN
+        self._mtcnn = MTCNN()
+
+    def detect(self, rgb_image):
+        detections = []
+        for res in self._mtcnn.detect_faces(rgb_image) or []:
+            keypoints = res.get('keypoints')
+            if keypoints:
+                keypoints = {k: [int(v[0]), int(v[1])] for k, v in keypoints.items()}
+            detections.append(make_detection(res['box'], res['confidence'], keypoints))
+        return detections
+
+
+class OpenCVDNNDetector(FaceDetector):
+    """OpenCV DNN detector loading a local model file
+
+    A .onnx model is run through cv2.FaceDetectorYN (YuNet, with landmarks);
+    a .caffemodel is run as the res10 SSD through cv2.dnn (boxes only) and
+    expects its deploy.prototxt next to it.
+    """
+
+    name = 'opencv_dnn'
+
+    def __init__(self, model_path, score_threshold=0.9, nms_threshold=0.3, top_k=5000):
+        import cv2
+
+        if not model_path or not os.path.exists(model_path):
+            raise FileNotFoundError(f"Face detector model not found: {model_path}")
+
+        self._cv2 = cv2
+        self.model_path = model_path
+        self.score_threshold = score_threshold
+
+        if model_path.lower().endswith('.onnx'):
+            self._yunet = cv2.FaceDetectorYN.create(
+                model_path, '', (320, 320), score_threshold, nms_threshold, top_k
+            )
+            self._net = None
+        else:
+            prototxt = os.path.join(os.path.dirname(model_path), 'deploy.prototxt')
+            self._net = cv2.dnn.readNetFromCaffe(prototxt, model_path)
+            self._yunet = None
+
+    def detect(self, rgb_image):
+        if self._yunet is not None:
+            return self._detect_yunet(rgb_image)
+        return self._detect_ssd(rgb_image)
+
+    def _detect_yunet(self, rgb_image):
+        cv2 = self._cv2
+        h_img, w_img = rgb_image.shape[:2]
+        # YuNet was trained on BGR input
+        bgr_image = cv2.cvtColor(rgb_image, cv2.COLOR_RGB2BGR)
+        self._yunet.setInputSize((w_img, h_img))
+        _, faces = self._yunet.detect(bgr_image)
+
+        detections = []
+        if faces is None:
+            return detections
+
+        for row in faces:
+            # Row layout: box(4), right eye, left eye, nose tip,
+            # right mouth corner, left mouth corner, score. "Right" is the
+            # subject's right, which is the image-space left used by MTCNN.
+            points = row[4:14].reshape(5, 2)
+            keypoints = {
+                name: [int(px), int(py)]
+                for name, (px, py) in zip(KEYPOINT_NAMES, points)
+            }
+            detections.append(make_detection(row[:4], row[14], keypoints))
+        return detections
+
+    def _detect_ssd(self, rgb_image):
+        cv2 = self._cv2
+        h_img, w_img = rgb_image.shape[:2]
+        bgr_image = cv2.cvtColor(cv2.resize(rgb_image, (300, 300)), cv2.COLOR_RGB2BGR)
+        blob = cv2.dnn.blobFromImage(
+            bgr_image, 1.0, (300, 300), (104.0, 177.0, 123.0), swapRB=False
+        )
+        self._net.setInput(blob)
+        output = self._net.forward()
+
+        detections = []
+        for det in output[0, 0]:
+            confidence = float(det[2])
+            if confidence < self.score_threshold:
+                continue
+            x1, y1 = det[3] * w_img, det[4] * h_img
+            x2, y2 = det[5] * w_img, det[6] * h_img
+            detections.append(make_detection((x1, y1, x2 - x1, y2 - y1), confidence))
+        return detections
+
+
+class StubDetector(FaceDetector):
+    """Deterministic detector for tests and load runs without ML models
+
+    Returns the configured boxes, or a single box covering the central
+    region of the image when none are given.
+    """
+
+    name = 'stub'
+
+    def __init__(self, boxes=None, confidence=0.99):
+        self.boxes = boxes
+        self.confidence = confidence
+
+    def detect(self, rgb_image):
+        h_img, w_img = rgb_image.shape[:2]
+        boxes = self.boxes
+        if boxes is None:
+            boxes = [(w_img // 8, h_img // 8, w_img * 3 // 4, h_img * 3 // 4)]
+        return [make_detection(box, self.confidence) for box in boxes]
+
+
+DETECTOR_BACKENDS = {
+    MTCNNDetector.name: MTCNNDetector,
+    OpenCVDNNDetector.name: OpenCVDNNDetector,
+    StubDetector.name: StubDetector,
+}
+
+
+def create_detector(backend, **options):
+    """Instantiate a face detector backend by name"""
+    try:
+        detector_class = DETECTOR_BACKENDS[backend]
+    except KeyError:
+        raise ValueError(
+            f"Unknown face detector backend '{backend}'. "
+            f"Available: {', '.join(sorted(DETECTOR_BACKENDS))}"
+        )
+    return detector_class(**options)
+
+
+def detector_options(settings, backend):
+    """Collect constructor options for a backend from a config object"""
+    if backend == OpenCVDNNDetector.name:
+        return {
+            'model_path': getattr(settings, 'FACE_DETECTOR_MODEL_PATH', None),
+            'score_threshold': getattr(settings, 'FACE_DETECTOR_SCORE_THRESHOLD', 0.9)
+        }
+    return {}
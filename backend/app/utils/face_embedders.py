@@ -0,0 +1,296 @@
+import os
+import time
+import hashlib
+import logging
+import numpy as np
+import cv2
+from app.utils.thread_budget import intra_op_threads
+
+logger = logging.getLogger(__name__)
+
+# FaceNet input resolution and embedding size
+FACE_INPUT_SIZE = (160, 160)
+EMBEDDING_DIM = 128
+
+# Batches are padded up to one of these sizes so every runtime only ever
+# sees a handful of input shapes (no retracing / re-planning per request)
+DEFAULT_BATCH_BUCKETS = (1, 2, 4, 8, 16, 32)
+
+
+def preprocess_face(face_img):
+    """Preprocess face for FaceNet input - Updated with standalone logic"""
+    try:
+        if face_img is None or face_img.size == 0:
+            return np.zeros((160, 160, 3))
+
+        # Resize to FaceNet input size
+        face_resized = cv2.resize(face_img, FACE_INPUT_SIZE)
+
+        # Normalize to [0, 1]
+        face_normalized = face_resized.astype('float32') / 255.0
+
+        # Standardize (zero mean, unit variance)
+        mean, std = face_normalized.mean(), face_normalized.std()
+        if std > 0:
+            face_normalized = (face_normalized - mean) / std
+
+        return face_normalized
+    except Exception as e:
+        logger.error(f"Error preprocessing face: {e}")
+        return np.zeros((160, 160, 3))
+
+
+def find_model_file(candidates):
+    """Return the first existing path from a list of candidates"""
+    for path in candidates:
+        if path and os.path.exists(path):
+            return path
+    return None
+
+
+def pick_bucket(count, buckets):
+    """Smallest bucket that fits count, or the largest bucket"""
+    for bucket in buckets:
+        if bucket >= count:
+            return bucket
+    return buckets[-1]
+
+
+class FaceEmbedder:
+    """Base class for embedding runtimes
+
+    Backends implement _run() for a single fixed-shape batch; embed() takes
+    any number of preprocessed faces, splits them into bucket-sized chunks
+    and pads the last one with zeros.
+    """
+
+    name = 'base'
+    model_path = None
+    is_synthetic = False
+
+    def __init__(self, batch_buckets=DEFAULT_BATCH_BUCKETS):
+        self.batch_buckets = tuple(sorted(batch_buckets))
+
+    def embed(self, faces):
+        """Embed preprocessed faces of shape (N, 160, 160, 3) into (N, 128)"""
+        faces = np.asarray(faces, dtype='float32')
+        if faces.ndim == 3:
+            faces = faces[np.newaxis]
+        count = len(faces)
+        if count == 0:
+            return np.zeros((0, EMBEDDING_DIM), dtype='float32')
+
+        outputs = []
+        start = 0
+        while start < count:
+            bucket = pick_bucket(count - start, self.batch_buckets)
+            chunk = faces[start:start + bucket]
+            if len(chunk) < bucket:
+                padding = np.zeros((bucket - len(chunk),) + chunk.shape[1:], dtype='float32')
+                chunk = np.concatenate([chunk, padding])
+            outputs.append(np.asarray(self._run(chunk))[:min(bucket, count - start)])
+            start += bucket
+        return np.concatenate(outputs).astype('float32', copy=False)
+
+    def _run(self, batch):
+        raise NotImplementedError
+
+
+class KerasEmbedder(FaceEmbedder):
+    """FaceNet through Keras/TensorFlow (the original runtime)"""
+
+    name = 'keras'
+
+    def __init__(self, model_path, batch_buckets=DEFAULT_BATCH_BUCKETS):
+        super().__init__(batch_buckets)
+        from keras.models import load_model
+        import keras
+
+        # Try to enable unsafe deserialization
+        try:
+            keras.config.enable_unsafe_deserialization()
+        except Exception:
+            pass
+
+        self.model_path = model_path
+        self._model = load_model(model_path, safe_mode=False)
+
+    def _run(self, batch):
+        return self._model.predict(batch, verbose=0)
+
+
+class OnnxRuntimeEmbedder(FaceEmbedder):
+    """FaceNet exported to ONNX and run with ONNX Runtime on CPU"""
+
+    name = 'onnx'
+
+    def __init__(self, model_path, batch_buckets=DEFAULT_BATCH_BUCKETS, intra_op_threads=0):
+        super().__init__(batch_buckets)
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if intra_op_threads:
+            options.intra_op_num_threads = intra_op_threads
+
+        self.model_path = model_path
+        self._session = ort.InferenceSession(
+            model_path, sess_options=options, providers=['CPUExecutionProvider']
+        )
+        self._input_name = self._session.get_inputs()[0].name
+
+    def _run(self, batch):
+        return self._session.run(None, {self._input_name: batch})[0]
+
+
+class OpenCVDNNEmbedder(FaceEmbedder):
+    """FaceNet exported to ONNX and run with cv2.dnn on CPU"""
+
+    name = 'opencv_dnn'
+
+    def __init__(self, model_path, batch_buckets=DEFAULT_BATCH_BUCKETS):
+        super().__init__(batch_buckets)
+        self.model_path = model_path
+        self._net = cv2.dnn.readNetFromONNX(model_path)
+        self._net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+        self._net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+
+    def _run(self, batch):
+        # The exported graph keeps the Keras NHWC input layout
+        self._net.setInput(batch)
+        return self._net.forward()
+
+
+class SyntheticEmbedder(FaceEmbedder):
+    """Deterministic FaceNet stand-in for load and capacity testing
+
+    Each face is assigned one of `population` synthetic identities from a
+    coarse, quantized thumbnail of its pixels, so repeated crops of the same
+    face land on the same identity. Its embedding is the identity's base
+    vector plus small per-face noise. All randomness comes from Generators
+    seeded per face, never from the global NumPy RNG, so concurrent calls
+    cannot interfere and results are stable across processes.
+
+    The latency model sleeps latency_ms + latency_per_face_ms * batch per
+    forward pass, scaled by lognormal jitter, to mimic a real runtime.
+    """
+
+    name = 'synthetic'
+    is_synthetic = True
+
+    def __init__(self, population=10000, seed=0, noise=0.05, signature_size=4,
+                 signature_levels=4, latency_ms=0.0, latency_per_face_ms=0.0,
+                 latency_jitter=0.0, batch_buckets=DEFAULT_BATCH_BUCKETS):
+        super().__init__(batch_buckets)
+        self.population = population
+        self.seed = seed
+        self.noise = noise
+        self.signature_size = signature_size
+        self.signature_levels = signature_levels
+        self.latency_ms = latency_ms
+        self.latency_per_face_ms = latency_per_face_ms
+        self.latency_jitter = latency_jitter
+
+    def identity_of(self, face):
+        """Synthetic identity index of a preprocessed face"""
+        size = (self.signature_size, self.signature_size)
+        thumbnail = cv2.resize(np.asarray(face, dtype='float32'), size, interpolation=cv2.INTER_AREA)
+        # Preprocessed faces are standardized, so +-2 covers nearly all values
+        levels = np.clip((thumbnail + 2.0) / 4.0 * self.signature_levels, 0, self.signature_levels - 1)
+        digest = hashlib.blake2b(levels.astype('uint8').tobytes(), digest_size=8).digest()
+        return int.from_bytes(digest, 'little') % self.population
+
+    def identity_embedding(self, identity):
+        """Unit-norm base vector of a synthetic identity"""
+        rng = np.random.default_rng([self.seed, identity])
+        vector = rng.standard_normal(EMBEDDING_DIM)
+        return vector / np.linalg.norm(vector)
+
+    def _face_embedding(self, face):
+        face = np.ascontiguousarray(face, dtype='float32')
+        base = self.identity_embedding(self.identity_of(face))
+        digest = hashlib.blake2b(face.tobytes(), digest_size=8).digest()
+        rng = np.random.default_rng([self.seed, int.from_bytes(digest, 'little')])
+        vector = base + self.noise * rng.standard_normal(EMBEDDING_DIM)
+        return vector / np.linalg.norm(vector)
+
+    def _simulate_latency(self, batch_size):
+        delay_ms = self.latency_ms + self.latency_per_face_ms * batch_size
+        if delay_ms <= 0:
+            return
+        if self.latency_jitter > 0:
+            delay_ms *= np.random.default_rng().lognormal(0.0, self.latency_jitter)
+        time.sleep(delay_ms / 1000.0)
+
+    def _run(self, batch):
+        self._simulate_latency(len(batch))
+        return np.stack([self._face_embedding(face) for face in batch])
+
+
+EMBEDDER_BACKENDS = {
+    KerasEmbedder.name: KerasEmbedder,
+    OnnxRuntimeEmbedder.name: OnnxRuntimeEmbedder,
+    OpenCVDNNEmbedder.name: OpenCVDNNEmbedder,
+    SyntheticEmbedder.name: SyntheticEmbedder,
+}
+
+
+def create_embedder(backend, **options):
+    """Instantiate an embedding backend by name"""
+    try:
+        embedder_class = EMBEDDER_BACKENDS[backend]
+    except KeyError:
+        raise ValueError(
+            f"Unknown embedding backend '{backend}'. "
+            f"Available: {', '.join(sorted(EMBEDDER_BACKENDS))}"
+        )
+    return embedder_class(**options)
+
+
+def keras_model_candidates(settings):
+    """Possible locations of the Keras FaceNet model"""
+    package_root = os.path.join(os.path.dirname(__file__), '..', '..')
+    return [
+        getattr(settings, 'EMBEDDING_KERAS_PATH', None),
+        'facenet_keras.h5',
+        'models/facenet_keras.h5',
+        'app/models/facenet_keras.h5',
+        os.path.join(package_root, 'facenet_keras.h5'),
+        os.path.join(package_root, 'models', 'facenet_keras.h5')
+    ]
+
+
+def embedder_options(settings, backend, precision=None):
+    """Collect constructor options for a backend from a config object"""
+    options = {
+        'batch_buckets': getattr(settings, 'EMBEDDING_BATCH_BUCKETS', DEFAULT_BATCH_BUCKETS)
+    }
+    if backend == SyntheticEmbedder.name:
+        options.update({
+            'population': getattr(settings, 'SYNTHETIC_POPULATION', 10000),
+            'seed': getattr(settings, 'SYNTHETIC_SEED', 0),
+            'noise': getattr(settings, 'SYNTHETIC_NOISE', 0.05),
+            'latency_ms': getattr(settings, 'SYNTHETIC_LATENCY_MS', 0.0),
+            'latency_per_face_ms': getattr(settings, 'SYNTHETIC_LATENCY_PER_FACE_MS', 0.0),
+            'latency_jitter': getattr(settings, 'SYNTHETIC_LATENCY_JITTER', 0.0)
+        })
+        return options
+
+    precision = precision or getattr(settings, 'EMBEDDING_PRECISION', 'float32')
+    if precision not in ('float32', 'int8'):
+        raise ValueError(f"Unknown embedding precision '{precision}'")
+
+    if backend == KerasEmbedder.name:
+        if precision == 'int8':
+            raise ValueError("int8 embeddings need the onnx or opencv_dnn backend")
+        model_path = find_model_file(keras_model_candidates(settings))
+    elif precision == 'int8':
+        model_path = getattr(settings, 'EMBEDDING_INT8_PATH', None)
+    else:
+        model_path = getattr(settings, 'EMBEDDING_ONNX_PATH', None)
+    if not model_path or not os.path.exists(model_path):
+        raise FileNotFoundError(f"Embedding model for backend '{backend}' not found")
+    options['model_path'] = model_path
+    if backend == OnnxRuntimeEmbedder.name:
+        options['intra_op_threads'] = intra_op_threads(getattr(settings, 'EMBEDDING_INTRA_OP_THREADS', 0))
+    return options
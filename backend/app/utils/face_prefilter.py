@@ -0,0 +1,254 @@
+import os
+import time
+import random
+import logging
+import threading
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# roi: skip face-free images, run the detector only around cascade hits;
+# skip: skip face-free images, run the detector on the whole image otherwise
+PREFILTER_ACTIONS = ('roi', 'skip')
+
+DEFAULT_CASCADES = ('haarcascade_frontalface_default.xml', 'haarcascade_profileface.xml')
+
+
+def load_cascade(name, cascade_dir=None):
+    """Load a Haar or LBP cascade by file name (from cascade_dir) or path"""
+    path = name
+    if not os.path.isabs(name):
+        if cascade_dir is None:
+            cascade_dir = getattr(getattr(cv2, 'data', None), 'haarcascades', '')
+        path = os.path.join(cascade_dir, name)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Face cascade not found: {path}")
+    cascade = cv2.CascadeClassifier()
+    if not cascade.load(path):
+        raise ValueError(f"Could not load face cascade: {path}")
+    return cascade
+
+
+def merge_regions(regions):
+    """Union overlapping [x1, y1, x2, y2] regions until none overlap
+
+    Merged regions never produce the same face twice, so detections from
+    different regions need no de-duplication.
+    """
+    regions = [list(region) for region in regions]
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(regions)):
+            for j in range(i + 1, len(regions)):
+                a, b = regions[i], regions[j]
+                if a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]:
+                    regions[i] = [min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])]
+                    del regions[j]
+                    merged = True
+                    break
+            if merged:
+                break
+    return regions
+
+
+def center_inside(box, regions):
+    """Whether the center of an [x, y, w, h] box lies in any [x1, y1, x2, y2] region"""
+    cx, cy = box[0] + box[2] / 2, box[1] + box[3] / 2
+    return any(x1 <= cx < x2 and y1 <= cy < y2 for x1, y1, x2, y2 in regions)
+
+
+class FacePrefilter:
+    """Cheap first stage in front of the face detector
+
+    A grayscale thumbnail (long side thumbnail_size) is scanned with OpenCV
+    cascades, a few milliseconds against hundreds for the MTCNN pyramid.
+    With no hit at all the image is reported face-free and the detector is
+    not run. Otherwise, with action='roi', each hit is grown by roi_margin
+    (times the hit's side, on every side), overlapping regions are merged
+    and the detector only sees those crops; if they cover more than
+    max_roi_fraction of the image one full-image pass is cheaper and is run
+    instead.
+
+    Conservativeness is set by min_neighbors (1 keeps almost every cascade
+    candidate, so skips only happen on clearly face-free images; higher
+    values skip more and risk missing faces), min_size (smallest window, in
+    thumbnail pixels) and thumbnail_size: faces smaller than about
+    min_size * long side / thumbnail_size full-resolution pixels are not
+    seen by the cascades. Profile cascades are also run on the mirrored
+    thumbnail, since they only find one side.
+
+    audit_rate is the fraction of screened images on which the full
+    detector still runs over the whole image; there the prefilter's
+    decision is checked against it and false skips (the detector found
+    faces) and faces outside the regions are counted.
+    """
+
+    def __init__(self, cascades=DEFAULT_CASCADES, cascade_dir=None, thumbnail_size=640, scale_factor=1.1,
+                 min_neighbors=2, min_size=20, roi_margin=0.75, max_roi_fraction=0.5, action='roi',
+                 audit_rate=0.0):
+        if action not in PREFILTER_ACTIONS:
+            raise ValueError(f"Unknown prefilter action '{action}'. Available: {', '.join(PREFILTER_ACTIONS)}")
+        self.cascades = [(name, load_cascade(name, cascade_dir)) for name in cascades]
+        self.thumbnail_size = thumbnail_size
+        self.scale_factor = scale_factor
+        self.min_neighbors = min_neighbors
+        self.min_size = min_size
+        self.roi_margin = roi_margin
+        self.max_roi_fraction = max_roi_fraction
+        self.action = action
+        self.audit_rate = audit_rate
+        self._lock = threading.Lock()
+        self._screened = 0
+        self._decisions = {'skip': 0, 'roi': 0, 'full': 0}
+        self._screen_seconds = 0.0
+        self._full_runs = 0
+        self._full_seconds = 0.0
+        self._audited = 0
+        self._false_skips = 0
+        self._faces_outside_rois = 0
+
+    def candidates(self, image):
+        """Cascade hits on a BGR or grayscale image, as [x1, y1, x2, y2] in its own pixels"""
+        gray = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        h_img, w_img = gray.shape[:2]
+        scale = min(1.0, self.thumbnail_size / max(h_img, w_img))
+        if scale < 1.0:
+            gray = cv2.resize(gray, (max(1, int(w_img * scale)), max(1, int(h_img * scale))),
+                              interpolation=cv2.INTER_AREA)
+        gray = cv2.equalizeHist(gray)
+        width = gray.shape[1]
+
+        hits = []
+        for name, cascade in self.cascades:
+            passes = [(gray, False)]
+            if 'profile' in name:
+                passes.append((cv2.flip(gray, 1), True))
+            for thumbnail, mirrored in passes:
+                found = cascade.detectMultiScale(
+                    thumbnail, scaleFactor=self.scale_factor, minNeighbors=self.min_neighbors,
+                    minSize=(self.min_size, self.min_size)
+                )
+                for x, y, w, h in found:
+                    if mirrored:
+                        x = width - x - w
+                    hits.append([x / scale, y / scale, (x + w) / scale, (y + h) / scale])
+        return hits
+
+    def regions(self, hits, shape):
+        """Grow, clip and merge cascade hits into detector crops, [x1, y1, x2, y2] ints"""
+        h_img, w_img = shape[:2]
+        grown = []
+        for x1, y1, x2, y2 in hits:
+            margin = self.roi_margin * max(x2 - x1, y2 - y1)
+            grown.append([
+                max(0, int(x1 - margin)), max(0, int(y1 - margin)),
+                min(w_img, int(np.ceil(x2 + margin))), min(h_img, int(np.ceil(y2 + margin)))
+            ])
+        return merge_regions(grown)
+
+    def plan(self, image):
+        """('skip' | 'roi' | 'full', regions) for a decoded BGR image"""
+        started = time.perf_counter()
+        hits = self.candidates(image)
+        regions = self.regions(hits, image.shape) if hits else []
+        if not hits:
+            decision = 'skip'
+        elif self.action == 'roi':
+            covered = sum((x2 - x1) * (y2 - y1) for x1, y1, x2, y2 in regions)
+            decision = 'roi' if covered <= self.max_roi_fraction * image.shape[0] * image.shape[1] else 'full'
+        else:
+            decision = 'full'
+        with self._lock:
+            self._screened += 1
+            self._decisions[decision] += 1
+            self._screen_seconds += time.perf_counter() - started
+        return decision, regions
+
+    def should_audit(self):
+        return bool(self.audit_rate) and random.random() < self.audit_rate
+
+    def detect(self, detect_fn, rgb_image, decision, regions):
+        """Run detect_fn as planned; detections come back in full-image coordinates"""
+        if decision == 'skip':
+            return []
+        if decision == 'full':
+            return self.detect_full(detect_fn, rgb_image)
+        detections = []
+        for x1, y1, x2, y2 in regions:
+            for detection in detect_fn(np.ascontiguousarray(rgb_image[y1:y2, x1:x2])):
+                x, y, w, h = detection['box']
+                detection['box'] = [x + x1, y + y1, w, h]
+                if detection.get('keypoints'):
+                    detection['keypoints'] = {
+                        name: [px + x1, py + y1] for name, (px, py) in detection['keypoints'].items()
+                    }
+                detections.append(detection)
+        return detections
+
+    def detect_full(self, detect_fn, rgb_image):
+        """Whole-image detection, timed to estimate what a skip saves"""
+        started = time.perf_counter()
+        detections = detect_fn(rgb_image)
+        with self._lock:
+            self._full_runs += 1
+            self._full_seconds += time.perf_counter() - started
+        return detections
+
+    def record_audit(self, decision, regions, detections):
+        """Compare a planned decision with what the full detector found"""
+        boxes = [d['box'] for d in detections]
+        with self._lock:
+            self._audited += 1
+            if decision == 'skip' and boxes:
+                self._false_skips += 1
+            elif decision == 'roi':
+                self._faces_outside_rois += sum(1 for box in boxes if not center_inside(box, regions))
+        if decision == 'skip' and boxes:
+            logger.warning(f"⚠️ Prefilter would have skipped an image with {len(boxes)} faces")
+
+    def stats(self):
+        """Decisions, screening cost, detector time saved and audited misses"""
+        with self._lock:
+            full_ms = self._full_seconds * 1000 / self._full_runs if self._full_runs else None
+            skipped = self._decisions['skip']
+            return {
+                'action': self.action,
+                'images_screened': self._screened,
+                'decisions': dict(self._decisions),
+                'skip_rate': round(skipped / self._screened, 4) if self._screened else 0.0,
+                'screen_ms_per_image': round(self._screen_seconds * 1000 / self._screened, 3)
+                if self._screened else None,
+                'full_detect_ms': round(full_ms, 1) if full_ms is not None else None,
+                'detector_saved_ms': round(skipped * full_ms, 1) if full_ms is not None else None,
+                'audited': self._audited,
+                'false_skips': self._false_skips,
+                'faces_outside_rois': self._faces_outside_rois,
+                'settings': {
+                    'cascades': [name for name, _ in self.cascades],
+                    'thumbnail_size': self.thumbnail_size,
+                    'scale_factor': self.scale_factor,
+                    'min_neighbors': self.min_neighbors,
+                    'min_size': self.min_size,
+                    'roi_margin': self.roi_margin,
+                    'max_roi_fraction': self.max_roi_fraction,
+                    'audit_rate': self.audit_rate
+                }
+            }
+
+
+def create_face_prefilter(settings):
+    """The configured prefilter (raises if its cascades cannot be loaded)"""
+    return FacePrefilter(
+        cascades=[name.strip() for name in settings.FACE_PREFILTER_CASCADES.split(',') if name.strip()],
+        cascade_dir=settings.FACE_PREFILTER_CASCADE_DIR,
+        thumbnail_size=settings.FACE_PREFILTER_THUMBNAIL_SIZE,
+        scale_factor=settings.FACE_PREFILTER_SCALE_FACTOR,
+        min_neighbors=settings.FACE_PREFILTER_MIN_NEIGHBORS,
+        min_size=settings.FACE_PREFILTER_MIN_SIZE,
+        roi_margin=settings.FACE_PREFILTER_ROI_MARGIN,
+        max_roi_fraction=settings.FACE_PREFILTER_MAX_ROI_FRACTION,
+        action=settings.FACE_PREFILTER_ACTION,
+        audit_rate=settings.FACE_PREFILTER_AUDIT_RATE
+    )
@@ -0,0 +1,162 @@
+import logging
+import threading
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Side of the grayscale thumbnail the blur score is measured on, so scores
+# are comparable between a 40 px and a 400 px face
+SHARPNESS_SIZE = 64
+
+# Rejection reasons, in the order they are checked (cheapest first)
+REASONS = ('size', 'confidence', 'pose', 'blur')
+
+QUALITY_ACTIONS = ('drop', 'defer')
+
+
+def pose_scores(keypoints_list):
+    """Yaw and roll proxies from the eye and nose landmarks, NaN when missing
+
+    Yaw is the horizontal offset of the nose from the midpoint between the
+    eyes, in units of the distance between the eyes: about 0 for a frontal
+    face and 0.5 or more in profile. Roll is the angle of the eye line in
+    degrees.
+    """
+    points = np.full((len(keypoints_list), 3, 2), np.nan, dtype=np.float32)
+    for i, keypoints in enumerate(keypoints_list):
+        if keypoints and all(name in keypoints for name in ('left_eye', 'right_eye', 'nose')):
+            points[i] = [keypoints['left_eye'], keypoints['right_eye'], keypoints['nose']]
+    left_eye, right_eye, nose = points[:, 0], points[:, 1], points[:, 2]
+    eye_vector = right_eye - left_eye
+    interocular = np.maximum(np.linalg.norm(eye_vector, axis=1), 1.0)
+    yaw = np.abs(nose[:, 0] - (left_eye[:, 0] + right_eye[:, 0]) / 2) / interocular
+    roll = np.abs(np.degrees(np.arctan2(eye_vector[:, 1], eye_vector[:, 0])))
+    return yaw, roll
+
+
+def sharpness_scores(crops):
+    """Variance of the Laplacian of each crop on a small grayscale thumbnail
+
+    Low values mean few edges: motion blur, focus blur or heavy compression.
+    """
+    if not crops:
+        return np.zeros(0, dtype=np.float32)
+    thumbnails = np.stack([
+        cv2.resize(cv2.cvtColor(crop, cv2.COLOR_RGB2GRAY), (SHARPNESS_SIZE, SHARPNESS_SIZE),
+                   interpolation=cv2.INTER_AREA)
+        for crop in crops
+    ]).astype(np.float32)
+    # 4-neighbour Laplacian over the whole stack at once
+    laplacian = (thumbnails[:, :-2, 1:-1] + thumbnails[:, 2:, 1:-1] + thumbnails[:, 1:-1, :-2]
+                 + thumbnails[:, 1:-1, 2:] - 4 * thumbnails[:, 1:-1, 1:-1])
+    return laplacian.reshape(len(crops), -1).var(axis=1)
+
+
+class FaceQualityGate:
+    """Drops (or defers) faces that are not worth a FaceNet forward pass
+
+    Runs between detection and embedding. Box size, detector confidence and
+    pose are checked for all faces at once; the blur score, which needs the
+    pixels, is only computed for faces that passed those. Faces without
+    landmarks are not pose-checked. Rejected faces are either dropped or,
+    with action='defer', kept without an embedding so they can be looked at
+    or re-embedded later.
+
+    The gate also keeps the average embedding cost per face, to report how
+    much inference the skipped faces saved.
+    """
+
+    def __init__(self, min_size=40, min_confidence=0.9, min_sharpness=40.0, max_yaw=0.35,
+                 max_roll=30.0, action='drop'):
+        if action not in QUALITY_ACTIONS:
+            raise ValueError(f"Unknown face quality action '{action}'. Available: {', '.join(QUALITY_ACTIONS)}")
+        self.min_size = min_size
+        self.min_confidence = min_confidence
+        self.min_sharpness = min_sharpness
+        self.max_yaw = max_yaw
+        self.max_roll = max_roll
+        self.action = action
+        self._lock = threading.Lock()
+        self._assessed = 0
+        self._rejected = {reason: 0 for reason in REASONS}
+        self._embedded = 0
+        self._embed_seconds = 0.0
+
+    def assess(self, boxes, confidences, keypoints_list, crops):
+        """Score a batch of faces; returns (keep mask, reasons, scores)
+
+        boxes are [x, y, w, h] in full-resolution pixels, crops the RGB face
+        regions as decoded. reasons[i] is None for kept faces, otherwise the
+        first check the face failed.
+        """
+        count = len(boxes)
+        boxes = np.asarray(boxes, dtype=np.float32).reshape(count, 4)
+        confidences = np.asarray(confidences, dtype=np.float32)
+        sizes = np.minimum(boxes[:, 2], boxes[:, 3])
+        yaw, roll = pose_scores(keypoints_list)
+
+        failed = {
+            'size': sizes < self.min_size,
+            'confidence': confidences < self.min_confidence,
+            # NaN (no landmarks) compares False, so those faces pass
+            'pose': (yaw > self.max_yaw) | (roll > self.max_roll),
+        }
+        cheap_pass = ~(failed['size'] | failed['confidence'] | failed['pose'])
+        sharpness = np.full(count, np.nan, dtype=np.float32)
+        candidates = np.flatnonzero(cheap_pass)
+        sharpness[candidates] = sharpness_scores([crops[i] for i in candidates])
+        failed['blur'] = sharpness < self.min_sharpness
+
+        reasons = [None] * count
+        for reason in reversed(REASONS):
+            for i in np.flatnonzero(failed[reason]):
+                reasons[i] = reason
+        keep = np.array([reason is None for reason in reasons], dtype=bool)
+
+        scores = [
+            {
+                'size': int(sizes[i]),
+                'confidence': round(float(confidences[i]), 4),
+                'sharpness': None if np.isnan(sharpness[i]) else round(float(sharpness[i]), 1),
+                'yaw': None if np.isnan(yaw[i]) else round(float(yaw[i]), 3),
+                'roll': None if np.isnan(roll[i]) else round(float(roll[i]), 1)
+            }
+            for i in range(count)
+        ]
+
+        with self._lock:
+            self._assessed += count
+            for reason in reasons:
+                if reason is not None:
+                    self._rejected[reason] += 1
+        return keep, reasons, scores
+
+    def record_embedding(self, faces, seconds):
+        """Account an embedding batch, for the inference-saved estimate"""
+        with self._lock:
+            self._embedded += faces
+            self._embed_seconds += seconds
+
+    def stats(self):
+        """Faces assessed and skipped per reason, and the inference time saved"""
+        with self._lock:
+            skipped = sum(self._rejected.values())
+            per_face_ms = self._embed_seconds * 1000 / self._embedded if self._embedded else None
+            return {
+                'action': self.action,
+                'faces_assessed': self._assessed,
+                'faces_embedded': self._embedded,
+                'faces_skipped': skipped,
+                'skipped_by_reason': dict(self._rejected),
+                'skip_rate': round(skipped / self._assessed, 4) if self._assessed else 0.0,
+                'embed_ms_per_face': round(per_face_ms, 3) if per_face_ms is not None else None,
+                'inference_saved_ms': round(skipped * per_face_ms, 1) if per_face_ms is not None else None,
+                'thresholds': {
+                    'min_size': self.min_size,
+                    'min_confidence': self.min_confidence,
+                    'min_sharpness': self.min_sharpness,
+                    'max_yaw': self.max_yaw,
+                    'max_roll': self.max_roll
+                }
+            }
@@ -0,0 +1,617 @@
+import os
+import json
+import time
+import logging
+import tempfile
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from app.utils.embedding_versions import user_embedding_query, versioned_embedding
+from app.utils.pq import ProductQuantizer
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process locking only
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+CURRENT_FILE = 'CURRENT'
+LOCK_FILE = 'LOCK'
+# Last enrollment feed sequence number applied on this host
+FEED_SEQUENCE_FILE = 'FEED_SEQUENCE'
+
+
+def normalize_rows(matrix):
+    """L2-normalize rows so a dot product is the cosine similarity"""
+    matrix = np.asarray(matrix, dtype='float32')
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class GalleryView:
+    """One immutable version of the gallery: a memory-mapped snapshot plus
+    the enrollments appended to its delta log so far
+
+    Delta entries override snapshot rows of the same user, so a user who
+    re-enrolls is matched against their newest embedding only.
+
+    With PQ codes, snapshot rows are ranked by approximate cosine from the
+    codes and only the top `rerank` candidates per face are re-scored
+    against their exact embeddings, so the mapped float32 rows are touched
+    a few at a time instead of all being kept in RAM.
+
+    Superseded snapshot rows are found through id_order, the argsort of the
+    snapshot's user ids: computed once per snapshot and handed on to every
+    view extended from it, so a new view only binary-searches its overlay ids.
+    """
+
+    def __init__(self, version, embeddings, user_ids, usernames, delta_offset=0,
+                 overlay_ids=(), overlay_names=(), overlay_embeddings=None,
+                 codes=None, quantizer=None, rerank=64, id_order=None):
+        self.version = version
+        self.embeddings = embeddings
+        self.codes = codes
+        self.quantizer = quantizer
+        self.rerank = rerank
+        self.user_ids = user_ids
+        self.usernames = usernames
+        self.delta_offset = delta_offset
+        self.overlay_ids = list(overlay_ids)
+        self.overlay_names = list(overlay_names)
+        dim = embeddings.shape[1] if embeddings.ndim == 2 else 0
+        self.overlay_embeddings = (
+            overlay_embeddings if overlay_embeddings is not None else np.zeros((0, dim), dtype='float32')
+        )
+        self.id_order = id_order
+        # Snapshot rows superseded by a delta entry
+        self.masked_rows = np.zeros(0, dtype='int64')
+        if self.overlay_ids and len(user_ids):
+            if self.id_order is None:
+                self.id_order = np.argsort(user_ids, kind='stable')
+            ids = np.array(self.overlay_ids, dtype=user_ids.dtype)
+            lo = np.searchsorted(user_ids, ids, side='left', sorter=self.id_order)
+            hi = np.searchsorted(user_ids, ids, side='right', sorter=self.id_order)
+            found = [self.id_order[a:b] for a, b in zip(lo, hi) if b > a]
+            if found:
+                self.masked_rows = np.sort(np.concatenate(found)).astype('int64')
+        self._shard_bounds = {}
+
+    def __len__(self):
+        return len(self.user_ids) - len(self.masked_rows) + len(self.overlay_ids)
+
+    def shard_bounds(self, shards):
+        """Split the view's rows (snapshot rows, then overlay rows) into even ranges
+
+        Computed per view, so every enrollment that produces a new view
+        rebalances the shards; a shard may span the snapshot/overlay border.
+        """
+        bounds = self._shard_bounds.get(shards)
+        if bounds is None:
+            edges = np.linspace(0, len(self.user_ids) + len(self.overlay_ids), shards + 1).round().astype('int64')
+            bounds = [(int(lo), int(hi)) for lo, hi in zip(edges[:-1], edges[1:]) if hi > lo]
+            self._shard_bounds[shards] = bounds
+        return bounds
+
+    def _snapshot_top(self, faces, start, stop, k, tables=None):
+        """Top-k snapshot rows in [start, stop) per face, as (rows, exact cosines)
+
+        With PQ codes the range is ranked by ADC and only the top `rerank`
+        candidates per face are re-scored exactly; the sorted candidates
+        read the mapped exact rows in file order.
+        """
+        masked = self.masked_rows[np.searchsorted(self.masked_rows, start):np.searchsorted(self.masked_rows, stop)]
+        if self.codes is None:
+            scores = faces @ np.asarray(self.embeddings[start:stop]).T
+            if len(masked):
+                scores[:, masked - start] = -np.inf
+            rows = np.arange(start, stop)
+        else:
+            codes = self.codes[:, start:stop]
+            depth = min(max(self.rerank, k), stop - start)
+            candidates = np.empty((len(faces), depth), dtype='int64')
+            scores = np.empty((len(faces), depth), dtype='float32')
+            for i, face in enumerate(faces):
+                approx = self.quantizer.scores(tables[i], codes)
+                if len(masked):
+                    approx[masked - start] = -np.inf
+                candidates[i] = np.sort(np.argpartition(approx, -depth)[-depth:]) + start
+                scores[i] = np.asarray(self.embeddings[candidates[i]]) @ face
+            if len(masked):
+                scores[np.isin(candidates, masked)] = -np.inf
+            rows = candidates
+        return _top_k(rows, scores, k)
+
+    def _search(self, faces, start, stop, k, tables=None):
+        """Top-k over rows [start, stop) of snapshot + overlay: (rows, scores)
+
+        Overlay rows are numbered after the snapshot rows.
+        """
+        snapshot_rows = len(self.user_ids)
+        parts = []
+        if start < snapshot_rows:
+            parts.append(self._snapshot_top(faces, start, min(stop, snapshot_rows), k, tables))
+        if stop > snapshot_rows:
+            lo, hi = max(start, snapshot_rows) - snapshot_rows, stop - snapshot_rows
+            scores = faces @ self.overlay_embeddings[lo:hi].T
+            parts.append(_top_k(np.arange(lo, hi) + snapshot_rows, scores, k))
+        return _merge_top_k(parts, k)
+
+    def top_matches(self, face_embeddings, k=1, pool=None):
+        """k best (row, cosine) per face, rows in snapshot-then-overlay numbering
+
+        With a ShardPool the rows are split into pool.shards ranges searched
+        in parallel (NumPy releases the GIL in the matrix products and code
+        lookups) and the per-shard top-k lists are merged.
+        """
+        faces = normalize_rows(face_embeddings)
+        tables = self.quantizer.adc_tables(faces) if self.codes is not None and len(self.user_ids) else None
+        total = len(self.user_ids) + len(self.overlay_ids)
+        if pool is None or pool.shards < 2 or total < pool.min_rows:
+            return self._search(faces, 0, total, k, tables)
+        bounds = self.shard_bounds(pool.shards)
+        parts = pool.map(lambda bound: self._search(faces, bound[0], bound[1], k, tables), bounds)
+        return _merge_top_k(parts, k)
+
+    def user_at(self, row):
+        """(user id, username) of a row in snapshot-then-overlay numbering"""
+        if row < len(self.user_ids):
+            return self.user_ids[row], self.usernames[row]
+        row -= len(self.user_ids)
+        return self.overlay_ids[row], self.overlay_names[row]
+
+    def _reranked_best(self, faces):
+        """Best snapshot row and its exact cosine per face, via ADC then exact re-rank"""
+        rows, scores = self._snapshot_top(faces, 0, len(self.user_ids), 1, self.quantizer.adc_tables(faces))
+        return rows[:, 0], scores[:, 0]
+
+    def best_matches(self, face_embeddings, threshold=0.6, pool=None):
+        """Best user above threshold for each face, or None"""
+        if not len(face_embeddings):
+            return []
+        if not len(self):
+            return [None] * len(face_embeddings)
+        rows, scores = self.top_matches(face_embeddings, k=1, pool=pool)
+
+        matches = []
+        for row, score in zip(rows[:, 0], scores[:, 0]):
+            if row < 0 or not score > threshold:
+                matches.append(None)
+            else:
+                user_id, username = self.user_at(row)
+                matches.append({
+                    'user_id': str(user_id),
+                    'username': str(username),
+                    'similarity': round(float(score), 3)
+                })
+        return matches
+
+
+def _top_k(rows, scores, k):
+    """Best k columns per face of a (faces, n) score matrix; rows is (n,) or (faces, n)
+
+    Short ranges are padded with row -1 and score -inf.
+    """
+    faces, n = scores.shape
+    rows = np.broadcast_to(rows, scores.shape)
+    if n < k:
+        rows = np.concatenate([rows, np.full((faces, k - n), -1, dtype='int64')], axis=1)
+        scores = np.concatenate([scores, np.full((faces, k - n), -np.inf, dtype=scores.dtype)], axis=1)
+    elif n > k:
+        top = np.argpartition(scores, -k, axis=1)[:, -k:]
+        rows = np.take_along_axis(rows, top, axis=1)
+        scores = np.take_along_axis(scores, top, axis=1)
+    order = np.argsort(-scores, axis=1, kind='stable')
+    return np.take_along_axis(rows, order, axis=1), np.take_along_axis(scores, order, axis=1)
+
+
+def _merge_top_k(parts, k):
+    """Merge per-shard (rows, scores) top-k lists into one"""
+    if len(parts) == 1:
+        return parts[0]
+    rows = np.concatenate([part[0] for part in parts], axis=1)
+    scores = np.concatenate([part[1] for part in parts], axis=1)
+    return _top_k(rows, scores, k)
+
+
+class ShardPool:
+    """Threads searching the shards of a gallery view in parallel
+
+    Every shard reads its own row range of the same memory-mapped snapshot,
+    so adding shards costs no memory; with NumPy releasing the GIL, each
+    thread scans its range on its own core, so a photo's faces are matched
+    against the whole gallery with the memory bandwidth of several cores.
+    Views smaller than min_rows are searched on the calling thread.
+    """
+
+    def __init__(self, shards, min_rows=20000):
+        self.shards = shards
+        self.min_rows = min_rows
+        self._executor = ThreadPoolExecutor(max_workers=shards, thread_name_prefix='gallery-shard')
+        self._lock = threading.Lock()
+        self._queries = 0
+        self._wall_seconds = 0.0
+        self._shard_seconds = 0.0
+
+    def map(self, fn, bounds):
+        started = time.perf_counter()
+
+        def timed(bound):
+            shard_started = time.perf_counter()
+            try:
+                return fn(bound)
+            finally:
+                elapsed = time.perf_counter() - shard_started
+                with self._lock:
+                    self._shard_seconds += elapsed
+
+        results = list(self._executor.map(timed, bounds))
+        with self._lock:
+            self._queries += 1
+            self._wall_seconds += time.perf_counter() - started
+        return results
+
+    def stats(self):
+        """Sharded searches and how well they overlapped (shards x wall time vs summed shard time)"""
+        with self._lock:
+            return {
+                'shards': self.shards,
+                'min_rows': self.min_rows,
+                'sharded_queries': self._queries,
+                'wall_ms_per_query': round(self._wall_seconds * 1000 / self._queries, 3) if self._queries else None,
+                'parallelism': round(self._shard_seconds / self._wall_seconds, 2) if self._wall_seconds else None
+            }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+
+class Gallery:
+    """Versioned, memory-mapped gallery of enrolled face embeddings
+
+    Version N on disk is v{N}.embeddings.npy (float32, L2-normalized rows),
+    v{N}.user_ids.npy and v{N}.usernames.npy, plus an append-only JSON-lines
+    delta log v{N}.delta.jsonl of enrollments made since. The CURRENT file
+    names the live version and is replaced atomically, so every worker maps
+    the same read-only files (sharing their physical pages) and switches
+    versions in one step. Enrollments append to the live delta log; the
+    compactor folds a log into version N+1 under an exclusive file lock so
+    no append is lost across the switch.
+
+    A gallery holds embeddings of one model version: with model_version
+    set it reads that version from Mongo and ignores feed entries of other
+    versions (legacy_version is the version of unversioned embeddings).
+
+    With pq_subspaces set, snapshots of at least pq_min_users users also get
+    product-quantization codebooks (v{N}.pq_codebooks.npy, trained on the
+    snapshot) and uint8 codes (v{N}.pq_codes.npy, pq_subspaces bytes per
+    user), and matching ranks by code before re-ranking exactly.
+    Compaction keeps the codebooks and only encodes the folded deltas; a
+    rebuild from Mongo trains new ones.
+    """
+
+    def __init__(self, directory, dim=128, refresh_interval=1.0, model_version=None, legacy_version=None,
+                 pq_subspaces=None, pq_min_users=5000, pq_rerank=64, pq_train_sample=65536):
+        self.directory = directory
+        self.dim = dim
+        self.refresh_interval = refresh_interval
+        self.model_version = model_version
+        self.legacy_version = legacy_version or model_version
+        self.pq_subspaces = pq_subspaces
+        self.pq_min_users = pq_min_users
+        self.pq_rerank = pq_rerank
+        self.pq_train_sample = pq_train_sample
+        self._view = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self._file_lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, version, part):
+        return os.path.join(self.directory, f"v{version:08d}.{part}")
+
+    @contextmanager
+    def _exclusive(self):
+        """Cross-process lock serializing appends, snapshots and compaction"""
+        with self._file_lock, open(os.path.join(self.directory, LOCK_FILE), 'a') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def current_version(self):
+        """Live version from the CURRENT file, or None before the first snapshot"""
+        try:
+            with open(os.path.join(self.directory, CURRENT_FILE)) as f:
+                return int(f.read().strip())
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _write_counter(self, filename, value):
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, prefix='.tmp-')
+        with os.fdopen(fd, 'w') as f:
+            f.write(str(value))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, os.path.join(self.directory, filename))
+
+    def _publish(self, version):
+        self._write_counter(CURRENT_FILE, version)
+
+    def applied_sequence(self):
+        """Last enrollment feed sequence folded into this gallery, or None"""
+        try:
+            with open(os.path.join(self.directory, FEED_SEQUENCE_FILE)) as f:
+                return int(f.read().strip())
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _save_array(self, version, part, array):
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, prefix='.tmp-')
+        with os.fdopen(fd, 'wb') as f:
+            np.save(f, array)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self._path(version, part))
+
+    def _write_snapshot(self, version, user_ids, usernames, embeddings, quantizer=None, codes=None):
+        # Caller holds the exclusive lock
+        embeddings = normalize_rows(np.asarray(embeddings, dtype='float32').reshape(-1, self.dim))
+        self._save_array(version, 'embeddings.npy', embeddings)
+        self._save_array(version, 'user_ids.npy', np.array(user_ids, dtype='U24'))
+        self._save_array(version, 'usernames.npy', np.array(usernames, dtype=str))
+        if self.pq_subspaces and len(embeddings) >= self.pq_min_users:
+            if quantizer is None:
+                started = time.perf_counter()
+                quantizer = ProductQuantizer.train(embeddings, self.pq_subspaces, sample=self.pq_train_sample)
+                logger.info(f"📊 PQ codebooks trained for gallery v{version} in {time.perf_counter() - started:.1f}s")
+            if codes is None:
+                codes = quantizer.encode(embeddings)
+            self._save_array(version, 'pq_codebooks.npy', quantizer.codebooks)
+            self._save_array(version, 'pq_codes.npy', codes)
+        open(self._path(version, 'delta.jsonl'), 'a').close()
+        self._publish(version)
+        self._remove_old_versions(version)
+
+    def _remove_old_versions(self, version):
+        # Keep the previous version for workers that have not switched yet;
+        # on POSIX, files still mapped by a worker stay valid after unlink
+        for name in os.listdir(self.directory):
+            if name.startswith('v') and '.' in name:
+                try:
+                    old = int(name[1:name.index('.')])
+                except ValueError:
+                    continue
+                if old < version - 1:
+                    os.remove(os.path.join(self.directory, name))
+
+    def build_from_db(self, db, only_if_missing=False, feed_sequence=None):
+        """Write a fresh snapshot of every enrolled user from Mongo; returns its version
+
+        feed_sequence, read from the enrollment feed before the users are,
+        marks where tailing the feed resumes after this snapshot.
+        """
+        with self._exclusive():
+            current = self.current_version()
+            if only_if_missing and current is not None:
+                return current
+            user_ids, usernames, embeddings = [], [], []
+            if self.model_version is None:
+                query = {'face_embedding': {'$exists': True, '$ne': None}}
+            else:
+                query = user_embedding_query(self.model_version, self.legacy_version)
+            for user in db.users.find(
+                query, {'username': 1, 'face_embedding': 1, 'face_embedding_version': 1, 'face_embeddings': 1}
+            ):
+                embedding = user['face_embedding'] if self.model_version is None else versioned_embedding(
+                    user, self.model_version, self.legacy_version
+                )
+                if embedding is None:
+                    continue
+                user_ids.append(str(user['_id']))
+                usernames.append(user['username'])
+                embeddings.append(embedding)
+            version = (current or 0) + 1
+            self._write_snapshot(version, user_ids, usernames, embeddings)
+            if feed_sequence is not None:
+                self._write_counter(FEED_SEQUENCE_FILE, feed_sequence)
+        logger.info(f"✅ Gallery v{version} built from Mongo: {len(user_ids)} users")
+        return version
+
+    def ensure(self, db, feed_sequence=None):
+        """Build the first snapshot from Mongo if none exists yet"""
+        if self.current_version() is None:
+            self.build_from_db(db, only_if_missing=True, feed_sequence=feed_sequence)
+
+    def _append_deltas(self, version, entries):
+        # Caller holds the exclusive lock
+        lines = ''.join(
+            json.dumps({
+                'user_id': str(entry['user_id']),
+                'username': entry['username'],
+                'embedding': [float(x) for x in entry['embedding']]
+            }) + '\n'
+            for entry in entries
+        )
+        with open(self._path(version, 'delta.jsonl'), 'a') as f:
+            f.write(lines)
+
+    def record_enrollment(self, user_id, username, embedding):
+        """Append a new or replaced user embedding to the live delta log"""
+        with self._exclusive():
+            version = self.current_version()
+            if version is None:
+                return  # the first snapshot will read it from Mongo
+            self._append_deltas(version, [
+                {'user_id': user_id, 'username': username, 'embedding': embedding}
+            ])
+
+    def apply_feed(self, entries):
+        """Append enrollment feed entries not applied yet; returns the applied sequence
+
+        Entries carry a 'seq'. Every worker on a host may tail the feed: the
+        sequence watermark is checked and advanced under the gallery lock,
+        so each entry lands in the delta log once.
+        """
+        with self._exclusive():
+            applied = self.applied_sequence() or 0
+            version = self.current_version()
+            if version is None:
+                return None
+            fresh = [entry for entry in entries if entry['seq'] > applied]
+            if fresh:
+                # Entries for other model versions only advance the watermark
+                own = [entry for entry in fresh if self.model_version is None
+                       or (entry.get('model_version') or self.legacy_version) == self.model_version]
+                if own:
+                    self._append_deltas(version, own)
+                applied = fresh[-1]['seq']
+                self._write_counter(FEED_SEQUENCE_FILE, applied)
+            return applied
+
+    def _read_deltas(self, version, offset):
+        """Complete delta entries after byte offset, and the new offset"""
+        entries = []
+        try:
+            with open(self._path(version, 'delta.jsonl'), 'rb') as f:
+                f.seek(offset)
+                data = f.read()
+        except FileNotFoundError:
+            return entries, offset
+        end = data.rfind(b'\n') + 1
+        for line in data[:end].splitlines():
+            if line.strip():
+                entries.append(json.loads(line))
+        return entries, offset + end
+
+    def _load_view(self, version):
+        embeddings = np.load(self._path(version, 'embeddings.npy'), mmap_mode='r')
+        user_ids = np.load(self._path(version, 'user_ids.npy'), mmap_mode='r')
+        usernames = np.load(self._path(version, 'usernames.npy'), mmap_mode='r')
+        codes = quantizer = None
+        if os.path.exists(self._path(version, 'pq_codes.npy')):
+            codes = np.load(self._path(version, 'pq_codes.npy'), mmap_mode='r')
+            quantizer = ProductQuantizer(np.load(self._path(version, 'pq_codebooks.npy')))
+        return GalleryView(version, embeddings, user_ids, usernames,
+                           codes=codes, quantizer=quantizer, rerank=self.pq_rerank)
+
+    def _extend(self, view, entries, offset):
+        overlay = {
+            user_id: (name, embedding)
+            for user_id, name, embedding in zip(view.overlay_ids, view.overlay_names, view.overlay_embeddings)
+        }
+        for entry in entries:
+            overlay[entry['user_id']] = (entry['username'], normalize_rows([entry['embedding']])[0])
+        if not overlay:
+            return view
+        return GalleryView(
+            view.version, view.embeddings, view.user_ids, view.usernames, offset,
+            list(overlay), [name for name, _ in overlay.values()],
+            np.stack([embedding for _, embedding in overlay.values()]).astype('float32'),
+            codes=view.codes, quantizer=view.quantizer, rerank=view.rerank, id_order=view.id_order
+        )
+
+    def view(self):
+        """The current GalleryView, refreshed at most every refresh_interval seconds"""
+        now = time.monotonic()
+        view = self._view
+        if view is not None and now - self._checked_at < self.refresh_interval:
+            return view
+        with self._lock:
+            view = self._view
+            version = self.current_version()
+            if version is None:
+                return None
+            if view is None or view.version != version:
+                view = self._load_view(version)
+            entries, offset = self._read_deltas(version, view.delta_offset)
+            if entries:
+                view = self._extend(view, entries, offset)
+            self._view = view
+            self._checked_at = now
+            return view
+
+    def pending_deltas(self):
+        """Number of delta entries in the live version's log"""
+        version = self.current_version()
+        if version is None:
+            return 0
+        try:
+            with open(self._path(version, 'delta.jsonl'), 'rb') as f:
+                return sum(1 for line in f if line.strip())
+        except FileNotFoundError:
+            return 0
+
+    def compact(self, min_deltas=1):
+        """Fold the live delta log into a new snapshot version; returns it or None"""
+        with self._exclusive():
+            version = self.current_version()
+            if version is None:
+                return None
+            entries, _ = self._read_deltas(version, 0)
+            if len(entries) < min_deltas:
+                return None
+            base = self._load_view(version)
+            merged = self._extend(base, entries, 0)
+            keep = np.ones(len(base.user_ids), dtype=bool)
+            keep[merged.masked_rows] = False
+            user_ids = [str(u) for u in np.asarray(base.user_ids)[keep]] + merged.overlay_ids
+            usernames = [str(u) for u in np.asarray(base.usernames)[keep]] + merged.overlay_names
+            embeddings = np.concatenate([np.asarray(base.embeddings)[keep], merged.overlay_embeddings])
+            codes = None
+            if base.codes is not None:
+                # Same codebooks: existing rows keep their codes, only new ones are encoded
+                codes = np.concatenate([np.asarray(base.codes)[:, keep], base.quantizer.encode(merged.overlay_embeddings)], axis=1)
+            self._write_snapshot(version + 1, user_ids, usernames, embeddings, quantizer=base.quantizer, codes=codes)
+        logger.info(f"✅ Gallery compacted to v{version + 1}: {len(user_ids)} users, {len(entries)} deltas folded")
+        return version + 1
+
+    def stats(self):
+        """Live version, size and delta backlog"""
+        view = self.view()
+        return {
+            'version': view.version if view is not None else None,
+            'users': len(view) if view is not None else 0,
+            'snapshot_rows': len(view.user_ids) if view is not None else 0,
+            'overlay_rows': len(view.overlay_ids) if view is not None else 0,
+            'pending_deltas': self.pending_deltas(),
+            'feed_sequence': self.applied_sequence(),
+            'model_version': self.model_version,
+            'pq': {
+                'subspaces': view.quantizer.subspaces,
+                'code_bytes_per_user': int(view.codes.shape[0]),
+                'exact_bytes_per_user': int(view.embeddings.shape[1] * view.embeddings.itemsize),
+                'rerank': view.rerank
+            } if view is not None and view.codes is not None else None
+        }
+
+
+class GalleryCompactor:
+    """Background thread folding delta logs into fresh snapshots
+
+    Every worker may run one; the gallery's file lock makes sure only one
+    compaction happens at a time and the others find nothing left to do.
+    """
+
+    def __init__(self, gallery, interval=30.0, min_deltas=100):
+        self.gallery = gallery
+        self.interval = interval
+        self.min_deltas = min_deltas
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='gallery-compactor', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.gallery.compact(min_deltas=self.min_deltas)
+            except Exception as e:
+                logger.error(f"❌ Gallery compaction failed: {e}")
+
+    def stop(self):
+        self._stop.set()
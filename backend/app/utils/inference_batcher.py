@@ -0,0 +1,182 @@
+import time
+import queue
+import logging
+import threading
+from concurrent.futures import Future
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Queued by stop(): the worker finishes what is ahead of it, then exits
+_STOP = object()
+
+
+class MicroBatcher:
+    """Cross-request dynamic micro-batching in front of an embedding runtime
+
+    Request threads submit preprocessed faces and block on a Future. A single
+    worker thread drains the shared queue into batches of up to
+    max_batch_size faces, waiting at most max_wait_ms after the first face
+    arrives, runs one forward pass and resolves each request's Future with
+    its rows. Only the worker thread ever touches the model, so runtimes
+    that are not safe for concurrent predict() calls (Keras) are fine.
+    """
+
+    # Histogram edges for queue-wait times, in milliseconds
+    WAIT_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 250, 500, 1000)
+
+    def __init__(self, embed_fn, max_batch_size=32, max_wait_ms=5.0):
+        self.embed_fn = embed_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+
+        self._queue = queue.Queue()
+        self._submit_lock = threading.Lock()
+        self._stopped = False
+        self._stats_lock = threading.Lock()
+        self._reset_stats()
+
+        self._worker = threading.Thread(target=self._run, name='inference-batcher', daemon=True)
+        self._worker.start()
+
+    def _reset_stats(self):
+        self._batch_sizes = {}
+        self._wait_counts = [0] * (len(self.WAIT_BUCKETS_MS) + 1)
+        self._wait_total_ms = 0.0
+        self._wait_max_ms = 0.0
+        self._faces = 0
+        self._batches = 0
+        self._requests = 0
+
+    def submit(self, faces):
+        """Queue a request's faces; the Future resolves to an (N, 128) array"""
+        faces = np.asarray(faces, dtype='float32')
+        future = Future()
+        if len(faces) == 0:
+            future.set_result(np.zeros((0, 128), dtype='float32'))
+            return future
+        # Each face is queued on its own so one big request cannot pin a batch
+        pending = _PendingRequest(future, len(faces))
+        enqueued_at = time.perf_counter()
+        with self._submit_lock:
+            if not self._stopped:
+                for row, face in enumerate(faces):
+                    self._queue.put((pending, row, face, enqueued_at))
+                return future
+        # Picked up this batcher just before it was replaced: no worker left to run it
+        try:
+            future.set_result(np.asarray(self.embed_fn(faces)))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def embed(self, faces, timeout=None):
+        """Blocking helper: submit and wait for the embeddings"""
+        return self.submit(faces).result(timeout=timeout)
+
+    def stop(self, timeout=None):
+        """Run the faces already queued, then end the worker thread"""
+        with self._submit_lock:
+            self._stopped = True
+            self._queue.put(_STOP)
+        self._worker.join(timeout)
+
+    def _collect_batch(self):
+        """(items, stopping): the next batch, and whether stop() was reached"""
+        item = self._queue.get()
+        if item is _STOP:
+            return [], True
+        items = [item]
+        deadline = time.perf_counter() + self.max_wait_ms / 1000.0
+        while len(items) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return items, True
+            items.append(item)
+        return items, False
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            items, stopping = self._collect_batch()
+            if not items:
+                continue
+            started_at = time.perf_counter()
+            self._record(items, started_at)
+
+            try:
+                embeddings = self.embed_fn(np.stack([item[2] for item in items]))
+            except Exception as e:
+                logger.error(f"❌ Batched inference failed: {e}")
+                for pending in {id(item[0]): item[0] for item in items}.values():
+                    pending.fail(e)
+                continue
+
+            for (pending, row, _, _), embedding in zip(items, embeddings):
+                pending.deliver(row, embedding)
+
+    def _record(self, items, started_at):
+        with self._stats_lock:
+            size = len(items)
+            self._batch_sizes[size] = self._batch_sizes.get(size, 0) + 1
+            self._batches += 1
+            self._faces += size
+            self._requests += len({id(item[0]) for item in items if item[1] == 0})
+            for item in items:
+                wait_ms = (started_at - item[3]) * 1000
+                self._wait_total_ms += wait_ms
+                self._wait_max_ms = max(self._wait_max_ms, wait_ms)
+                self._wait_counts[np.searchsorted(self.WAIT_BUCKETS_MS, wait_ms)] += 1
+
+    def stats(self, reset=False):
+        """Batch-size histogram and queue-wait distribution since the last reset"""
+        with self._stats_lock:
+            wait_labels = [f"<={edge}ms" for edge in self.WAIT_BUCKETS_MS]
+            wait_labels.append(f">{self.WAIT_BUCKETS_MS[-1]}ms")
+            result = {
+                'max_batch_size': self.max_batch_size,
+                'max_wait_ms': self.max_wait_ms,
+                'queue_depth': self._queue.qsize(),
+                'requests': self._requests,
+                'batches': self._batches,
+                'faces': self._faces,
+                'mean_batch_size': round(self._faces / self._batches, 2) if self._batches else 0.0,
+                'batch_size_histogram': {
+                    str(size): count for size, count in sorted(self._batch_sizes.items())
+                },
+                'queue_wait_ms': {
+                    'mean': round(self._wait_total_ms / self._faces, 3) if self._faces else 0.0,
+                    'max': round(self._wait_max_ms, 3),
+                    'histogram': dict(zip(wait_labels, self._wait_counts))
+                }
+            }
+            if reset:
+                self._reset_stats()
+            return result
+
+
+class _PendingRequest:
+    """Collects one request's rows as batches complete (worker thread only)"""
+
+    def __init__(self, future, count):
+        self.future = future
+        self.rows = [None] * count
+        self.remaining = count
+
+    def deliver(self, row, embedding):
+        if self.future.done():
+            return
+        self.rows[row] = embedding
+        self.remaining -= 1
+        if self.remaining == 0:
+            self.future.set_result(np.stack(self.rows))
+
+    def fail(self, error):
+        if not self.future.done():
+            self.future.set_exception(error)
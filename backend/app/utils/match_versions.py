@@ -0,0 +1,35 @@
+import logging
+from bson import ObjectId
+
+logger = logging.getLogger(__name__)
+
+# Per-user counter on the users document, bumped whenever a new group photo
+# match lands for that user. Cached /my-photos results and their ETags are
+# keyed by it, so a bump invalidates them on every node.
+MATCH_VERSION_FIELD = 'match_version'
+
+def get_match_version(db, user_id):
+    """Get the current match version of a user (0 if never matched)"""
+    user = db.users.find_one({'_id': ObjectId(user_id)}, {MATCH_VERSION_FIELD: 1})
+    if user is None:
+        return None
+    return user.get(MATCH_VERSION_FIELD, 0)
+
+def bump_match_versions(db, user_ids):
+    """Atomically increment the match version of every given user"""
+    if not user_ids:
+        return
+    try:
+        db.users.update_many(
+            {'_id': {'$in': [ObjectId(user_id) for user_id in user_ids]}},
+            {'$inc': {MATCH_VERSION_FIELD: 1}}
+        )
+    except Exception as e:
+        logger.error(f"❌ Failed to bump match versions: {e}")
+
+async def get_match_version_async(async_db, user_id):
+    """Async variant of get_match_version for the ASGI serving mode"""
+    user = await async_db.users.find_one({'_id': ObjectId(user_id)}, {MATCH_VERSION_FIELD: 1})
+    if user is None:
+        return None
+    return user.get(MATCH_VERSION_FIELD, 0)
@@ -0,0 +1,223 @@
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Bytes held per decoded pixel: the BGR image plus its RGB copy
+DECODED_BYTES_PER_PIXEL = 6
+
+# Extra bytes per pixel each detector needs while it runs. MTCNN builds a
+# float32 image pyramid (~2x the pixels at 3 channels x 4 bytes); YuNet
+# needs one more BGR copy; the stub needs nothing.
+DETECTOR_BYTES_PER_PIXEL = {
+    'mtcnn': 24,
+    'opencv_dnn': 4,
+    'stub': 0
+}
+
+# Face crops, preprocessed float32 inputs and embeddings are bounded by the
+# batch size rather than the image size
+FIXED_OVERHEAD_BYTES = 32 * 160 * 160 * 3 * 4 * 2
+
+# cv2.imread reductions. Only JPEG is decoded directly at the smaller scale;
+# other formats (PNG, BMP, WebP, ...) are decoded at full size and resized
+REDUCTION_FLAGS = {2: 'IMREAD_REDUCED_COLOR_2', 4: 'IMREAD_REDUCED_COLOR_4', 8: 'IMREAD_REDUCED_COLOR_8'}
+REDUCED_DECODE_FORMATS = ('JPEG', 'MPO')
+
+# Bytes per full-resolution pixel held while a format without reduced
+# decoding is decoded and resized: the full-size BGR image
+FULL_DECODE_BYTES_PER_PIXEL = 3
+
+
+class MemoryBudgetExceeded(Exception):
+    """Raised when an image could not be admitted within the timeout"""
+
+
+def read_image_header(image_path):
+    """Read (width, height, format) from the image header without decoding pixels
+
+    None if the header cannot be parsed or PIL flags the image as a
+    decompression bomb; such an image cannot be sized, so it must not be decoded.
+    """
+    from PIL import Image
+    try:
+        with Image.open(image_path) as image:
+            return image.size[0], image.size[1], image.format
+    except Image.DecompressionBombError as e:
+        logger.warning(f"⚠️ Refusing {image_path}: {e}")
+        return None
+    except Exception as e:
+        logger.warning(f"⚠️ Could not read image header of {image_path}: {e}")
+        return None
+
+
+def choose_reduction(width, height, max_pixels):
+    """Smallest decode reduction (1, 2, 4 or 8) that fits max_pixels"""
+    for factor in (1, 2, 4, 8):
+        if (width // factor) * (height // factor) <= max_pixels:
+            return factor
+    return 8
+
+
+def estimate_working_set(width, height, detector_name):
+    """Estimate peak bytes needed to detect and embed faces in an image"""
+    per_pixel = DECODED_BYTES_PER_PIXEL + DETECTOR_BYTES_PER_PIXEL.get(detector_name, 24)
+    return width * height * per_pixel + FIXED_OVERHEAD_BYTES
+
+
+def estimate_decode_working_set(width, height, image_format, reduction, detector_name):
+    """Estimate peak bytes for a full-resolution width x height image decoded at 1/reduction"""
+    estimate = estimate_working_set(width // reduction, height // reduction, detector_name)
+    if reduction > 1 and image_format not in REDUCED_DECODE_FORMATS:
+        # Decoded at full size first, so the reduction does not bound the decode
+        estimate += width * height * FULL_DECODE_BYTES_PER_PIXEL
+    return estimate
+
+
+def decode_image(image_path, reduction=1):
+    """Decode an image as BGR, optionally at 1/2, 1/4 or 1/8 resolution"""
+    import cv2
+    if reduction == 1:
+        return cv2.imread(image_path)
+    return cv2.imread(image_path, getattr(cv2, REDUCTION_FLAGS[reduction]))
+
+
+class MemoryBudget:
+    """Per-process byte budget for in-flight image processing
+
+    Work reserves its estimated working set before decoding and waits
+    (FIFO) while the budget is exhausted. A single reservation larger than
+    the whole budget is admitted only when nothing else is running.
+    """
+
+    def __init__(self, budget_bytes, timeout=30.0):
+        self.budget_bytes = budget_bytes
+        self.timeout = timeout
+        self._cond = threading.Condition()
+        self._tickets = []
+        self.in_use = 0
+        self.peak_in_use = 0
+        self.admitted = 0
+        self.timeouts = 0
+        self.reduced_decodes = 0
+        self.total_wait_s = 0.0
+        self.sampled_requests = 0
+        self.rss_delta_total = 0
+        self.rss_delta_max = 0
+
+    def record_rss(self, peak_delta_bytes):
+        """Record the RSS growth observed while one image was processed"""
+        with self._cond:
+            self.sampled_requests += 1
+            self.rss_delta_total += peak_delta_bytes
+            self.rss_delta_max = max(self.rss_delta_max, peak_delta_bytes)
+
+    def _fits(self, nbytes):
+        return self.in_use == 0 or self.in_use + nbytes <= self.budget_bytes
+
+    @contextmanager
+    def reserve(self, nbytes, reduced=False):
+        """Hold nbytes of the budget for the duration of the block"""
+        ticket = object()
+        start = time.monotonic()
+        with self._cond:
+            self._tickets.append(ticket)
+            try:
+                while self._tickets[0] is not ticket or not self._fits(nbytes):
+                    remaining = self.timeout - (time.monotonic() - start)
+                    if remaining <= 0:
+                        self.timeouts += 1
+                        raise MemoryBudgetExceeded(
+                            f"Could not reserve {nbytes / 2 ** 20:.0f} MB within {self.timeout:.0f}s"
+                        )
+                    self._cond.wait(remaining)
+            finally:
+                self._tickets.remove(ticket)
+                self._cond.notify_all()
+            self.in_use += nbytes
+            self.peak_in_use = max(self.peak_in_use, self.in_use)
+            self.admitted += 1
+            self.reduced_decodes += int(reduced)
+            self.total_wait_s += time.monotonic() - start
+        try:
+            yield
+        finally:
+            with self._cond:
+                self.in_use -= nbytes
+                self._cond.notify_all()
+
+    def stats(self):
+        """Budget usage and admission counters"""
+        with self._cond:
+            return {
+                'budget_mb': round(self.budget_bytes / 2 ** 20, 1),
+                'in_use_mb': round(self.in_use / 2 ** 20, 1),
+                'peak_in_use_mb': round(self.peak_in_use / 2 ** 20, 1),
+                'waiting': len(self._tickets),
+                'admitted': self.admitted,
+                'timeouts': self.timeouts,
+                'reduced_decodes': self.reduced_decodes,
+                'mean_wait_ms': round(self.total_wait_s * 1000 / self.admitted, 2) if self.admitted else 0.0,
+                'rss_peak_delta_mb': {
+                    'mean': round(self.rss_delta_total / self.sampled_requests / 2 ** 20, 1)
+                    if self.sampled_requests else 0.0,
+                    'max': round(self.rss_delta_max / 2 ** 20, 1)
+                }
+            }
+
+
+def current_rss_bytes():
+    """Resident set size of this process"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        import resource
+        # ru_maxrss is the high-water mark in KB; best available fallback
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class RSSSampler:
+    """Samples process RSS on a background thread while a block runs
+
+    RSS is process-wide, so with concurrent requests the peak includes
+    their memory too; the delta over the starting RSS is the useful signal.
+    Sampling starts a thread per block, so it is off (interval_ms=0, start
+    and end only) unless asked for while investigating memory use.
+    """
+
+    def __init__(self, interval_ms=0.0):
+        self.interval = interval_ms / 1000.0
+        self.start_rss = 0
+        self.peak_rss = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak_rss = max(self.peak_rss, current_rss_bytes())
+
+    def __enter__(self):
+        self.start_rss = self.peak_rss = current_rss_bytes()
+        if self.interval > 0:
+            self._thread = threading.Thread(target=self._sample, daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.peak_rss = max(self.peak_rss, current_rss_bytes())
+        return False
+
+    def report(self):
+        """Start, peak and peak-over-start RSS in MB"""
+        return {
+            'start_rss_mb': round(self.start_rss / 2 ** 20, 1),
+            'peak_rss_mb': round(self.peak_rss / 2 ** 20, 1),
+            'peak_delta_mb': round((self.peak_rss - self.start_rss) / 2 ** 20, 1)
+        }
@@ -0,0 +1,27 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Subsystems register a callable returning a JSON-serializable dict
+_providers = {}
+
+def register_metrics_provider(name, provider):
+    """Expose a subsystem's metrics under a name on /api/metrics"""
+    _providers[name] = provider
+
+def unregister_metrics_provider(name):
+    """Stop exposing a subsystem's metrics"""
+    _providers.pop(name, None)
+
+def collect_metrics(names=None):
+    """Collect metrics from every (or the named) registered provider"""
+    metrics = {}
+    for name, provider in list(_providers.items()):
+        if names and name not in names:
+            continue
+        try:
+            metrics[name] = provider()
+        except Exception as e:
+            logger.error(f"❌ Metrics provider '{name}' failed: {e}")
+            metrics[name] = {'error': str(e)}
+    return metrics
@@ -1,9 +1,35 @@
 import os
 import cv2
+import time
 import numpy as np
 import logging
-from mtcnn import MTCNN
+import threading
+from collections import Counter
+from contextlib import contextmanager
 from bson import ObjectId
+from app.utils.face_detectors import create_detector, detector_options
+from app.utils.face_embedders import create_embedder, embedder_options, preprocess_face
+from app.utils.face_quality import FaceQualityGate
+from app.utils.face_prefilter import create_face_prefilter
+from app.utils.video_tracking import FaceTracker, scan_video
+from app.utils.inference_batcher import MicroBatcher
+from app.utils.metrics import register_metrics_provider, unregister_metrics_provider
+from app.utils.match_versions import bump_match_versions
+from app.utils.user_stats import record_photo_stats, record_video_stats
+from app.utils.deadlines import RequestCancelled, cancellation_stats
+from app.utils.thread_budget import thread_budget, intra_op_threads
+from app.utils.ml_scheduler import MLScheduler, BULK
+from app.utils.storage import LocalBlobStore, photo_store
+from app.utils.gallery import Gallery, GalleryCompactor, ShardPool
+from app.utils.enrollment_feed import FeedTailer, publish_enrollment, latest_sequence
+from app.utils.db import get_client
+from app.utils.embedding_versions import (
+    ActiveVersionWatch, MIGRATIONS_COLLECTION, user_embedding_query, versioned_embedding
+)
+from app.utils.memory_budget import (
+    MemoryBudget, MemoryBudgetExceeded, RSSSampler, read_image_header, choose_reduction, estimate_working_set,
+    estimate_decode_working_set, decode_image
+)
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -11,118 +37,346 @@ logger = logging.getLogger(__name__)
 
 # Initialize models globally
 detector = None
-model = None
+embedder = None
+batcher = None
+ml_scheduler = None
+gallery = None
+gallery_compactor = None
+shard_pool = None
+feed_tailer = None
+memory_budget = None
+max_decode_pixels = None
+rss_sample_interval_ms = 0
+face_quality_gate = None
+face_prefilter = None
+video_settings = {}
+# Model version served by `embedder`, and the model being migrated to (if any)
+model_version = None
+legacy_model_version = None
+target_embedder = None
+target_model_version = None
+active_version_watch = None
+_settings = None
+_cut_over_lock = threading.Lock()
+_version_mismatch_logged = False
 
-def initialize_ml_models():
+# Faces embedded per batch when a request deadline is checked in between
+DEADLINE_EMBED_CHUNK = 8
+
+def _start_batcher(settings):
+    """(Re)create the micro-batcher in front of the serving embedder"""
+    global batcher
+    previous = batcher
+    if settings.INFERENCE_BATCHING_ENABLED:
+        batcher = MicroBatcher(
+            embedder.embed,
+            max_batch_size=settings.INFERENCE_MAX_BATCH_SIZE,
+            max_wait_ms=settings.INFERENCE_MAX_WAIT_MS
+        )
+        register_metrics_provider('inference_batcher', batcher.stats)
+        logger.info(
+            f"✅ Inference batching enabled (max batch {batcher.max_batch_size}, "
+            f"max wait {batcher.max_wait_ms} ms)"
+        )
+    else:
+        batcher = None
+        unregister_metrics_provider('inference_batcher')
+    # New requests already go to the new batcher; finish those queued on the old one
+    if previous is not None:
+        previous.stop()
+
+def _start_gallery(settings):
+    """(Re)create the gallery, compactor, shard pool and feed tailer for the serving model version"""
+    global gallery, gallery_compactor, shard_pool, feed_tailer
+    
+    # Enrolled embeddings are matched from a memory-mapped snapshot instead
+    # of reading every user from Mongo for each group photo
+    if gallery_compactor is not None:
+        gallery_compactor.stop()
+    if settings.GALLERY_SNAPSHOT_ENABLED:
+        gallery = Gallery(
+            os.path.join(settings.GALLERY_DIR, model_version),
+            refresh_interval=settings.GALLERY_REFRESH_INTERVAL_S,
+            model_version=model_version,
+            legacy_version=legacy_model_version,
+            pq_subspaces=settings.GALLERY_PQ_SUBSPACES if settings.GALLERY_PQ_ENABLED else None,
+            pq_min_users=settings.GALLERY_PQ_MIN_USERS,
+            pq_rerank=settings.GALLERY_PQ_RERANK,
+            pq_train_sample=settings.GALLERY_PQ_TRAIN_SAMPLE
+        )
+        gallery_compactor = GalleryCompactor(
+            gallery,
+            interval=settings.GALLERY_COMPACT_INTERVAL_S,
+            min_deltas=settings.GALLERY_COMPACT_MIN_DELTAS
+        )
+        register_metrics_provider('gallery', gallery.stats)
+    else:
+        gallery = None
+        gallery_compactor = None
+        unregister_metrics_provider('gallery')
+    
+    # Large galleries are searched in row-range shards on several threads
+    if shard_pool is not None:
+        shard_pool.shutdown()
+    budget = thread_budget()
+    shards = settings.GALLERY_MATCH_SHARDS or (budget.gallery_shards if budget else os.cpu_count() or 1)
+    if gallery is not None and shards > 1:
+        shard_pool = ShardPool(shards, min_rows=settings.GALLERY_SHARD_MIN_ROWS)
+        register_metrics_provider('gallery_shards', shard_pool.stats)
+    else:
+        shard_pool = None
+        unregister_metrics_provider('gallery_shards')
+    
+    # Other nodes' enrollments reach this node's gallery through the feed
+    if feed_tailer is not None:
+        feed_tailer.stop()
+    if gallery is not None and settings.GALLERY_FEED_ENABLED:
+        feed_tailer = FeedTailer(
+            get_client(settings.MONGO_URI).get_default_database(),
+            gallery,
+            poll_interval=settings.GALLERY_FEED_POLL_INTERVAL_S,
+            gap_timeout=settings.GALLERY_FEED_GAP_TIMEOUT_S,
+            retention_seconds=settings.GALLERY_FEED_RETENTION_S
+        ).start()
+        register_metrics_provider('enrollment_feed', feed_tailer.stats)
+    else:
+        feed_tailer = None
+        unregister_metrics_provider('enrollment_feed')
+
+def _load_target_embedder(settings):
+    """The model embeddings are being migrated to, or None"""
+    backend = settings.EMBEDDING_TARGET_BACKEND
+    if backend == 'synthetic':
+        # A differently seeded stand-in, as incompatible with the serving one as a real new model
+        options = embedder_options(settings, backend)
+        options['seed'] = settings.SYNTHETIC_SEED + 1
+        return create_embedder(backend, **options)
+    if not settings.EMBEDDING_TARGET_MODEL_PATH or not os.path.exists(settings.EMBEDDING_TARGET_MODEL_PATH):
+        raise FileNotFoundError(f"EMBEDDING_TARGET_MODEL_PATH not found: {settings.EMBEDDING_TARGET_MODEL_PATH}")
+    options = {'model_path': settings.EMBEDDING_TARGET_MODEL_PATH, 'batch_buckets': settings.EMBEDDING_BATCH_BUCKETS}
+    if backend == 'onnx':
+        options['intra_op_threads'] = intra_op_threads(settings.EMBEDDING_INTRA_OP_THREADS)
+    return create_embedder(backend, **options)
+
+def check_model_cut_over(db):
+    """Switch to the target model once the migration has made it the active version"""
+    global embedder, target_embedder, model_version, target_model_version, _version_mismatch_logged
+    active = active_version_watch.get(db)
+    if target_model_version is None or active != target_model_version:
+        if active != model_version and not _version_mismatch_logged:
+            # e.g. restarted with the old model after a cut-over elsewhere
+            logger.error(f"❌ Serving embedding model {model_version}, but the active version is {active}")
+            _version_mismatch_logged = True
+        return
+    with _cut_over_lock:
+        if target_model_version is None:
+            return
+        logger.info(f"🔁 Cutting over from embedding model {model_version} to {target_model_version}")
+        embedder, model_version = target_embedder, target_model_version
+        target_embedder, target_model_version = None, None
+        _start_batcher(_settings)
+        _start_gallery(_settings)
+
+def model_version_stats():
+    """Serving and target model versions, and the migration's progress"""
+    stats = {'serving_version': model_version, 'target_version': target_model_version, 'migration': None}
+    if target_model_version is not None:
+        db = get_client(_settings.MONGO_URI).get_default_database()
+        state = db[MIGRATIONS_COLLECTION].find_one({'_id': target_model_version})
+        if state:
+            stats['migration'] = {
+                'phase': state.get('phase'),
+                'processed': state.get('processed'),
+                'failed': state.get('failed'),
+                'updated_at': state['updated_at'].isoformat() if state.get('updated_at') else None
+            }
+    return stats
+
+def initialize_ml_models(settings=None):
     """Initialize ML models with proper error handling"""
-    global detector, model
+    global detector, embedder, ml_scheduler
+    global memory_budget, max_decode_pixels, rss_sample_interval_ms, face_quality_gate, face_prefilter, video_settings
+    global model_version, legacy_model_version, target_embedder, target_model_version, active_version_watch, _settings
+    
+    if settings is None:
+        from config import get_active_config
+        settings = get_active_config()
+    _settings = settings
     
     try:
-        # Initialize MTCNN detector
-        detector = MTCNN()
-        logger.info("✅ MTCNN detector initialized successfully")
+        # Initialize the configured face detector backend
+        backend = settings.FACE_DETECTOR_BACKEND
+        detector = create_detector(backend, **detector_options(settings, backend))
+        logger.info(f"✅ Face detector '{backend}' initialized successfully")
     except Exception as e:
-        logger.error(f"❌ Error initializing MTCNN: {e}")
+        logger.error(f"❌ Error initializing face detector: {e}")
         detector = None
 
-    # Try to load FaceNet model
+    # Load the FaceNet embedding runtime
     try:
-        from keras.models import load_model
-        import keras
-        
-        # Try multiple possible paths for the model
-        possible_paths = [
-            'facenet_keras.h5',
-            'models/facenet_keras.h5', 
-            'app/models/facenet_keras.h5',
-            os.path.join(os.path.dirname(__file__), '..', '..', 'facenet_keras.h5'),
-            os.path.join(os.path.dirname(__file__), '..', '..', 'models', 'facenet_keras.h5')
-        ]
-        
-        model_loaded = False
-        for model_path in possible_paths:
-            if os.path.exists(model_path):
-                try:
-                    # Try to enable unsafe deserialization
-                    try:
-                        keras.config.enable_unsafe_deserialization()
-                    except:
-                        pass
-                    
-                    model = load_model(model_path, safe_mode=False)
-                    logger.info(f"✅ FaceNet model loaded successfully from: {model_path}")
-                    model_loaded = True
-                    break
-                except Exception as load_error:
-                    logger.warning(f"⚠️ Failed to load model from {model_path}: {load_error}")
-                    continue
-        
-        if not model_loaded:
-            model = None
-            logger.warning("⚠️ FaceNet model not found in any expected location - using dummy embeddings")
-            
+        backend = settings.EMBEDDING_BACKEND
+        embedder = create_embedder(backend, **embedder_options(settings, backend))
+        logger.info(
+            f"✅ FaceNet '{backend}' runtime ({settings.EMBEDDING_PRECISION}) loaded from: {embedder.model_path}"
+        )
     except Exception as e:
-        logger.warning(f"⚠️ FaceNet not available: {e} - using dummy embeddings")
-        model = None
+        logger.warning(f"⚠️ FaceNet not available: {e} - using synthetic embeddings")
+        embedder = create_embedder('synthetic', **embedder_options(settings, 'synthetic'))
+    
+    # Every stored embedding is tagged with the model version that made it.
+    # While a target model is configured it is loaded too, and new faces
+    # are embedded with both (dual write) until the migration cuts over.
+    model_version = settings.EMBEDDING_MODEL_VERSION
+    legacy_model_version = settings.EMBEDDING_LEGACY_VERSION
+    target_embedder = None
+    target_model_version = None
+    if settings.EMBEDDING_TARGET_VERSION and settings.EMBEDDING_TARGET_VERSION != model_version:
+        try:
+            target_embedder = _load_target_embedder(settings)
+            target_model_version = settings.EMBEDDING_TARGET_VERSION
+            logger.info(f"✅ Target embedding model '{target_model_version}' loaded, writing both versions")
+        except Exception as e:
+            logger.error(f"❌ Target embedding model '{settings.EMBEDDING_TARGET_VERSION}' not available: {e}")
+    active_version_watch = ActiveVersionWatch(model_version, interval=settings.EMBEDDING_VERSION_CHECK_INTERVAL_S)
+    register_metrics_provider('embedding_models', model_version_stats)
+
+    # Funnel inference from all request threads through one batching queue
+    _start_batcher(settings)
+    
+    # Interactive work goes ahead of bulk work, with per-user fair share
+    budget = thread_budget()
+    if budget is not None:
+        register_metrics_provider('thread_budget', budget.stats)
+    ml_scheduler = MLScheduler(
+        settings.ML_SCHEDULER_SLOTS or (budget.ml_slots if budget else os.cpu_count() or 1),
+        max_per_user=settings.ML_SCHEDULER_MAX_PER_USER,
+        aging_s=settings.ML_SCHEDULER_AGING_S,
+        timeout=settings.ML_SCHEDULER_TIMEOUT
+    )
+    register_metrics_provider('ml_scheduler', ml_scheduler.stats)
+    
+    _start_gallery(settings)
+    
+    # Admission control: images reserve their estimated working set before decoding
+    memory_budget = MemoryBudget(
+        settings.MEMORY_BUDGET_MB * 1024 * 1024, timeout=settings.MEMORY_ADMISSION_TIMEOUT
+    )
+    max_decode_pixels = settings.MAX_DECODE_PIXELS
+    rss_sample_interval_ms = settings.RSS_SAMPLE_INTERVAL_MS
+    register_metrics_provider('memory_budget', memory_budget.stats)
+    
+    # Tiny, blurred, low-confidence or turned-away faces are not embedded
+    if settings.FACE_QUALITY_ENABLED:
+        face_quality_gate = FaceQualityGate(
+            min_size=settings.FACE_QUALITY_MIN_SIZE,
+            min_confidence=settings.FACE_QUALITY_MIN_CONFIDENCE,
+            min_sharpness=settings.FACE_QUALITY_MIN_SHARPNESS,
+            max_yaw=settings.FACE_QUALITY_MAX_YAW,
+            max_roll=settings.FACE_QUALITY_MAX_ROLL,
+            action=settings.FACE_QUALITY_ACTION
+        )
+        register_metrics_provider('face_quality', face_quality_gate.stats)
+    else:
+        face_quality_gate = None
+        unregister_metrics_provider('face_quality')
+    
+    # Face-free group photos (scenery, food, slides) are screened out by
+    # cascades on a thumbnail before the detector runs
+    face_prefilter = None
+    if settings.FACE_PREFILTER_ENABLED:
+        try:
+            face_prefilter = create_face_prefilter(settings)
+            logger.info(
+                f"✅ Face prefilter enabled ({face_prefilter.action}, min_neighbors {face_prefilter.min_neighbors})"
+            )
+        except Exception as e:
+            logger.warning(f"⚠️ Face prefilter not available: {e} - detecting on every image")
+    if face_prefilter is not None:
+        register_metrics_provider('face_prefilter', face_prefilter.stats)
+    else:
+        unregister_metrics_provider('face_prefilter')
+    
+    # Event video keyframe spacing and tracking
+    video_settings = {
+        'min_interval_s': settings.VIDEO_MIN_KEYFRAME_INTERVAL_S,
+        'max_interval_s': settings.VIDEO_MAX_KEYFRAME_INTERVAL_S,
+        'iou_threshold': settings.VIDEO_TRACK_IOU_THRESHOLD,
+        'max_missed': settings.VIDEO_TRACK_MAX_MISSED,
+        'min_track_hits': settings.VIDEO_MIN_TRACK_HITS,
+        'optical_flow': settings.VIDEO_OPTICAL_FLOW
+    }
 
 # Initialize models on import
 initialize_ml_models()
 
-def preprocess_face(face_img):
-    """Preprocess face for FaceNet input - Updated with standalone logic"""
+def run_scheduled(job_class, user_id, fn, *args, deadline=None, **kwargs):
+    """Run an ML job once the scheduler grants it a slot (raises SchedulerBusy)
+    
+    A request deadline also bounds the wait for a slot and is passed on to
+    fn, which checks it between stages (both raise RequestCancelled).
+    """
+    if deadline is None:
+        return ml_scheduler.run(job_class, user_id, fn, *args, **kwargs)
+    with ml_scheduler.slot(job_class, user_id, request_deadline=deadline):
+        return fn(*args, deadline=deadline, **kwargs)
+
+def get_embeddings(faces):
+    """Get FaceNet embeddings for a list of preprocessed faces in one batch"""
+    if not faces:
+        return []
+    
     try:
-        if face_img is None or face_img.size == 0:
-            return np.zeros((160, 160, 3))
-            
-        # Resize to FaceNet input size
-        face_resized = cv2.resize(face_img, (160, 160))
-        
-        # Normalize to [0, 1]
-        face_normalized = face_resized.astype('float32') / 255.0
+        # Batched forward pass (shared with other requests when batching is
+        # enabled), returned as lists for JSON serialization
+        runner = batcher.embed if batcher is not None else embedder.embed
+        return runner(np.stack(faces)).tolist()
         
-        # Standardize (zero mean, unit variance)
-        mean, std = face_normalized.mean(), face_normalized.std()
-        if std > 0:
-            face_normalized = (face_normalized - mean) / std
-            
-        return face_normalized
     except Exception as e:
-        logger.error(f"Error preprocessing face: {e}")
-        return np.zeros((160, 160, 3))
+        logger.error(f"Error getting embeddings: {e}")
+        # No embedding rather than a shared fallback vector that would match everyone
+        return [None] * len(faces)
 
-def get_embedding(face_pixels):
-    """Get face embedding from FaceNet model - Updated with standalone logic"""
+def get_target_embeddings(faces):
+    """Embeddings from the model being migrated to, in one batch (None if there is none)"""
+    model = target_embedder
+    if model is None or not faces:
+        return None
     try:
-        if model is None:
-            # Return consistent dummy embedding based on face pixels
-            face_hash = hash(str(face_pixels.flatten()[:10].tolist()))
-            np.random.seed(abs(face_hash) % 2147483647)
-            return np.random.random(128).tolist()
-        
-        # Ensure correct data type
-        face_pixels = face_pixels.astype('float32')
-        
-        # Add batch dimension
-        sample = np.expand_dims(face_pixels, axis=0)
-        
-        # Get embedding from model
-        embedding = model.predict(sample, verbose=0)
-        
-        # Return as list for JSON serialization
-        return embedding[0].tolist()
-        
+        return model.embed(np.stack(faces)).tolist()
     except Exception as e:
-        logger.error(f"Error getting embedding: {e}")
-        # Fallback dummy embedding
-        np.random.seed(42)
-        return np.random.random(128).tolist()
+        logger.error(f"Error getting target model embeddings: {e}")
+        return [None] * len(faces)
+
+def get_embedding(face_pixels):
+    """Get face embedding from FaceNet model - Updated with standalone logic"""
+    return get_embeddings([face_pixels])[0]
 
-def detect_faces(image_path):
-    """Detect faces in image and return face data - Updated with standalone logic"""
+def detect_faces(image_path, report=None, quality_gate=True, prefilter=True, deadline=None):
+    """Detect faces in image and return face data - Updated with standalone logic
+    
+    The image header is read first to estimate the working set; the image is
+    only decoded once that much of the process memory budget is reserved,
+    and not at all if the header cannot be read or describes a decompression bomb.
+    Images above MAX_DECODE_PIXELS are decoded at 1/2, 1/4 or 1/8 scale and
+    their boxes scaled back to full-resolution coordinates. If `report` is a
+    dict it receives the admission and peak RSS figures for this image.
+    
+    With quality_gate (and FACE_QUALITY_ENABLED), faces failing the quality
+    checks are not embedded; report['quality'] then holds the skip counts
+    and, with FACE_QUALITY_ACTION=defer, the skipped faces themselves.
+    
+    With prefilter (and FACE_PREFILTER_ENABLED), images the cascades find
+    face-free are not run through the detector, and with action 'roi' the
+    detector only sees the regions around cascade hits; report['prefilter']
+    then holds the decision.
+    
+    With a deadline, decoding, detection and each embedding chunk only
+    start while it has not passed (raises RequestCancelled otherwise).
+    """
     logger.info(f"🔍 Starting face detection for: {image_path}")
     
     if detector is None:
-        logger.error("❌ MTCNN detector not available")
+        logger.error("❌ Face detector not available")
         return []
     
     try:
@@ -130,76 +384,188 @@ def detect_faces(image_path):
         if not os.path.exists(image_path):
             logger.error(f"❌ Image file not found: {image_path}")
             return []
+        if deadline is not None:
+            deadline.check('decode')
         
-        logger.info(f"📂 Loading image from: {image_path}")
-        
-        # Read image
-        image = cv2.imread(image_path)
-        if image is None:
-            logger.error(f"❌ Could not load image: {image_path}")
+        # Size the work from the header, before any pixels are decoded
+        header = read_image_header(image_path)
+        if header is None:
+            # Unsized images could need any amount of memory to decode
+            logger.error(f"❌ Not decoding {image_path}: its size could not be read safely")
             return []
+        width, height, image_format = header
+        reduction = choose_reduction(width, height, max_decode_pixels)
+        estimate = estimate_decode_working_set(width, height, image_format, reduction, detector.name)
         
-        logger.info(f"✅ Image loaded successfully. Shape: {image.shape}")
+        with memory_budget.reserve(estimate, reduced=reduction > 1), \
+                RSSSampler(rss_sample_interval_ms) as rss:
+            quality = {} if quality_gate and face_quality_gate is not None else None
+            screening = {} if prefilter and face_prefilter is not None else None
+            faces_data = _detect_faces_in_image(image_path, reduction, quality, screening, deadline)
         
-        # Convert BGR to RGB (like standalone script)
-        rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-        logger.info("✅ Image converted to RGB")
-        
-        # Detect faces using MTCNN
-        logger.info("🔍 Running MTCNN face detection...")
-        results = detector.detect_faces(rgb_image)
-        
-        if not results:
-            logger.warning("⚠️ No faces detected in image")
-            return []
-        
-        logger.info(f"✅ MTCNN detected {len(results)} faces")
-        
-        faces_data = []
-        for i, res in enumerate(results):
-            try:
-                # Extract bounding box
-                x, y, w, h = res['box']
-                x, y = max(0, x), max(0, y)
-                
-                # Ensure face is within image bounds
-                h_img, w_img = rgb_image.shape[:2]
-                x = min(x, w_img - 1)
-                y = min(y, h_img - 1)
-                w = min(w, w_img - x)
-                h = min(h, h_img - y)
-                
-                if w <= 0 or h <= 0:
-                    logger.warning(f"⚠️ Invalid face dimensions for face {i}: {w}x{h}")
-                    continue
-                
-                # Extract face region (like standalone script)
-                face = rgb_image[y:y+h, x:x+w]
-                logger.info(f"✅ Face {i} extracted. Shape: {face.shape}")
-                
-                # Preprocess and get embedding
-                face_processed = preprocess_face(face)
-                embedding = get_embedding(face_processed)
-                logger.info(f"✅ Successfully processed face {i}")
-                
-                faces_data.append({
-                    'face_index': i,
-                    'bbox': [int(x), int(y), int(w), int(h)],
-                    'confidence': float(res['confidence']),
-                    'embedding': embedding
-                })
-                
-            except Exception as e:
-                logger.error(f"❌ Error processing face {i}: {e}")
-                continue
-        
-        logger.info(f"✅ Successfully processed {len(faces_data)} faces")
+        memory = dict(rss.report(), estimated_mb=round(estimate / 2 ** 20, 1), reduction=reduction)
+        memory_budget.record_rss(rss.peak_rss - rss.start_rss)
+        logger.info(
+            f"📈 {image_path}: {width}x{height} decoded at 1/{reduction}, "
+            f"estimated {memory['estimated_mb']} MB, peak RSS +{memory['peak_delta_mb']} MB"
+        )
+        if report is not None:
+            report.update(memory)
+            if quality is not None:
+                report['quality'] = quality
+            if screening is not None:
+                report['prefilter'] = screening
         return faces_data
         
+    except MemoryBudgetExceeded:
+        # Not "no faces": let callers report the photo as not processed
+        logger.error(f"❌ Memory budget exhausted, not processing {image_path}")
+        raise
+    except RequestCancelled:
+        raise
     except Exception as e:
         logger.error(f"❌ Error detecting faces in {image_path}: {e}")
         return []
 
+def _detect_faces_in_image(image_path, reduction=1, quality=None, screening=None, deadline=None):
+    """Decode (optionally reduced), detect, crop and embed; boxes in full-resolution coordinates
+    
+    If `quality` is a dict, faces are run through the quality gate before
+    embedding and the dict receives what the gate skipped. If `screening` is
+    a dict, the prefilter decides where the detector runs and the dict
+    receives its decision. A deadline is checked before detection and
+    before each embedding chunk.
+    """
+    logger.info(f"📂 Loading image from: {image_path}")
+    
+    # Read image
+    image = decode_image(image_path, reduction)
+    if image is None:
+        logger.error(f"❌ Could not load image: {image_path}")
+        return []
+    
+    logger.info(f"✅ Image loaded successfully. Shape: {image.shape}")
+    
+    # Cascades on a grayscale thumbnail, before the color conversion
+    if screening is not None:
+        started = time.perf_counter()
+        decision, regions = face_prefilter.plan(image)
+        audit = face_prefilter.should_audit()
+        screening.update(decision=decision, regions=len(regions), audited=audit,
+                         screen_ms=round((time.perf_counter() - started) * 1000, 2))
+        if decision == 'skip' and not audit:
+            logger.info("🔍 Prefilter found no face candidates, skipping detection")
+            return []
+    
+    # Convert BGR to RGB (like standalone script)
+    rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+    del image
+    logger.info("✅ Image converted to RGB")
+    
+    # Detect faces using the configured backend
+    if deadline is not None:
+        deadline.check('detect')
+    logger.info(f"🔍 Running {detector.name} face detection...")
+    if screening is None:
+        results = detector.detect(rgb_image)
+    elif audit:
+        # Full detection, checked against what the prefilter planned
+        results = face_prefilter.detect_full(detector.detect, rgb_image)
+        face_prefilter.record_audit(decision, regions, results)
+    else:
+        results = face_prefilter.detect(detector.detect, rgb_image, decision, regions)
+    
+    if not results:
+        logger.warning("⚠️ No faces detected in image")
+        return []
+    
+    logger.info(f"✅ {detector.name} detected {len(results)} faces")
+    
+    faces_data = []
+    crops = []
+    for i, res in enumerate(results):
+        try:
+            # Extract bounding box
+            x, y, w, h = res['box']
+            x, y = max(0, x), max(0, y)
+            
+            # Ensure face is within image bounds
+            h_img, w_img = rgb_image.shape[:2]
+            x = min(x, w_img - 1)
+            y = min(y, h_img - 1)
+            w = min(w, w_img - x)
+            h = min(h, h_img - y)
+            
+            if w <= 0 or h <= 0:
+                logger.warning(f"⚠️ Invalid face dimensions for face {i}: {w}x{h}")
+                continue
+            
+            # Extract face region (like standalone script)
+            crops.append(rgb_image[y:y+h, x:x+w])
+            logger.info(f"✅ Face {i} extracted. Shape: {crops[-1].shape}")
+            
+            keypoints = res.get('keypoints')
+            if keypoints and reduction > 1:
+                keypoints = {name: [int(px * reduction), int(py * reduction)] for name, (px, py) in keypoints.items()}
+            faces_data.append({
+                'face_index': i,
+                'bbox': [int(x * reduction), int(y * reduction), int(w * reduction), int(h * reduction)],
+                'confidence': float(res['confidence']),
+                'keypoints': keypoints
+            })
+            
+        except Exception as e:
+            logger.error(f"❌ Error processing face {i}: {e}")
+            continue
+    
+    # Drop (or set aside) faces not worth an embedding before preprocessing them
+    if quality is not None and faces_data:
+        keep, reasons, scores = face_quality_gate.assess(
+            [f['bbox'] for f in faces_data],
+            [f['confidence'] for f in faces_data],
+            [f['keypoints'] for f in faces_data],
+            crops
+        )
+        skipped = [dict(f, quality=score, skip_reason=reason)
+                   for f, reason, score in zip(faces_data, reasons, scores) if reason is not None]
+        quality['assessed'] = len(faces_data)
+        quality['skipped'] = len(skipped)
+        quality['skipped_by_reason'] = dict(Counter(f['skip_reason'] for f in skipped))
+        if face_quality_gate.action == 'defer':
+            quality['deferred_faces'] = skipped
+        if skipped:
+            logger.info(f"🔍 Quality gate skipped {len(skipped)} of {len(faces_data)} faces: {quality['skipped_by_reason']}")
+        faces_data = [f for f, kept in zip(faces_data, keep) if kept]
+        crops = [crop for crop, kept in zip(crops, keep) if kept]
+    
+    # Get embeddings for every extracted face in one batch
+    serving_version, migrating_to = model_version, target_model_version
+    if deadline is not None:
+        deadline.check('embed')
+    processed_faces = [preprocess_face(crop) for crop in crops]
+    started = time.perf_counter()
+    if deadline is None:
+        embeddings = get_embeddings(processed_faces)
+    else:
+        # In chunks, so a request abandoned half-way stops paying for inference
+        embeddings = []
+        for start in range(0, len(processed_faces), DEADLINE_EMBED_CHUNK):
+            deadline.check('embed')
+            embeddings.extend(get_embeddings(processed_faces[start:start + DEADLINE_EMBED_CHUNK]))
+    if quality is not None and crops:
+        face_quality_gate.record_embedding(len(crops), time.perf_counter() - started)
+    # Dual write during a model migration: both versions for every face
+    target_embeddings = get_target_embeddings(processed_faces) if migrating_to else None
+    for i, (face_data, embedding) in enumerate(zip(faces_data, embeddings)):
+        face_data['embedding'] = embedding
+        face_data['embedding_version'] = serving_version
+        if target_embeddings is not None and target_embeddings[i] is not None:
+            face_data['embeddings'] = {serving_version: embedding, migrating_to: target_embeddings[i]}
+    faces_data = [f for f in faces_data if f['embedding'] is not None]
+    
+    logger.info(f"✅ Successfully processed {len(faces_data)} faces")
+    return faces_data
+
 def cosine_similarity(vec1, vec2):
     """Calculate cosine similarity between two vectors - Updated with standalone logic"""
     try:
@@ -227,7 +593,8 @@ def process_profile_photo(filepath, user_id):
     logger.info(f"👤 Processing profile photo: {filepath}")
     
     try:
-        faces_data = detect_faces(filepath)
+        # The quality gate is for crowds; a profile photo keeps its one face
+        faces_data = detect_faces(filepath, quality_gate=False, prefilter=False)
         
         if not faces_data:
             logger.warning(f"⚠️ No faces detected in profile photo: {filepath}")
@@ -241,10 +608,13 @@ def process_profile_photo(filepath, user_id):
         # Use the first (or most confident) face
         face_embedding = faces_data[0]['embedding']
         confidence = faces_data[0]['confidence']
+        version = faces_data[0]['embedding_version']
         
         logger.info(f"✅ Profile photo processed successfully: {len(face_embedding)}-D embedding, confidence: {confidence:.2f}")
         return {
             'embedding': face_embedding,
+            'model_version': version,
+            'embeddings': faces_data[0].get('embeddings') or {version: face_embedding},
             'confidence': confidence,
             'faces_detected': len(faces_data)
         }
@@ -253,90 +623,191 @@ def process_profile_photo(filepath, user_id):
         logger.error(f"❌ Error processing profile photo {filepath}: {e}")
         return None
 
-def process_group_photo(filepath, photo_id, db):
-    """Process group photo, detect faces, and find matches - Updated with better similarity logic"""
+def match_faces_from_db(faces_data, db):
+    """Best matching user per face, comparing against every user in Mongo"""
+    # Get all users with face embeddings of the serving model version
+    version = model_version
+    users_with_embeddings = list(db.users.find(user_embedding_query(version, legacy_model_version)))
+    
+    logger.info(f"📊 Found {len(users_with_embeddings)} users with embeddings")
+    
+    face_matches = []
+    # Check each detected face against all user embeddings
+    for face_data in faces_data:
+        face_embedding = versioned_embedding(face_data, version, legacy_model_version, field='embedding')
+        best_match = None
+        best_similarity = 0.0
+        
+        for user in users_with_embeddings:
+            user_embedding = versioned_embedding(user, version, legacy_model_version)
+            if face_embedding is not None and user_embedding:
+                similarity = cosine_similarity(face_embedding, user_embedding)
+                
+                # Updated threshold - you can adjust this
+                if similarity > 0.6 and similarity > best_similarity:  # Raised threshold to 0.6
+                    best_similarity = similarity
+                    best_match = {
+                        'user_id': str(user['_id']),
+                        'username': user['username'],
+                        'similarity': round(similarity, 3)
+                    }
+        
+        face_matches.append(best_match)
+    return face_matches
+
+def match_faces(faces_data, db):
+    """Best user above the 0.6 threshold per face, from the gallery when enabled
+    
+    Faces are compared in the serving model version's embedding space; during
+    a migration they carry both versions, so a cut-over between embedding and
+    matching is harmless.
+    """
+    check_model_cut_over(db)
+    current_gallery = gallery
+    if current_gallery is None:
+        return match_faces_from_db(faces_data, db)
+    if current_gallery.current_version() is None:
+        current_gallery.ensure(db, feed_sequence=latest_sequence(db) if feed_tailer is not None else None)
+    view = current_gallery.view()
+    version = current_gallery.model_version
+    embeddings = [versioned_embedding(f, version, legacy_model_version, field='embedding') for f in faces_data]
+    logger.info(f"📊 Matching against gallery v{view.version} ({len(view)} users, model {version})")
+    matchable = [i for i, embedding in enumerate(embeddings) if embedding is not None]
+    matches = view.best_matches([embeddings[i] for i in matchable], threshold=0.6, pool=shard_pool)
+    face_matches = [None] * len(faces_data)
+    for i, match in zip(matchable, matches):
+        face_matches[i] = match
+    return face_matches
+
+def record_enrollment(db, user_id, username, embeddings):
+    """Make a new profile embedding visible to matching on every node
+    
+    embeddings maps model version to embedding; during a migration both
+    versions are published so either gallery can serve the user.
+    """
+    check_model_cut_over(db)
+    if gallery is None:
+        return
+    try:
+        if feed_tailer is not None:
+            # Publish for all nodes, then apply the feed so the uploader's own
+            # node normally sees it straight away. Not if an earlier entry is
+            # still missing: then it is applied once that gap closes or times out
+            for version, embedding in embeddings.items():
+                publish_enrollment(db, user_id, username, embedding, model_version=version)
+            feed_tailer.sync_once()
+        elif gallery.model_version in embeddings:
+            gallery.record_enrollment(user_id, username, embeddings[gallery.model_version])
+    except Exception as e:
+        logger.error(f"❌ Could not record enrollment in gallery: {e}")
+
+def process_group_photo(filepath, photo_id, db, deadline=None):
+    """Process group photo, detect faces, and find matches - Updated with better similarity logic
+    
+    With a deadline, every stage up to the database update checks it first;
+    a cancelled run raises RequestCancelled having written nothing, so the
+    caller can roll the upload back for a retry.
+    """
     logger.info(f"👥 Processing group photo: {filepath}")
+    cpu_started = time.thread_time()
     
     try:
         # Detect all faces in group photo
-        faces_data = detect_faces(filepath)
+        memory = {}
+        faces_data = detect_faces(filepath, report=memory, deadline=deadline)
+        quality = memory.pop('quality', None)
+        screening = memory.pop('prefilter', None)
+        deferred_faces = (quality or {}).pop('deferred_faces', [])
         
         if not faces_data:
             logger.warning(f"⚠️ No faces detected in group photo: {filepath}")
+            if deferred_faces:
+                db.group_photos.update_one(
+                    {'_id': ObjectId(photo_id)},
+                    {'$set': {'faces_skipped': len(deferred_faces), 'deferred_faces': deferred_faces}}
+                )
+            cancellation_stats.record_completed(time.thread_time() - cpu_started)
             return {
                 'faces_detected': 0,
                 'matches_found': 0,
                 'face_data': [],
                 'matched_users': [],
+                'memory': memory,
+                'quality': quality,
+                'prefilter': screening,
                 'processing_success': True,
                 'error': None
             }
         
-        # Get all users with face embeddings
-        users_with_embeddings = list(db.users.find({
-            'face_embedding': {'$exists': True, '$ne': None}
-        }))
-        
-        logger.info(f"📊 Found {len(users_with_embeddings)} users with embeddings")
-        
         matches_found = 0
         matched_users = []
         
-        # Check each detected face against all user embeddings
-        for face_data in faces_data:
-            face_embedding = face_data['embedding']
-            best_match = None
-            best_similarity = 0.0
-            
-            for user in users_with_embeddings:
-                if user.get('face_embedding'):
-                    similarity = cosine_similarity(face_embedding, user['face_embedding'])
-                    
-                    # Updated threshold - you can adjust this
-                    if similarity > 0.6 and similarity > best_similarity:  # Raised threshold to 0.6
-                        best_similarity = similarity
-                        best_match = {
-                            'user_id': str(user['_id']),
-                            'username': user['username'],
-                            'similarity': round(similarity, 3)
-                        }
-            
+        # Best user above the 0.6 threshold for every face
+        if deadline is not None:
+            deadline.check('match')
+        face_matches = match_faces(faces_data, db)
+        
+        for face_data, best_match in zip(faces_data, face_matches):
             if best_match:
                 face_data['matched_user'] = best_match
                 # Avoid duplicate users in matched_users list
                 if best_match['user_id'] not in [m['user_id'] for m in matched_users]:
                     matched_users.append(best_match)
                     matches_found += 1
-                    logger.info(f"✅ Match found: {best_match['username']} (similarity: {best_similarity:.3f})")
+                    logger.info(f"✅ Match found: {best_match['username']} (similarity: {best_match['similarity']:.3f})")
+        
+        # Last chance to stop: past this point the results are stored
+        if deadline is not None:
+            deadline.check('store')
         
         # Update group photo document with face data and matches
         try:
-            db.group_photos.update_one(
+            previous = db.group_photos.find_one_and_update(
                 {'_id': ObjectId(photo_id)},
                 {
                     '$set': {
                         'faces_detected': faces_data,
+                        'embedding_versions': sorted(set.intersection(
+                            *(set(f.get('embeddings') or [f['embedding_version']]) for f in faces_data)
+                        )),
                         'processed': True,
                         'matches_count': matches_found,
-                        'matched_users': matched_users
+                        'matched_users': matched_users,
+                        'faces_skipped': (quality or {}).get('skipped', 0),
+                        'deferred_faces': deferred_faces
                     }
-                }
+                },
+                projection={'uploaded_by': 1, 'upload_date': 1, 'processed': 1}
             )
             logger.info("✅ Group photo data updated in database")
+            
+            # Materialized per-user counters, counted once per photo
+            if previous is not None and not previous.get('processed'):
+                record_photo_stats(db, previous, faces_data)
+            
+            # Invalidate cached /my-photos results of the matched users
+            bump_match_versions(db, [m['user_id'] for m in matched_users])
         except Exception as db_error:
             logger.error(f"❌ Database update error: {db_error}")
         
         logger.info(f"✅ Group photo processed: {len(faces_data)} faces, {matches_found} matches")
+        cancellation_stats.record_completed(time.thread_time() - cpu_started)
         
         return {
             'faces_detected': len(faces_data),
             'matches_found': matches_found,
             'face_data': faces_data,
             'matched_users': matched_users,
+            'memory': memory,
+            'quality': quality,
+            'prefilter': screening,
             'processing_success': True,
             'error': None
         }
         
+    except RequestCancelled as e:
+        e.cpu_seconds = time.thread_time() - cpu_started
+        raise
     except Exception as e:
         logger.error(f"❌ Error processing group photo {filepath}: {e}")
         return {
@@ -348,31 +819,257 @@ def process_group_photo(filepath, photo_id, db):
             'error': str(e)
         }
 
+def process_event_video(filepath, video_id, db):
+    """Index an event video: track faces across keyframes, embed and match once per track
+    
+    Detection only runs on keyframes, spaced adaptively between
+    VIDEO_MIN_KEYFRAME_INTERVAL_S and VIDEO_MAX_KEYFRAME_INTERVAL_S; faces are
+    followed between them by the IoU/optical-flow tracker and only the best
+    crop of each track is embedded. With the quality gate enabled, tracks
+    whose best crop still fails it are not embedded.
+    """
+    logger.info(f"🎬 Processing event video: {filepath}")
+    
+    if detector is None:
+        logger.error("❌ Face detector not available")
+        return {'tracks': [], 'matched_users': [], 'processing_success': False, 'error': 'Face detector not available'}
+    
+    try:
+        capture = cv2.VideoCapture(filepath)
+        width = int(capture.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        capture.release()
+        
+        # One frame is in flight at a time
+        tracker = FaceTracker(
+            iou_threshold=video_settings['iou_threshold'],
+            max_missed=video_settings['max_missed'],
+            optical_flow=video_settings['optical_flow']
+        )
+        with memory_budget.reserve(estimate_working_set(width, height, detector.name)):
+            tracks, stats = scan_video(
+                filepath, detector.detect, tracker,
+                min_interval_s=video_settings['min_interval_s'],
+                max_interval_s=video_settings['max_interval_s']
+            )
+        tracks = [t for t in tracks if t.hits >= video_settings['min_track_hits'] and t.best is not None]
+        
+        if tracks and face_quality_gate is not None:
+            keep, _, _ = face_quality_gate.assess(
+                [t.best['box'] for t in tracks],
+                [t.best['confidence'] for t in tracks],
+                [t.best['keypoints'] for t in tracks],
+                [t.best['crop'] for t in tracks]
+            )
+            stats['tracks_skipped'] = int((~keep).sum())
+            tracks = [t for t, kept in zip(tracks, keep) if kept]
+        
+        # One embedding per track, in a single batch
+        started = time.perf_counter()
+        embeddings = get_embeddings([preprocess_face(t.best['crop']) for t in tracks])
+        stats['embed_s'] = round(time.perf_counter() - started, 3)
+        faces_data = [
+            {
+                'track_id': track.track_id,
+                'start_s': round(track.start_s, 3),
+                'end_s': round(track.end_s, 3),
+                'best_s': round(track.best['timestamp'], 3),
+                'keyframes': track.hits,
+                'bbox': [int(v) for v in track.best['box']],
+                'confidence': float(track.best['confidence']),
+                'keypoints': track.best['keypoints'],
+                'embedding': embedding
+            }
+            for track, embedding in zip(tracks, embeddings) if embedding is not None
+        ]
+        stats['embedded'] = len(faces_data)
+        
+        # One entry per matched user, with every moment they appear
+        matched_users = []
+        for face_data, best_match in zip(faces_data, match_faces(faces_data, db) if faces_data else []):
+            if best_match:
+                face_data['matched_user'] = best_match
+                known = next((m for m in matched_users if m['user_id'] == best_match['user_id']), None)
+                if known is None:
+                    matched_users.append(dict(best_match, appearances_s=[face_data['best_s']]))
+                else:
+                    known['appearances_s'].append(face_data['best_s'])
+                    known['similarity'] = max(known['similarity'], best_match['similarity'])
+        
+        try:
+            previous = db.event_videos.find_one_and_update(
+                {'_id': ObjectId(video_id)},
+                {
+                    '$set': {
+                        'processed': True,
+                        'duration_s': stats['duration_s'],
+                        'tracks': faces_data,
+                        'matches_count': len(matched_users),
+                        'matched_users': matched_users,
+                        'processing_stats': stats
+                    }
+                },
+                projection={'upload_date': 1, 'processed': 1}
+            )
+            if previous is not None and not previous.get('processed'):
+                record_video_stats(db, previous, faces_data)
+            bump_match_versions(db, [m['user_id'] for m in matched_users])
+        except Exception as db_error:
+            logger.error(f"❌ Database update error: {db_error}")
+        
+        logger.info(
+            f"✅ Event video processed: {stats['tracks']} tracks, {len(faces_data)} embedded, "
+            f"{len(matched_users)} users matched, {stats['video_s_per_wall_s']} video-s/wall-s"
+        )
+        return {
+            'tracks': faces_data,
+            'matched_users': matched_users,
+            'stats': stats,
+            'processing_success': True,
+            'error': None
+        }
+        
+    except MemoryBudgetExceeded:
+        logger.error(f"❌ Memory budget exhausted, not processing {filepath}")
+        raise
+    except Exception as e:
+        logger.error(f"❌ Error processing event video {filepath}: {e}")
+        return {'tracks': [], 'matched_users': [], 'processing_success': False, 'error': str(e)}
+
+def _target_embeddings_for_photo(image_path, boxes=None):
+    """Target-model embeddings of a stored photo, with the confidence of each face
+    
+    With boxes (full-resolution [x, y, w, h]) those regions are embedded in
+    order, keeping face indexes aligned with the stored ones; otherwise the
+    faces are detected first. Returns None if the image cannot be read.
+    """
+    header = read_image_header(image_path)
+    if header is None:
+        return None
+    width, height, image_format = header
+    reduction = choose_reduction(width, height, max_decode_pixels)
+    detector_name = detector.name if boxes is None else 'stub'
+    with memory_budget.reserve(
+        estimate_decode_working_set(width, height, image_format, reduction, detector_name), reduced=reduction > 1
+    ):
+        image = decode_image(image_path, reduction)
+        if image is None:
+            return None
+        rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        del image
+        if boxes is None:
+            detections = detector.detect(rgb_image)
+            regions = [(d['box'], d['confidence']) for d in detections]
+        else:
+            regions = [([v // reduction for v in box], None) for box in boxes]
+        
+        h_img, w_img = rgb_image.shape[:2]
+        faces, confidences = [], []
+        for (x, y, w, h), confidence in regions:
+            x, y = min(max(0, x), w_img - 1), min(max(0, y), h_img - 1)
+            w, h = max(1, min(w, w_img - x)), max(1, min(h, h_img - y))
+            faces.append(preprocess_face(rgb_image[y:y+h, x:x+w]))
+            confidences.append(confidence)
+    return list(zip(get_target_embeddings(faces) or [], confidences))
+
+@contextmanager
+def _stored_photo_path(key, kind):
+    """Readable path of a stored photo; uploads from before the photo store live in UPLOAD_FOLDER/kind"""
+    if not photo_store.blobs.exists(key):
+        legacy_path = os.path.join(_settings.UPLOAD_FOLDER, kind, key) if _settings is not None else None
+        if legacy_path is None or not os.path.exists(legacy_path):
+            raise FileNotFoundError(f"Stored photo not found: {key}")
+        yield legacy_path
+        return
+    with photo_store.local_path(key) as path:
+        yield path
+
+
+def reembed_document(collection, doc):
+    """$set adding a target-model embedding to a user or group photo, or None
+    
+    Used by the re-embedding migration; None means the document cannot be
+    re-embedded (original gone, no face found).
+    """
+    version = target_model_version
+    if version is None:
+        raise RuntimeError("No target embedding model configured")
+    try:
+        if collection == 'users':
+            with _stored_photo_path(doc['profile_photo'], 'profiles') as path:
+                faces = _target_embeddings_for_photo(path)
+            faces = [face for face in faces or [] if face[0] is not None]
+            if not faces:
+                return None
+            # Same choice as the original enrollment: the most confident face
+            embedding, _ = max(faces, key=lambda face: face[1])
+            return {f'face_embeddings.{version}': embedding}
+        
+        stored = doc['faces_detected']
+        with _stored_photo_path(doc['filename'], 'groups') as path:
+            faces = _target_embeddings_for_photo(path, [f['bbox'] for f in stored])
+        if not faces or any(embedding is None for embedding, _ in faces):
+            return None
+        update = {f'faces_detected.{i}.embeddings.{version}': embedding for i, (embedding, _) in enumerate(faces)}
+        for i, face in enumerate(stored):
+            # Keep the existing version next to the new one
+            current = face.get('embedding_version', legacy_model_version)
+            if current not in (face.get('embeddings') or {}):
+                update[f'faces_detected.{i}.embeddings.{current}'] = face['embedding']
+        versions = doc.get('embedding_versions') or [legacy_model_version]
+        update['embedding_versions'] = sorted(set(versions) | {version})
+        return update
+    except FileNotFoundError:
+        return None
+
 def test_ml_setup():
     """Test ML components availability"""
     return {
-        'mtcnn_available': detector is not None,
-        'facenet_available': model is not None,
+        'mtcnn_available': detector is not None and detector.name == 'mtcnn',
+        'face_detector': detector.name if detector is not None else None,
+        'facenet_available': embedder is not None and not embedder.is_synthetic,
+        'embedding_backend': embedder.name if embedder is not None else None,
         'opencv_available': True,  # If we got here, CV2 is working
-        'model_path': 'facenet_keras.h5' if model is not None else 'not found',
+        'model_path': embedder.model_path or 'not found',
         'status': 'ML components initialized'
     }
 
 # Additional utility function from standalone script logic
-def find_matching_photos_batch(profile_embedding, group_photos_folder, threshold=0.6):
-    """Batch process multiple group photos against a profile embedding"""
+def find_matching_photos_batch(profile_embedding, group_photos_folder=None, threshold=0.6, user_id=None,
+                               photo_keys=None):
+    """Batch process multiple group photos against a profile embedding
+    
+    Photos are the stored group photos (every photo in group_photos, or just
+    photo_keys), read from the photo store or their pre-store upload folder;
+    passing group_photos_folder scans a plain directory instead. Runs as bulk
+    work: each photo waits for its own scheduler slot, so interactive uploads
+    can get in between photos of a long scan.
+    """
     matches = []
     
-    if not os.path.exists(group_photos_folder):
-        logger.error(f"Group photos folder not found: {group_photos_folder}")
-        return matches
+    if group_photos_folder is not None:
+        if not os.path.exists(group_photos_folder):
+            logger.error(f"Group photos folder not found: {group_photos_folder}")
+            return matches
+        blobs = LocalBlobStore(group_photos_folder, fanout=0)
+        photo_path_of = blobs.local_path
+        location_of = blobs.location
+        if photo_keys is None:
+            photo_keys = blobs.keys()
+    else:
+        # Not every stored blob: profile photos and released blobs share the store
+        photo_path_of = lambda key: _stored_photo_path(key, 'groups')
+        location_of = lambda key: (photo_store.blobs.location(key) if photo_store.blobs.exists(key)
+                                   else os.path.join(_settings.UPLOAD_FOLDER, 'groups', key))
+        if photo_keys is None:
+            db = get_client(_settings.MONGO_URI).get_default_database()
+            photo_keys = db.group_photos.distinct('filename', {'filename': {'$type': 'string'}})
     
-    for photo_name in os.listdir(group_photos_folder):
+    for photo_name in photo_keys:
         if photo_name.lower().endswith(('.jpg', '.jpeg', '.png', '.bmp', '.gif')):
-            photo_path = os.path.join(group_photos_folder, photo_name)
-            
             try:
-                faces_data = detect_faces(photo_path)
+                with photo_path_of(photo_name) as photo_path:
+                    faces_data = run_scheduled(BULK, user_id, detect_faces, photo_path)
                 
                 for face_data in faces_data:
                     similarity = cosine_similarity(profile_embedding, face_data['embedding'])
@@ -380,7 +1077,7 @@ def find_matching_photos_batch(profile_embedding, group_photos_folder, threshold
                     if similarity > threshold:
                         matches.append({
                             'photo_name': photo_name,
-                            'photo_path': photo_path,
+                            'photo_path': location_of(photo_name),
                             'similarity': round(similarity, 3),
                             'face_bbox': face_data['bbox'],
                             'face_confidence': face_data['confidence']
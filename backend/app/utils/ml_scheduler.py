@@ -0,0 +1,202 @@
+import time
+import logging
+import threading
+from contextlib import contextmanager
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Work classes, most urgent first
+INTERACTIVE_ENROLLMENT = 'interactive_enrollment'
+INTERACTIVE_GROUP = 'interactive_group'
+BULK = 'bulk'
+PRIORITY_CLASSES = (INTERACTIVE_ENROLLMENT, INTERACTIVE_GROUP, BULK)
+
+
+class SchedulerBusy(Exception):
+    """Raised when a job waited longer than the scheduler timeout for a slot"""
+
+
+class _Waiter:
+    __slots__ = ('job_class', 'rank', 'user_id', 'enqueued_at', 'granted')
+
+    def __init__(self, job_class, rank, user_id):
+        self.job_class = job_class
+        self.rank = rank
+        self.user_id = user_id
+        self.enqueued_at = time.monotonic()
+        self.granted = False
+
+
+class MLScheduler:
+    """Priority and fair-share admission in front of ML processing
+
+    At most `slots` jobs run at once. When a slot frees up, the waiting job
+    with the lowest effective rank gets it: its class rank (enrollment 0,
+    group upload 1, bulk 2) minus one for every aging_s seconds it has
+    waited, so bulk work is delayed by interactive traffic but never
+    starved. A user never holds more than max_per_user slots, and among
+    equal ranks the user with the fewest running jobs goes first, so one
+    user's burst cannot crowd everyone else out.
+    """
+
+    # Histogram edges for queue-wait times, in milliseconds
+    WAIT_BUCKETS_MS = (1, 5, 10, 50, 100, 500, 1000, 5000, 10000, 30000)
+
+    # Weight of the newest job in the recent latency averages
+    LATENCY_EWMA_ALPHA = 0.2
+
+    def __init__(self, slots, max_per_user=2, aging_s=10.0, timeout=60.0):
+        self.slots = slots
+        self.max_per_user = max_per_user
+        self.aging_s = aging_s
+        self.timeout = timeout
+        self._cond = threading.Condition()
+        self._waiting = []
+        self._running = 0
+        self._running_by_user = {}
+        self._class_stats = {job_class: self._new_class_stats() for job_class in PRIORITY_CLASSES}
+        self._recent_latency_ms = 0.0  # queued + running time of recently finished jobs
+        self._recent_run_ms = 0.0
+
+    def _new_class_stats(self):
+        return {
+            'running': 0,
+            'completed': 0,
+            'timeouts': 0,
+            'cancelled': 0,
+            'wait_total_ms': 0.0,
+            'wait_max_ms': 0.0,
+            'wait_counts': [0] * (len(self.WAIT_BUCKETS_MS) + 1)
+        }
+
+    def _effective_rank(self, waiter, now):
+        aged = (now - waiter.enqueued_at) / self.aging_s if self.aging_s > 0 else 0.0
+        return waiter.rank - aged
+
+    def _dispatch(self):
+        # Caller holds the lock
+        now = time.monotonic()
+        while self._running < self.slots:
+            eligible = [
+                w for w in self._waiting
+                if self._running_by_user.get(w.user_id, 0) < self.max_per_user
+            ]
+            if not eligible:
+                return
+            chosen = min(eligible, key=lambda w: (
+                self._effective_rank(w, now),
+                self._running_by_user.get(w.user_id, 0),
+                w.enqueued_at
+            ))
+            self._waiting.remove(chosen)
+            chosen.granted = True
+            self._running += 1
+            self._running_by_user[chosen.user_id] = self._running_by_user.get(chosen.user_id, 0) + 1
+            self._record_wait(chosen, now)
+        self._cond.notify_all()
+
+    def _record_wait(self, waiter, now):
+        stats = self._class_stats[waiter.job_class]
+        wait_ms = (now - waiter.enqueued_at) * 1000
+        stats['running'] += 1
+        stats['wait_total_ms'] += wait_ms
+        stats['wait_max_ms'] = max(stats['wait_max_ms'], wait_ms)
+        stats['wait_counts'][np.searchsorted(self.WAIT_BUCKETS_MS, wait_ms)] += 1
+
+    @contextmanager
+    def slot(self, job_class, user_id=None, request_deadline=None):
+        """Block until this job may run, and hold its slot for the block
+        
+        With request_deadline (a Deadline), a job whose request expires or is cancelled while
+        queued leaves the queue and raises RequestCancelled('queued').
+        """
+        if job_class not in self._class_stats:
+            raise ValueError(f"Unknown job class '{job_class}'")
+        waiter = _Waiter(job_class, PRIORITY_CLASSES.index(job_class), user_id)
+        with self._cond:
+            self._waiting.append(waiter)
+            self._dispatch()
+            deadline = waiter.enqueued_at + self.timeout
+            while not waiter.granted:
+                if request_deadline is not None and request_deadline.reason() is not None:
+                    self._waiting.remove(waiter)
+                    self._class_stats[job_class]['cancelled'] += 1
+                    request_deadline.check('queued')
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._waiting.remove(waiter)
+                    self._class_stats[job_class]['timeouts'] += 1
+                    raise SchedulerBusy(f"No ML slot for {job_class} within {self.timeout:.0f}s")
+                # Wake up periodically so aging is re-evaluated
+                wait = min(remaining, max(self.aging_s, 0.1))
+                if request_deadline is not None:
+                    # Cancellation does not notify the condition, so poll for it
+                    wait = min(wait, 0.5, max(request_deadline.remaining(), 0.0) + 0.01)
+                self._cond.wait(wait)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            finished = time.monotonic()
+            with self._cond:
+                alpha = self.LATENCY_EWMA_ALPHA
+                self._recent_latency_ms += alpha * ((finished - waiter.enqueued_at) * 1000 - self._recent_latency_ms)
+                self._recent_run_ms += alpha * ((finished - started) * 1000 - self._recent_run_ms)
+                self._running -= 1
+                remaining_jobs = self._running_by_user[user_id] - 1
+                if remaining_jobs:
+                    self._running_by_user[user_id] = remaining_jobs
+                else:
+                    del self._running_by_user[user_id]
+                stats = self._class_stats[job_class]
+                stats['running'] -= 1
+                stats['completed'] += 1
+                self._dispatch()
+
+    def run(self, job_class, user_id, fn, *args, **kwargs):
+        """Call fn(*args, **kwargs) once a slot is granted"""
+        with self.slot(job_class, user_id):
+            return fn(*args, **kwargs)
+
+    def load(self):
+        """Current queue depth and recent job latency, for load shedding"""
+        with self._cond:
+            return {
+                'slots': self.slots,
+                'running': self._running,
+                'queued': len(self._waiting),
+                'recent_latency_ms': round(self._recent_latency_ms, 1),
+                'recent_run_ms': round(self._recent_run_ms, 1)
+            }
+
+    def stats(self):
+        """Slot usage and per-class queue latency"""
+        with self._cond:
+            wait_labels = [f"<={edge}ms" for edge in self.WAIT_BUCKETS_MS]
+            wait_labels.append(f">{self.WAIT_BUCKETS_MS[-1]}ms")
+            classes = {}
+            for job_class, stats in self._class_stats.items():
+                started = sum(stats['wait_counts'])
+                classes[job_class] = {
+                    'queued': sum(1 for w in self._waiting if w.job_class == job_class),
+                    'running': stats['running'],
+                    'completed': stats['completed'],
+                    'timeouts': stats['timeouts'],
+                    'cancelled': stats['cancelled'],
+                    'queue_wait_ms': {
+                        'mean': round(stats['wait_total_ms'] / started, 3) if started else 0.0,
+                        'max': round(stats['wait_max_ms'], 3),
+                        'histogram': dict(zip(wait_labels, stats['wait_counts']))
+                    }
+                }
+            return {
+                'slots': self.slots,
+                'running': self._running,
+                'queued': len(self._waiting),
+                'max_per_user': self.max_per_user,
+                'aging_s': self.aging_s,
+                'recent_latency_ms': round(self._recent_latency_ms, 1),
+                'recent_run_ms': round(self._recent_run_ms, 1),
+                'classes': classes
+            }
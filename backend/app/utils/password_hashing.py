@@ -0,0 +1,109 @@
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from werkzeug.security import generate_password_hash, check_password_hash
+from app.utils.metrics import register_metrics_provider
+from config import get_active_config
+
+logger = logging.getLogger(__name__)
+
+class PasswordHashingBusy(Exception):
+    """Raised when too many password hashes are already queued, or one waited past the timeout"""
+
+class PasswordHasher:
+    """Bounded executor for password hashing
+
+    Hashing is CPU heavy by design. Running it on a small dedicated pool caps
+    the cores a login burst can take from the ML request threads, and the
+    bounded backlog turns excess logins into fast 503s instead of a pile-up.
+    """
+
+    def __init__(self, workers=2, max_pending=32, timeout=10.0):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hash')
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.timeouts = 0
+
+    def _submit(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise PasswordHashingBusy("Too many concurrent password operations")
+        with self._lock:
+            self.pending += 1
+        future = self._executor.submit(fn, *args)
+        future.add_done_callback(self._release)
+        return future
+
+    def _release(self, _future):
+        with self._lock:
+            self.pending -= 1
+            self.completed += 1
+        self._slots.release()
+
+    def submit_hash(self, password):
+        """Queue a password hash; returns a Future with the hash"""
+        return self._submit(generate_password_hash, password)
+
+    def submit_verify(self, password_hash, password):
+        """Queue a password check; returns a Future with the result"""
+        return self._submit(check_password_hash, password_hash, password)
+
+    def _timed_out(self):
+        with self._lock:
+            self.timeouts += 1
+        return PasswordHashingBusy(f"Password operation did not finish within {self.timeout:g}s")
+
+    def _result(self, future):
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            raise self._timed_out()
+
+    async def _result_async(self, future):
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        except asyncio.TimeoutError:
+            raise self._timed_out()
+
+    def hash_password(self, password):
+        """Hash a password on the bounded pool"""
+        return self._result(self.submit_hash(password))
+
+    def verify_password(self, password_hash, password):
+        """Check a password against its hash on the bounded pool"""
+        return self._result(self.submit_verify(password_hash, password))
+
+    async def hash_password_async(self, password):
+        """hash_password for the event loop: awaits the pool without holding a thread"""
+        return await self._result_async(self.submit_hash(password))
+
+    async def verify_password_async(self, password_hash, password):
+        """verify_password for the event loop: awaits the pool without holding a thread"""
+        return await self._result_async(self.submit_verify(password_hash, password))
+
+    def stats(self):
+        """Pool size and backlog counters"""
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'max_pending': self.max_pending,
+                'pending': self.pending,
+                'completed': self.completed,
+                'rejected': self.rejected,
+                'timeouts': self.timeouts
+            }
+
+_settings = get_active_config()
+password_hasher = PasswordHasher(
+    workers=_settings.PASSWORD_HASH_WORKERS,
+    max_pending=_settings.PASSWORD_HASH_MAX_PENDING
+)
+register_metrics_provider('password_hashing', password_hasher.stats)
@@ -0,0 +1,96 @@
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Codes are uint8, so every subspace has 256 centroids
+CENTROIDS = 256
+
+
+def _kmeans(vectors, k, iterations, rng):
+    """Plain Lloyd's k-means; empty clusters are re-seeded from random points"""
+    centroids = vectors[rng.choice(len(vectors), k, replace=len(vectors) < k)].copy()
+    for _ in range(iterations):
+        # argmin ||v - c||^2 = argmax (v.c - ||c||^2 / 2)
+        assignment = (vectors @ centroids.T - 0.5 * (centroids ** 2).sum(axis=1)).argmax(axis=1)
+        counts = np.bincount(assignment, minlength=k)
+        sums = np.stack([np.bincount(assignment, weights=vectors[:, d], minlength=k)
+                         for d in range(vectors.shape[1])], axis=1)
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+        empty = np.flatnonzero(~filled)
+        if len(empty):
+            centroids[empty] = vectors[rng.choice(len(vectors), len(empty))]
+    return centroids
+
+
+class ProductQuantizer:
+    """Product quantization of L2-normalized embeddings into uint8 codes
+
+    The dim-dimensional space is split into `subspaces` contiguous slices,
+    each quantized to one of 256 centroids learned by k-means, so a
+    128-D float32 embedding (512 bytes) becomes `subspaces` bytes. Queries
+    stay exact: asymmetric distance computation (ADC) builds one table of
+    query-slice . centroid inner products per face, and a stored vector's
+    approximate cosine is the sum of `subspaces` table lookups.
+
+    Codes are subspace-major, shape (subspaces, n), so each lookup pass
+    reads one contiguous row of n bytes.
+    """
+
+    def __init__(self, codebooks):
+        # (subspaces, 256, dim / subspaces) float32
+        self.codebooks = np.ascontiguousarray(codebooks, dtype='float32')
+        self.subspaces, _, self.sub_dim = self.codebooks.shape
+        self.dim = self.subspaces * self.sub_dim
+
+    @classmethod
+    def train(cls, vectors, subspaces=16, iterations=20, sample=65536, seed=0):
+        """Learn codebooks from (a sample of) the gallery's own embeddings"""
+        vectors = np.asarray(vectors, dtype='float32')
+        dim = vectors.shape[1]
+        if dim % subspaces:
+            raise ValueError(f"Embedding dimension {dim} is not divisible into {subspaces} subspaces")
+        rng = np.random.default_rng(seed)
+        if len(vectors) > sample:
+            vectors = vectors[rng.choice(len(vectors), sample, replace=False)]
+        sub_dim = dim // subspaces
+        codebooks = np.stack([
+            _kmeans(np.ascontiguousarray(vectors[:, j * sub_dim:(j + 1) * sub_dim]), CENTROIDS, iterations, rng)
+            for j in range(subspaces)
+        ])
+        return cls(codebooks)
+
+    def encode(self, vectors, batch_size=65536):
+        """Nearest centroid per subspace: (n, dim) float -> (subspaces, n) uint8"""
+        vectors = np.asarray(vectors, dtype='float32').reshape(-1, self.dim)
+        codes = np.empty((self.subspaces, len(vectors)), dtype='uint8')
+        half_norms = 0.5 * (self.codebooks ** 2).sum(axis=2)
+        for start in range(0, len(vectors), batch_size):
+            batch = vectors[start:start + batch_size]
+            for j in range(self.subspaces):
+                part = batch[:, j * self.sub_dim:(j + 1) * self.sub_dim]
+                codes[j, start:start + len(batch)] = (part @ self.codebooks[j].T - half_norms[j]).argmax(axis=1)
+        return codes
+
+    def decode(self, codes):
+        """Reconstruct (approximate) vectors from codes"""
+        codes = np.asarray(codes)
+        return np.concatenate([self.codebooks[j][codes[j]] for j in range(self.subspaces)], axis=1)
+
+    def adc_tables(self, queries):
+        """(faces, subspaces, 256) inner products of each query slice with each centroid"""
+        queries = np.asarray(queries, dtype='float32').reshape(-1, self.subspaces, self.sub_dim)
+        return np.einsum('qsd,scd->qsc', queries, self.codebooks)
+
+    def scores(self, table, codes):
+        """Approximate inner products of one query (its ADC table) with every code"""
+        scores = np.zeros(codes.shape[1], dtype='float32')
+        for j in range(self.subspaces):
+            scores += np.take(table[j], codes[j])
+        return scores
+
+    def reconstruction_error(self, vectors):
+        """Mean squared error of encode/decode, for reporting codebook quality"""
+        vectors = np.asarray(vectors, dtype='float32')
+        return float(((vectors - self.decode(self.encode(vectors))) ** 2).sum(axis=1).mean())
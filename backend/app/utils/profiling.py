@@ -0,0 +1,255 @@
+import io
+import os
+import sys
+import hmac
+import time
+import random
+import pstats
+import logging
+import cProfile
+import threading
+from datetime import datetime
+from contextlib import contextmanager
+from config import get_active_config
+
+logger = logging.getLogger(__name__)
+
+# Profiles are stored here, keyed to the photo or user they were taken for
+PROFILES_COLLECTION = 'request_profiles'
+
+# Request header carrying PROFILING_TOKEN to profile that one request
+PROFILE_HEADER = 'X-Profile-Token'
+
+PROFILING_MODES = ('sampling', 'cprofile')
+
+
+def frame_label(code):
+    """Flamegraph frame name: function (file:line)"""
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(';', ',')
+
+
+class StackSampler:
+    """Samples one thread's Python stack every interval_ms from a helper thread
+
+    Counts identical stacks, root first, which is exactly the collapsed
+    format flamegraph.pl, speedscope and inferno read.
+    """
+
+    def __init__(self, thread_id, interval_ms=5.0):
+        self.thread_id = thread_id
+        self.interval = interval_ms / 1000.0
+        self.stacks = {}
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(frame_label(frame.f_code))
+                frame = frame.f_back
+            if stack:
+                key = ';'.join(reversed(stack))
+                self.stacks[key] = self.stacks.get(key, 0) + 1
+                self.samples += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def collapsed(self):
+        return '\n'.join(f"{stack} {count}" for stack, count in sorted(self.stacks.items()))
+
+
+def collapse_cprofile(profile):
+    """Approximate collapsed stacks from a deterministic cProfile run
+
+    cProfile only records caller/callee pairs, so each function's own time
+    is spread over the paths leading to it in proportion to the time each
+    caller spent in it. Counts are microseconds.
+    """
+    stats = pstats.Stats(profile).stats
+    labels = {func: f"{func[2]} ({os.path.basename(func[0])}:{func[1]})".replace(';', ',') for func in stats}
+    callees = {}
+    for func, (_, _, _, _, callers) in stats.items():
+        for caller, caller_stats in callers.items():
+            callees.setdefault(caller, []).append((func, caller_stats[3]))
+    roots = [func for func, entry in stats.items() if not entry[4]]
+    lines = {}
+
+    def walk(func, path, share, depth):
+        # share: fraction of func's time that is reached through this path
+        own = stats[func][2]
+        path = path + [labels[func]]
+        weight = int(own * share * 1e6)
+        if weight:
+            key = ';'.join(path)
+            lines[key] = lines.get(key, 0) + weight
+        if depth >= 64:
+            return
+        for callee, time_in_callee in callees.get(func, ()):
+            callee_cumulative = stats[callee][3]
+            if callee_cumulative > 0 and labels[callee] not in path:
+                walk(callee, path, share * min(1.0, time_in_callee / callee_cumulative), depth + 1)
+
+    for root in roots:
+        walk(root, [], 1.0, 0)
+    return '\n'.join(f"{stack} {count}" for stack, count in sorted(lines.items()))
+
+
+class CapturedProfile:
+    """What one profiled request produced"""
+
+    def __init__(self, mode):
+        self.mode = mode
+        self.wall_ms = None
+        self.collapsed = ''
+        self.samples = None
+        self.top_functions = None
+        self.error = None  # exception type the block ended with, if any
+
+
+class RequestProfiler:
+    """Opt-in profiling of individual upload requests
+
+    A request is profiled when it carries PROFILING_TOKEN in the
+    X-Profile-Token header, when an admin has armed the next N requests, or
+    by random sampling at sample_rate. With no token configured, nothing
+    armed and sample_rate 0, should_profile() is a couple of attribute
+    reads and no profiler ever runs.
+
+    Modes: 'sampling' (a helper thread records the request thread's stack
+    every interval_ms; low overhead, exact stacks) and 'cprofile'
+    (deterministic, slower, with per-function totals and approximate
+    stacks).
+    """
+
+    def __init__(self, token=None, sample_rate=0.0, mode='sampling', interval_ms=5.0):
+        if mode not in PROFILING_MODES:
+            raise ValueError(f"Unknown profiling mode '{mode}'. Available: {', '.join(PROFILING_MODES)}")
+        self.token = token
+        self.sample_rate = sample_rate
+        self.mode = mode
+        self.interval_ms = interval_ms
+        self._armed = 0
+        self._lock = threading.Lock()
+        self.profiled = 0
+
+    def authorized(self, header_token):
+        """Whether a request header carries the profiling token"""
+        return bool(self.token and header_token and hmac.compare_digest(header_token, self.token))
+
+    def configure(self, sample_rate=None, next_requests=None, mode=None):
+        """Change sampling at runtime (admin endpoint)"""
+        with self._lock:
+            if sample_rate is not None:
+                self.sample_rate = max(0.0, min(1.0, float(sample_rate)))
+            if next_requests is not None:
+                self._armed = max(0, int(next_requests))
+            if mode is not None:
+                if mode not in PROFILING_MODES:
+                    raise ValueError(f"Unknown profiling mode '{mode}'")
+                self.mode = mode
+        return self.settings()
+
+    def settings(self):
+        return {'sample_rate': self.sample_rate, 'armed_requests': self._armed, 'mode': self.mode,
+                'profiled': self.profiled}
+
+    def should_profile(self, header_token=None):
+        """Decide whether to profile the current request"""
+        if header_token is not None and self.authorized(header_token):
+            return True
+        if self._armed:
+            with self._lock:
+                if self._armed:
+                    self._armed -= 1
+                    return True
+        return bool(self.sample_rate) and random.random() < self.sample_rate
+
+    @contextmanager
+    def capture(self):
+        """Profile the enclosed block on the current thread"""
+        captured = CapturedProfile(self.mode)
+        started = time.perf_counter()
+        if self.mode == 'cprofile':
+            profile = cProfile.Profile()
+            profile.enable()
+            try:
+                yield captured
+            except BaseException as e:
+                captured.error = type(e).__name__
+                raise
+            finally:
+                profile.disable()
+                captured.wall_ms = round((time.perf_counter() - started) * 1000, 1)
+                captured.collapsed = collapse_cprofile(profile)
+                out = io.StringIO()
+                pstats.Stats(profile, stream=out).sort_stats('cumulative').print_stats(40)
+                captured.top_functions = out.getvalue()
+        else:
+            sampler = StackSampler(threading.get_ident(), self.interval_ms)
+            sampler.start()
+            try:
+                yield captured
+            except BaseException as e:
+                captured.error = type(e).__name__
+                raise
+            finally:
+                sampler.stop()
+                captured.wall_ms = round((time.perf_counter() - started) * 1000, 1)
+                captured.collapsed = sampler.collapsed()
+                captured.samples = sampler.samples
+        with self._lock:
+            self.profiled += 1
+
+    def save(self, db, collection, target_id, captured):
+        """Store a captured profile with the document it was taken for; returns its id"""
+        try:
+            result = db[PROFILES_COLLECTION].insert_one({
+                'collection': collection,
+                'target_id': str(target_id),
+                'mode': captured.mode,
+                'wall_ms': captured.wall_ms,
+                'samples': captured.samples,
+                'collapsed': captured.collapsed,
+                'top_functions': captured.top_functions,
+                'error': captured.error,
+                'created_at': datetime.utcnow()
+            })
+            logger.info(f"📊 Profile of {collection} {target_id} stored ({captured.wall_ms} ms, {captured.mode})")
+            return result.inserted_id
+        except Exception as e:
+            logger.error(f"❌ Could not store profile of {collection} {target_id}: {e}")
+            return None
+
+
+def profile_summary(doc):
+    """JSON view of a stored profile, without the (large) stacks"""
+    return {
+        'id': str(doc['_id']),
+        'collection': doc['collection'],
+        'target_id': doc['target_id'],
+        'mode': doc['mode'],
+        'wall_ms': doc['wall_ms'],
+        'samples': doc.get('samples'),
+        'error': doc.get('error'),
+        'created_at': doc['created_at'].isoformat()
+    }
+
+
+def create_request_profiler(settings):
+    return RequestProfiler(
+        token=settings.PROFILING_TOKEN,
+        sample_rate=settings.PROFILING_SAMPLE_RATE,
+        mode=settings.PROFILING_MODE,
+        interval_ms=settings.PROFILING_INTERVAL_MS
+    )
+
+
+request_profiler = create_request_profiler(get_active_config())
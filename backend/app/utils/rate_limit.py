@@ -0,0 +1,395 @@
+import math
+import time
+import logging
+import functools
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from flask import request
+from flask_jwt_extended import verify_jwt_in_request, get_jwt_identity
+from pymongo.errors import DuplicateKeyError
+from app.utils.db import get_client
+from app.utils.metrics import register_metrics_provider
+from config import get_active_config
+
+logger = logging.getLogger(__name__)
+
+# Shared buckets live here when RATE_LIMIT_BACKEND is mongo
+BUCKETS_COLLECTION = 'rate_limit_buckets'
+
+PERIODS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+
+
+def parse_rate(text):
+    """Parse a limit such as '20 per hour' (or '20/hour') into (count, seconds)"""
+    count, _, period = text.replace('/', ' per ').partition(' per ')
+    period = period.strip().rstrip('s')
+    if period not in PERIODS or not count.strip().isdigit():
+        raise ValueError(f"Invalid rate limit '{text}', expected e.g. '20 per hour'")
+    return int(count), PERIODS[period]
+
+
+def refill(tokens, updated_at, now, capacity, refill_per_s):
+    """Tokens in a bucket at `now`, given its level at updated_at"""
+    return min(capacity, tokens + max(0.0, now - updated_at) * refill_per_s)
+
+
+class MemoryBucketStore:
+    """Token buckets in this process only
+
+    Limits are per worker process, so with N workers a client gets up to N
+    times the configured rate. Idle buckets are dropped LRU-first beyond
+    max_keys; a dropped bucket simply starts full again.
+    """
+
+    name = 'memory'
+    blocking = False
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, capacity, refill_per_s, cost=1.0):
+        """Try to take cost tokens; returns (allowed, tokens left, seconds until allowed)"""
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            tokens = capacity if bucket is None else refill(bucket[0], bucket[1], now, capacity, refill_per_s)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return allowed, tokens, 0.0 if allowed else (cost - tokens) / refill_per_s
+
+    def refund(self, key, capacity, refill_per_s, amount=1.0):
+        """Put amount tokens back into a bucket, never above capacity"""
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                return  # Dropped buckets start full again anyway
+            tokens = refill(bucket[0], bucket[1], now, capacity, refill_per_s)
+            self._buckets[key] = (min(capacity, tokens + amount), now)
+
+    def size(self):
+        return len(self._buckets)
+
+
+class MongoBucketStore:
+    """Token buckets shared by every API node through one Mongo collection
+
+    Each take is a read plus a conditional write on the level that was read
+    (compare-and-set), retried on contention, so concurrent requests on
+    different nodes cannot both spend the last token. Buckets carry an
+    expires_at for a TTL index, so idle ones disappear on their own. A
+    mongomock:// URI gives a local stand-in with the same behaviour.
+    """
+
+    name = 'mongo'
+    blocking = True
+
+    def __init__(self, mongo_uri, max_retries=5):
+        self.collection = get_client(mongo_uri).get_default_database()[BUCKETS_COLLECTION]
+        self.max_retries = max_retries
+        self.contention_retries = 0
+        try:
+            self.collection.create_index('expires_at', expireAfterSeconds=0)
+        except Exception as e:
+            logger.warning(f"⚠️ Could not create the rate limit TTL index: {e}")
+
+    def take(self, key, capacity, refill_per_s, cost=1.0):
+        """Try to take cost tokens; returns (allowed, tokens left, seconds until allowed)"""
+        for _ in range(self.max_retries):
+            now = time.time()
+            # Until the bucket would be full again, after which it is not needed
+            expires_at = datetime.utcnow() + timedelta(seconds=capacity / refill_per_s)
+            bucket = self.collection.find_one({'_id': key})
+            if bucket is None:
+                tokens = capacity
+            else:
+                tokens = refill(bucket['tokens'], bucket['updated_at'], now, capacity, refill_per_s)
+            if tokens < cost:
+                return False, tokens, (cost - tokens) / refill_per_s
+
+            if bucket is None:
+                try:
+                    self.collection.insert_one({
+                        '_id': key, 'tokens': tokens - cost, 'updated_at': now, 'expires_at': expires_at
+                    })
+                    return True, tokens - cost, 0.0
+                except DuplicateKeyError:
+                    pass
+            else:
+                result = self.collection.update_one(
+                    {'_id': key, 'tokens': bucket['tokens'], 'updated_at': bucket['updated_at']},
+                    {'$set': {'tokens': tokens - cost, 'updated_at': now, 'expires_at': expires_at}}
+                )
+                if result.modified_count:
+                    return True, tokens - cost, 0.0
+            self.contention_retries += 1
+        # Heavily contended key: let the request through rather than fail it
+        return True, 0.0, 0.0
+
+    def refund(self, key, capacity, refill_per_s, amount=1.0):
+        """Put amount tokens back into a bucket, never above capacity"""
+        for _ in range(self.max_retries):
+            now = time.time()
+            bucket = self.collection.find_one({'_id': key})
+            if bucket is None:
+                return  # Expired buckets start full again anyway
+            tokens = refill(bucket['tokens'], bucket['updated_at'], now, capacity, refill_per_s)
+            result = self.collection.update_one(
+                {'_id': key, 'tokens': bucket['tokens'], 'updated_at': bucket['updated_at']},
+                {'$set': {'tokens': min(capacity, tokens + amount), 'updated_at': now}}
+            )
+            if result.modified_count:
+                return
+            self.contention_retries += 1
+        # Heavily contended key: the refund is lost, which only errs on the strict side
+
+    def size(self):
+        return self.collection.estimated_document_count()
+
+
+BUCKET_STORE_BACKENDS = {
+    MemoryBucketStore.name: MemoryBucketStore,
+    MongoBucketStore.name: MongoBucketStore,
+}
+
+
+def create_bucket_store(backend, **options):
+    """Instantiate a token bucket store backend by name"""
+    try:
+        store_class = BUCKET_STORE_BACKENDS[backend]
+    except KeyError:
+        raise ValueError(
+            f"Unknown rate limit backend '{backend}'. "
+            f"Available: {', '.join(sorted(BUCKET_STORE_BACKENDS))}"
+        )
+    return store_class(**options)
+
+
+def bucket_store_options(settings, backend):
+    """Collect constructor options for a bucket store from a config object"""
+    if backend == MongoBucketStore.name:
+        return {'mongo_uri': settings.RATE_LIMIT_MONGO_URI}
+    return {'max_keys': settings.RATE_LIMIT_MAX_KEYS}
+
+
+def client_ip(remote_addr, forwarded_for=None, trust_forwarded=False):
+    """Address a request is limited by (the first X-Forwarded-For hop behind a trusted proxy)"""
+    if trust_forwarded and forwarded_for:
+        return forwarded_for.split(',')[0].strip()
+    return remote_addr or 'unknown'
+
+
+class RateLimited:
+    """A request over one of its limits"""
+
+    def __init__(self, limit, retry_after):
+        self.limit = limit
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class RateLimiter:
+    """Per-user and per-IP token buckets in front of the API endpoints
+
+    Every limited endpoint has a bucket per caller: the user behind the JWT
+    or, for anonymous endpoints such as login, the client IP. Each IP also
+    has one bucket shared by all limited endpoints (ip_limit), so a client
+    cannot spread a flood over many accounts. A bucket holds `count` tokens
+    and refills continuously at count per period, which allows short bursts
+    up to the limit but never more than the limit on average.
+
+    When the store itself fails the request is let through: rate limiting
+    must not take the API down with it.
+    """
+
+    def __init__(self, store, limits, ip_limit=None, enabled=True):
+        self.store = store
+        self.limits = {endpoint: (text,) + parse_rate(text) for endpoint, text in limits.items()}
+        self.ip_limit = (ip_limit,) + parse_rate(ip_limit) if ip_limit else None
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._counts = {endpoint: {'allowed': 0, 'limited': 0} for endpoint in self.limits}
+        self.ip_limited = 0
+        self.store_errors = 0
+
+    def _take(self, key, limit):
+        text, count, period = limit
+        allowed, _, retry_after = self.store.take(key, count, count / period)
+        return None if allowed else RateLimited(text, retry_after)
+
+    def _refund(self, key, limit):
+        """Put back a token taken for a request that another limit denied"""
+        _, count, period = limit
+        self.store.refund(key, count, count / period)
+
+    def check(self, endpoint, user_id, ip):
+        """Spend a token for this request; returns RateLimited if it is over a limit"""
+        if not self.enabled or endpoint not in self.limits:
+            return None
+        try:
+            limited = self._take(f"ip:{ip}", self.ip_limit) if self.ip_limit else None
+            if limited:
+                with self._lock:
+                    self.ip_limited += 1
+            else:
+                identity = f"user:{user_id}" if user_id else f"ip:{ip}"
+                limited = self._take(f"{endpoint}:{identity}", self.limits[endpoint])
+                if limited and self.ip_limit:
+                    # A denied request must not use up the client's shared IP budget
+                    self._refund(f"ip:{ip}", self.ip_limit)
+        except Exception as e:
+            logger.error(f"❌ Rate limit store failed, letting request through: {e}")
+            with self._lock:
+                self.store_errors += 1
+            return None
+        with self._lock:
+            self._counts[endpoint]['limited' if limited else 'allowed'] += 1
+        return limited
+
+    def stats(self):
+        """Limits, per-endpoint decisions and store state"""
+        with self._lock:
+            endpoints = {
+                endpoint: dict(counts, limit=self.limits[endpoint][0])
+                for endpoint, counts in self._counts.items()
+            }
+        stats = {
+            'enabled': self.enabled,
+            'backend': self.store.name,
+            'ip_limit': self.ip_limit[0] if self.ip_limit else None,
+            'ip_limited': self.ip_limited,
+            'store_errors': self.store_errors,
+            'endpoints': endpoints
+        }
+        try:
+            stats['buckets'] = self.store.size()
+        except Exception:
+            stats['buckets'] = None
+        if hasattr(self.store, 'contention_retries'):
+            stats['contention_retries'] = self.store.contention_retries
+        return stats
+
+
+class LoadShedder:
+    """Rejects new ML work early while the scheduler is overloaded
+
+    A new upload is shed when max_queued jobs are already waiting for an ML
+    slot, or when jobs are waiting and recently finished ones took longer
+    than max_latency_ms from enqueue to completion. Shedding at the door
+    costs nothing, while admitting the request would only add it to a queue
+    it is likely to time out in. Retry-After is the estimated time for the
+    current queue to drain at the recent per-job run time.
+    """
+
+    def __init__(self, load, max_queued=32, max_latency_ms=15000.0, max_retry_after=60):
+        self.load = load
+        self.max_queued = max_queued
+        self.max_latency_ms = max_latency_ms
+        self.max_retry_after = max_retry_after
+        self._lock = threading.Lock()
+        self.shed = 0
+        self.shed_by_reason = {'queue_depth': 0, 'latency': 0}
+
+    def check(self):
+        """Seconds the caller should wait before retrying, or None to admit"""
+        load = self.load()
+        if load is None or not load['queued']:
+            return None
+        if self.max_queued and load['queued'] >= self.max_queued:
+            reason = 'queue_depth'
+        elif self.max_latency_ms and load['recent_latency_ms'] >= self.max_latency_ms:
+            reason = 'latency'
+        else:
+            return None
+        drain_s = load['queued'] / max(1, load['slots']) * load['recent_run_ms'] / 1000.0
+        with self._lock:
+            self.shed += 1
+            self.shed_by_reason[reason] += 1
+        return int(min(self.max_retry_after, max(1, math.ceil(drain_s))))
+
+    def stats(self):
+        with self._lock:
+            return {
+                'max_queued': self.max_queued,
+                'max_latency_ms': self.max_latency_ms,
+                'shed': self.shed,
+                'shed_by_reason': dict(self.shed_by_reason),
+                'load': self.load()
+            }
+
+
+def _scheduler_load():
+    # Imported lazily: the ML stack is heavy and the scheduler only exists once models are initialized
+    from app.utils import ml_processor
+    return ml_processor.ml_scheduler.load() if ml_processor.ml_scheduler is not None else None
+
+
+def create_rate_limiter(settings):
+    store = create_bucket_store(
+        settings.RATE_LIMIT_BACKEND, **bucket_store_options(settings, settings.RATE_LIMIT_BACKEND)
+    )
+    return RateLimiter(
+        store, settings.RATE_LIMITS, ip_limit=settings.RATE_LIMIT_PER_IP, enabled=settings.RATE_LIMIT_ENABLED
+    )
+
+
+_settings = get_active_config()
+rate_limiter = create_rate_limiter(_settings)
+load_shedder = LoadShedder(
+    _scheduler_load,
+    max_queued=_settings.ML_SHED_MAX_QUEUED,
+    max_latency_ms=_settings.ML_SHED_MAX_LATENCY_MS
+)
+register_metrics_provider('rate_limits', rate_limiter.stats)
+register_metrics_provider('load_shedding', load_shedder.stats)
+
+
+# Responses are (body, status, headers) so the ASGI decorator can share them
+
+def too_many_requests(limited):
+    """429 for a request over its rate limit"""
+    return {
+        'status': 'error',
+        'message': f'Rate limit exceeded ({limited.limit}), please retry in {limited.retry_after} s'
+    }, 429, {'Retry-After': str(limited.retry_after), 'X-RateLimit-Limit': limited.limit}
+
+def overloaded_response(retry_after):
+    """503 for an upload shed because the ML workers are overloaded"""
+    return {
+        'status': 'error',
+        'message': 'Photo processing is overloaded, please retry shortly'
+    }, 503, {'Retry-After': str(retry_after)}
+
+def rate_limited(endpoint, shed=False):
+    """Enforce an endpoint's rate limit (and with shed=True, load shedding) on a Flask view
+
+    Goes below @jwt_required() so limits apply per user; anonymous
+    endpoints are limited per client IP.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            try:
+                verify_jwt_in_request(optional=True)
+                user_id = get_jwt_identity()
+            except Exception:
+                user_id = None
+            ip = client_ip(request.remote_addr, request.headers.get('X-Forwarded-For'),
+                           _settings.RATE_LIMIT_TRUST_FORWARDED)
+            limited = rate_limiter.check(endpoint, user_id, ip)
+            if limited:
+                return too_many_requests(limited)
+            if shed:
+                retry_after = load_shedder.check()
+                if retry_after:
+                    return overloaded_response(retry_after)
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,294 @@
+import os
+import time
+import shutil
+import hashlib
+import logging
+import tempfile
+from datetime import datetime, timedelta
+from contextlib import contextmanager
+from pymongo import ReturnDocument
+from config import get_active_config
+
+logger = logging.getLogger(__name__)
+
+# Mongo collection holding one reference count per stored blob
+REFS_COLLECTION = 'photo_blobs'
+
+
+def content_key(data, extension):
+    """Content-addressed key of an upload: sha256 hex digest plus extension"""
+    return f"{hashlib.sha256(data).hexdigest()}.{extension.lower()}"
+
+
+class BlobStore:
+    """Base class for places uploaded photos can live
+
+    Keys are content-addressed, so writing a key that already exists is a
+    no-op unless overwrite is set. Backends implement write/exists/delete/keys, location() (a
+    stable reference for logs and results) and local_path(), which yields
+    a filesystem path the ML pipeline can read.
+    """
+
+    name = 'base'
+
+    def write(self, key, data, overwrite=False):
+        raise NotImplementedError
+
+    def exists(self, key):
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def keys(self):
+        raise NotImplementedError
+
+    def location(self, key):
+        raise NotImplementedError
+
+    @contextmanager
+    def local_path(self, key):
+        raise NotImplementedError
+        yield
+
+
+def atomic_write(path, data):
+    """Write data to path via a temp file in the same directory and a rename"""
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+
+class LocalBlobStore(BlobStore):
+    """Blobs on local disk, fanned out into hashed subdirectories
+
+    With fanout=2 the key 'ab12cd...jpg' lives at root/ab/12/ab12cd...jpg,
+    so no directory grows past a few thousand entries even at millions of
+    photos.
+    """
+
+    name = 'local'
+
+    def __init__(self, root, fanout=2):
+        self.root = root
+        self.fanout = fanout
+
+    def path(self, key):
+        shards = [key[2 * i:2 * i + 2] for i in range(self.fanout)]
+        return os.path.join(self.root, *shards, key)
+
+    def write(self, key, data, overwrite=False):
+        path = self.path(key)
+        if overwrite or not os.path.exists(path):
+            atomic_write(path, data)
+
+    def exists(self, key):
+        return os.path.exists(self.path(key))
+
+    def delete(self, key):
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+
+    def keys(self):
+        for directory, _, files in os.walk(self.root):
+            for filename in files:
+                if not filename.startswith('.tmp-'):
+                    yield filename
+
+    def location(self, key):
+        return self.path(key)
+
+    @contextmanager
+    def local_path(self, key):
+        yield self.path(key)
+
+
+class ObjectStoreStandIn(BlobStore):
+    """Local-directory stand-in for an S3-style object store
+
+    Objects sit in a flat 'bucket' directory and are only reachable through
+    put/get-style calls: local_path() downloads a private temporary copy,
+    exactly as a remote object store client would have to.
+    """
+
+    name = 'object_store_standin'
+
+    def __init__(self, root, prefix='photos/'):
+        self.bucket = root
+        self.prefix = prefix
+
+    def _object_path(self, key):
+        # Object keys may contain '/', the bucket directory is flat
+        return os.path.join(self.bucket, (self.prefix + key).replace('/', '%2F'))
+
+    def write(self, key, data, overwrite=False):
+        if overwrite or not self.exists(key):
+            atomic_write(self._object_path(key), data)
+
+    def exists(self, key):
+        return os.path.exists(self._object_path(key))
+
+    def delete(self, key):
+        try:
+            os.remove(self._object_path(key))
+        except FileNotFoundError:
+            pass
+
+    def keys(self):
+        if not os.path.isdir(self.bucket):
+            return
+        encoded_prefix = self.prefix.replace('/', '%2F')
+        for name in os.listdir(self.bucket):
+            if name.startswith(encoded_prefix):
+                yield name[len(encoded_prefix):]
+
+    def location(self, key):
+        return f"object://{os.path.basename(self.bucket)}/{self.prefix}{key}"
+
+    @contextmanager
+    def local_path(self, key):
+        extension = os.path.splitext(key)[1]
+        fd, temp_path = tempfile.mkstemp(suffix=extension)
+        try:
+            with os.fdopen(fd, 'wb') as f, open(self._object_path(key), 'rb') as source:
+                shutil.copyfileobj(source, f)
+            yield temp_path
+        finally:
+            os.remove(temp_path)
+
+
+BLOB_STORE_BACKENDS = {
+    LocalBlobStore.name: LocalBlobStore,
+    ObjectStoreStandIn.name: ObjectStoreStandIn,
+}
+
+
+def create_blob_store(backend, **options):
+    """Instantiate a blob store backend by name"""
+    try:
+        store_class = BLOB_STORE_BACKENDS[backend]
+    except KeyError:
+        raise ValueError(
+            f"Unknown photo store backend '{backend}'. "
+            f"Available: {', '.join(sorted(BLOB_STORE_BACKENDS))}"
+        )
+    return store_class(**options)
+
+
+def blob_store_options(settings, backend):
+    """Collect constructor options for a blob store from a config object"""
+    options = {'root': settings.PHOTO_STORE_ROOT}
+    if backend == LocalBlobStore.name:
+        options['fanout'] = settings.PHOTO_STORE_FANOUT
+    return options
+
+
+class PhotoStore:
+    """Content-addressed, deduplicated photo storage with reference counts
+
+    Identical uploads share one blob. Every save() adds a reference in the
+    photo_blobs collection with an atomic $inc, release() drops one.
+    Blobs whose count reached zero are only deleted by collect_garbage()
+    after a grace period.
+
+    A re-upload of the same content can still race a collection, so the
+    reference is taken before the blob is written and collection marks the
+    reference document (collecting) before deleting the blob and clears or
+    removes it afterwards. A save() that lands on a marked document waits
+    until the collection of that blob is over and then writes the blob
+    again, so it never loses its file.
+    """
+
+    def __init__(self, blobs, collection_wait_s=30.0):
+        self.blobs = blobs
+        self.collection_wait_s = collection_wait_s
+
+    def save(self, db, data, extension, kind):
+        """Take a reference to an upload and store it; returns its key"""
+        key = content_key(data, extension)
+        previous = db[REFS_COLLECTION].find_one_and_update(
+            {'_id': key},
+            {
+                '$inc': {'refcount': 1},
+                '$addToSet': {'kinds': kind},
+                '$set': {'size': len(data), 'updated_at': datetime.utcnow()}
+            },
+            upsert=True,
+            return_document=ReturnDocument.BEFORE
+        )
+        if previous is not None and previous.get('collecting'):
+            self._write_after_collection(db, key, data)
+        else:
+            self.blobs.write(key, data)
+        return key
+
+    def _write_after_collection(self, db, key, data):
+        """Re-write a blob that collect_garbage() is deleting, once it is done"""
+        deadline = time.monotonic() + self.collection_wait_s
+        while time.monotonic() < deadline and db[REFS_COLLECTION].find_one({'_id': key, 'collecting': True}):
+            time.sleep(0.05)
+        self.blobs.write(key, data, overwrite=True)
+        # Still marked only if the collection died half-way
+        db[REFS_COLLECTION].update_one({'_id': key}, {'$unset': {'collecting': ''}})
+
+    def release(self, db, key):
+        """Drop one reference to a stored photo"""
+        if not key:
+            return
+        db[REFS_COLLECTION].update_one(
+            {'_id': key, 'refcount': {'$gt': 0}},
+            {'$inc': {'refcount': -1}, '$set': {'updated_at': datetime.utcnow()}}
+        )
+
+    def local_path(self, key):
+        """Context manager yielding a readable filesystem path for a key"""
+        return self.blobs.local_path(key)
+
+    def keys(self):
+        """Every stored photo key"""
+        return self.blobs.keys()
+
+    def collect_garbage(self, db, grace_seconds=3600):
+        """Delete blobs unreferenced for longer than grace_seconds; returns the count"""
+        cutoff = datetime.utcnow() - timedelta(seconds=grace_seconds)
+        removed = 0
+        for doc in db[REFS_COLLECTION].find({'refcount': {'$lte': 0}, 'updated_at': {'$lt': cutoff}}):
+            # Only collect if no save() took a new reference in the meantime; a
+            # save() from here on sees the mark and re-writes the blob after us
+            marked = db[REFS_COLLECTION].update_one(
+                {'_id': doc['_id'], 'refcount': {'$lte': 0}, 'updated_at': doc['updated_at']},
+                {'$set': {'collecting': True}}
+            )
+            if not marked.modified_count:
+                continue
+            self.blobs.delete(doc['_id'])
+            result = db[REFS_COLLECTION].delete_one({'_id': doc['_id'], 'refcount': {'$lte': 0}})
+            if result.deleted_count:
+                removed += 1
+            else:
+                db[REFS_COLLECTION].update_one({'_id': doc['_id']}, {'$unset': {'collecting': ''}})
+        logger.info(f"🧹 Removed {removed} unreferenced photos")
+        return removed
+
+
+def create_photo_store(settings):
+    """Build the PhotoStore configured by PHOTO_STORE_BACKEND"""
+    backend = settings.PHOTO_STORE_BACKEND
+    return PhotoStore(create_blob_store(backend, **blob_store_options(settings, backend)))
+
+
+photo_store = create_photo_store(get_active_config())
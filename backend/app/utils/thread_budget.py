@@ -0,0 +1,207 @@
+import os
+import sys
+import math
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Read by OpenMP and the BLAS libraries NumPy, OpenCV and TensorFlow load,
+# once, when they are first loaded
+BLAS_ENV_VARS = ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS', 'BLIS_NUM_THREADS',
+                 'VECLIB_MAXIMUM_THREADS', 'NUMEXPR_NUM_THREADS')
+
+# Read by the TensorFlow runtime when it creates its thread pools
+TF_INTRA_OP_ENV = 'TF_NUM_INTRAOP_THREADS'
+TF_INTER_OP_ENV = 'TF_NUM_INTEROP_THREADS'
+
+
+def cgroup_cpu_limit():
+    """CPU quota of this container in cores (rounded up), or None if unlimited"""
+    try:
+        # cgroup v2
+        with open('/sys/fs/cgroup/cpu.max') as f:
+            quota, period = f.read().split()[:2]
+        if quota != 'max':
+            return max(1, math.ceil(int(quota) / int(period)))
+        return None
+    except (OSError, ValueError):
+        pass
+    try:
+        # cgroup v1
+        with open('/sys/fs/cgroup/cpu/cpu.cfs_quota_us') as f:
+            quota = int(f.read())
+        with open('/sys/fs/cgroup/cpu/cpu.cfs_period_us') as f:
+            period = int(f.read())
+        return max(1, math.ceil(quota / period)) if quota > 0 else None
+    except (OSError, ValueError):
+        return None
+
+
+def available_cores():
+    """Cores this process may run on: CPU affinity, capped by the container quota"""
+    try:
+        cores = len(os.sched_getaffinity(0))
+    except AttributeError:  # macOS, Windows
+        cores = os.cpu_count() or 1
+    limit = cgroup_cpu_limit()
+    return min(cores, limit) if limit else cores
+
+
+class ThreadBudget:
+    """How one worker process's share of the host's cores is split among thread pools
+
+    The host's cores are divided evenly among `workers` processes (gunicorn
+    -w, or WEB_CONCURRENCY). Inside a process, ml_slots jobs run at once
+    (the ML scheduler) and each gets threads_per_job cores for the pools a
+    job calls into from its own thread: OpenCV and BLAS. TensorFlow and
+    ONNX Runtime keep one intra-op pool per process that concurrent jobs
+    share, so they get the whole process share and one inter-op thread.
+    Any value may be pinned in config; 0 means derived.
+    """
+
+    def __init__(self, cores, workers=1, ml_slots=0, threads_per_job=0, tf_intra_op=0, tf_inter_op=0,
+                 opencv_threads=0, blas_threads=0, gallery_shards=0):
+        self.cores = cores
+        self.workers = max(1, workers)
+        self.process_cores = max(1, cores // self.workers)
+        self.ml_slots = ml_slots or self.process_cores
+        self.threads_per_job = threads_per_job or max(1, self.process_cores // self.ml_slots)
+        self.tf_intra_op = tf_intra_op or self.process_cores
+        self.tf_inter_op = tf_inter_op or 1
+        self.opencv_threads = opencv_threads or self.threads_per_job
+        self.blas_threads = blas_threads or self.threads_per_job
+        self.gallery_shards = gallery_shards or self.process_cores
+        self.applied = {}
+
+    @classmethod
+    def from_settings(cls, settings):
+        return cls(
+            settings.CPU_BUDGET_CORES or available_cores(),
+            workers=settings.CPU_BUDGET_WORKERS,
+            ml_slots=settings.ML_SCHEDULER_SLOTS,
+            threads_per_job=settings.CPU_BUDGET_THREADS_PER_JOB,
+            tf_intra_op=settings.TF_INTRA_OP_THREADS,
+            tf_inter_op=settings.TF_INTER_OP_THREADS,
+            opencv_threads=settings.OPENCV_THREADS,
+            blas_threads=settings.BLAS_THREADS,
+            gallery_shards=settings.GALLERY_MATCH_SHARDS
+        )
+
+    def apply(self):
+        """Size the BLAS/OpenMP, TensorFlow and OpenCV pools of this process
+
+        Environment variables only take effect for libraries not loaded
+        yet, which is why this runs when the app package is first imported.
+        Variables already set in the environment are left alone. Libraries
+        that were loaded earlier are resized through their own APIs where
+        they have one (threadpoolctl for BLAS if installed, TensorFlow's
+        threading config until its runtime starts).
+        """
+        applied = {}
+        for name in BLAS_ENV_VARS:
+            applied[name] = _set_env(name, self.blas_threads)
+        applied[TF_INTRA_OP_ENV] = _set_env(TF_INTRA_OP_ENV, self.tf_intra_op)
+        applied[TF_INTER_OP_ENV] = _set_env(TF_INTER_OP_ENV, self.tf_inter_op)
+
+        if 'numpy' in sys.modules:
+            try:
+                from threadpoolctl import threadpool_limits
+                threadpool_limits(self.blas_threads)
+                applied['blas_runtime'] = 'threadpoolctl'
+            except ImportError:
+                applied['blas_runtime'] = 'loaded before the budget; environment not applied'
+
+        if 'tensorflow' in sys.modules:
+            tf = sys.modules['tensorflow']
+            try:
+                tf.config.threading.set_intra_op_parallelism_threads(self.tf_intra_op)
+                tf.config.threading.set_inter_op_parallelism_threads(self.tf_inter_op)
+                applied['tensorflow_runtime'] = 'configured'
+            except (RuntimeError, AttributeError) as e:
+                applied['tensorflow_runtime'] = f"already initialized: {e}"
+
+        try:
+            import cv2
+            cv2.setNumThreads(self.opencv_threads)
+            applied['opencv'] = cv2.getNumThreads()
+        except (ImportError, AttributeError) as e:
+            applied['opencv'] = f"not configured: {e}"
+
+        self.applied = applied
+        logger.info(
+            f"✅ Thread budget: {self.cores} cores / {self.workers} workers = {self.process_cores} per process; "
+            f"{self.ml_slots} ML slots x {self.threads_per_job} threads (OpenCV {self.opencv_threads}, "
+            f"BLAS {self.blas_threads}), TF intra {self.tf_intra_op} / inter {self.tf_inter_op}"
+        )
+        return self
+
+    def stats(self):
+        """The planned layout and what each library was actually set to"""
+        actual = {}
+        cv2 = sys.modules.get('cv2')
+        if cv2 is not None and hasattr(cv2, 'getNumThreads'):
+            actual['opencv'] = cv2.getNumThreads()
+        tf = sys.modules.get('tensorflow')
+        if tf is not None:
+            try:
+                actual['tf_intra_op'] = tf.config.threading.get_intra_op_parallelism_threads()
+                actual['tf_inter_op'] = tf.config.threading.get_inter_op_parallelism_threads()
+            except AttributeError:
+                pass
+        try:
+            from threadpoolctl import threadpool_info
+            actual['blas'] = [
+                {'library': pool['internal_api'], 'threads': pool['num_threads']} for pool in threadpool_info()
+            ]
+        except ImportError:
+            actual['blas_env'] = {name: os.environ.get(name) for name in ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS')}
+        return {
+            'cores': self.cores,
+            'workers': self.workers,
+            'process_cores': self.process_cores,
+            'ml_slots': self.ml_slots,
+            'threads_per_job': self.threads_per_job,
+            'opencv_threads': self.opencv_threads,
+            'blas_threads': self.blas_threads,
+            'tf_intra_op': self.tf_intra_op,
+            'tf_inter_op': self.tf_inter_op,
+            'gallery_shards': self.gallery_shards,
+            'applied': self.applied,
+            'actual': actual
+        }
+
+
+def _set_env(name, value):
+    """Set a thread-count variable unless the environment already pins it; returns the value in effect"""
+    if name in os.environ:
+        return os.environ[name]
+    os.environ[name] = str(value)
+    return os.environ[name]
+
+
+_budget = None
+
+
+def apply_thread_budget(settings=None):
+    """Plan and apply this process's thread budget once; returns it (None when disabled)"""
+    global _budget
+    if _budget is None:
+        if settings is None:
+            from config import get_active_config
+            settings = get_active_config()
+        if not settings.CPU_BUDGET_ENABLED:
+            return None
+        _budget = ThreadBudget.from_settings(settings).apply()
+    return _budget
+
+
+def thread_budget():
+    """The applied budget, or None when CPU_BUDGET_ENABLED is off"""
+    return _budget
+
+
+def intra_op_threads(configured=0):
+    """Intra-op threads for an inference session: as configured, else the budget's (0 = runtime default)"""
+    if configured or _budget is None:
+        return configured
+    return _budget.tf_intra_op
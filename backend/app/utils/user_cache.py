@@ -0,0 +1,42 @@
+import time
+import logging
+from bson import ObjectId
+from app.utils.cache import TTLLRUCache
+from app.utils.metrics import register_metrics_provider
+from config import get_active_config
+
+logger = logging.getLogger(__name__)
+
+# Fields served from the cache; password_hash never leaves Mongo this way
+USER_CACHE_FIELDS = {
+    'username': 1,
+    'email': 1,
+    'profile_photo': 1,
+    'face_embedding': 1,
+    'face_confidence': 1
+}
+
+_settings = get_active_config()
+user_cache = TTLLRUCache(maxsize=_settings.USER_CACHE_SIZE, ttl=_settings.USER_CACHE_TTL)
+register_metrics_provider('user_cache', user_cache.stats)
+
+def get_user(db, user_id):
+    """Get a user record by id, served from the shared TTL+LRU cache"""
+    return user_cache.get_or_load(
+        user_id,
+        lambda: db.users.find_one({'_id': ObjectId(user_id)}, USER_CACHE_FIELDS)
+    )
+
+async def get_user_async(async_db, user_id):
+    """Async variant of get_user for the ASGI serving mode"""
+    user = user_cache.get(user_id)
+    if user is None:
+        loaded_at = time.monotonic()
+        user = await async_db.users.find_one({'_id': ObjectId(user_id)}, USER_CACHE_FIELDS)
+        if user is not None:
+            user_cache.put(user_id, user, loaded_at)
+    return user
+
+def invalidate_user(user_id):
+    """Drop a user's cached record after it was modified"""
+    user_cache.invalidate(user_id)
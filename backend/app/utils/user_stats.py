@@ -0,0 +1,163 @@
+import logging
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# One document per user (_id = user id string), kept current by the matcher
+# so /stats is a single lookup however many photos the user appears in
+STATS_COLLECTION = 'user_stats'
+
+COUNTERS = (
+    'photos_uploaded', 'faces_detected',
+    'photos_matched', 'face_appearances',
+    'videos_matched', 'video_appearances'
+)
+
+
+def _per_user_matches(faces_data):
+    """{user_id: (appearances, best similarity)} over one photo's or video's faces"""
+    per_user = {}
+    for face in faces_data:
+        match = face.get('matched_user')
+        if not match:
+            continue
+        appearances, best = per_user.get(match['user_id'], (0, 0.0))
+        per_user[match['user_id']] = (appearances + 1, max(best, match['similarity']))
+    return per_user
+
+
+def _match_updates(per_user, matched_at, count_field, appearances_field):
+    """(user id, update) pairs for the users matched in one photo or video"""
+    latest = {'best_similarity': None}
+    if matched_at is not None:
+        latest['last_match_at'] = matched_at
+    updates = []
+    for user_id, (appearances, best) in per_user.items():
+        latest['best_similarity'] = best
+        updates.append((user_id, {
+            '$inc': {count_field: 1, appearances_field: appearances},
+            '$max': dict(latest),
+            '$set': {'updated_at': datetime.utcnow()}
+        }))
+    return updates
+
+
+def _apply(db, updates):
+    # One atomic upsert per user; a photo matches a handful of users at most
+    for user_id, update in updates:
+        db[STATS_COLLECTION].update_one({'_id': user_id}, update, upsert=True)
+
+
+def record_photo_stats(db, photo, faces_data):
+    """Count one newly processed group photo for its uploader and matched users
+
+    photo is the group_photos document as it was before processing (for
+    uploaded_by and upload_date); callers only pass it when the photo had
+    not been processed yet, so a photo is never counted twice.
+    """
+    updates = _match_updates(
+        _per_user_matches(faces_data), photo.get('upload_date'), 'photos_matched', 'face_appearances'
+    )
+    if photo.get('uploaded_by') is not None:
+        updates.append((str(photo['uploaded_by']), {
+            '$inc': {'photos_uploaded': 1, 'faces_detected': len(faces_data)},
+            '$set': {'updated_at': datetime.utcnow()}
+        }))
+    try:
+        _apply(db, updates)
+    except Exception as e:
+        # Off by one photo until the next repair run
+        logger.error(f"❌ Could not update user stats for photo {photo['_id']}: {e}")
+
+
+def record_video_stats(db, video, faces_data):
+    """Count one newly processed event video for the users matched in it"""
+    updates = _match_updates(
+        _per_user_matches(faces_data), video.get('upload_date'), 'videos_matched', 'video_appearances'
+    )
+    try:
+        _apply(db, updates)
+    except Exception as e:
+        logger.error(f"❌ Could not update user stats for video {video['_id']}: {e}")
+
+
+def format_user_stats(stats):
+    """Counters as returned by /stats"""
+    data = {name: stats.get(name, 0) for name in COUNTERS}
+    data['best_similarity'] = stats.get('best_similarity')
+    last_match_at = stats.get('last_match_at')
+    data['last_match_at'] = last_match_at.isoformat() if last_match_at else None
+    return data
+
+
+def _source_stats(db):
+    """Recompute every user's counters from group_photos and event_videos"""
+    totals = {}
+
+    def add(user_id, **values):
+        entry = totals.setdefault(user_id, {name: 0 for name in COUNTERS})
+        for name, value in values.items():
+            if name in ('best_similarity', 'last_match_at'):
+                if value is not None and (entry.get(name) is None or value > entry[name]):
+                    entry[name] = value
+            else:
+                entry[name] += value
+
+    projection = {'uploaded_by': 1, 'upload_date': 1, 'faces_detected.matched_user': 1}
+    for photo in db.group_photos.find({'processed': True}, projection):
+        faces = photo.get('faces_detected') or []
+        if photo.get('uploaded_by') is not None:
+            add(str(photo['uploaded_by']), photos_uploaded=1, faces_detected=len(faces))
+        for user_id, (appearances, best) in _per_user_matches(faces).items():
+            add(user_id, photos_matched=1, face_appearances=appearances,
+                best_similarity=best, last_match_at=photo.get('upload_date'))
+
+    projection = {'upload_date': 1, 'tracks.matched_user': 1}
+    for video in db.event_videos.find({'processed': True}, projection):
+        for user_id, (appearances, best) in _per_user_matches(video.get('tracks') or []).items():
+            add(user_id, videos_matched=1, video_appearances=appearances,
+                best_similarity=best, last_match_at=video.get('upload_date'))
+    return totals
+
+
+def rebuild_user_stats(db, dry_run=False):
+    """Repair job: recompute all counters from source and fix any that drifted
+
+    Returns how many users were checked, how many had wrong counters and a
+    sample of the differences. Increments landing while the job runs can be
+    overwritten, so run it when uploads are quiet (or simply run it twice).
+    """
+    totals = _source_stats(db)
+    stored = {doc['_id']: doc for doc in db[STATS_COLLECTION].find()}
+    fields = COUNTERS + ('best_similarity', 'last_match_at')
+    drifted = []
+    writes = []
+    for user_id, expected in totals.items():
+        current = stored.get(user_id, {})
+        differences = {
+            name: (current.get(name, 0 if name in COUNTERS else None), expected.get(name))
+            for name in fields
+            if current.get(name, 0 if name in COUNTERS else None) != expected.get(name)
+        }
+        if differences:
+            drifted.append((user_id, differences))
+            writes.append((user_id, dict(expected, updated_at=datetime.utcnow())))
+    # Users left with no photos at all (e.g. after a data cleanup)
+    orphans = [user_id for user_id in stored if user_id not in totals]
+
+    if not dry_run:
+        for user_id, counters in writes:
+            db[STATS_COLLECTION].replace_one({'_id': user_id}, counters, upsert=True)
+        if orphans:
+            db[STATS_COLLECTION].delete_many({'_id': {'$in': orphans}})
+        logger.info(f"🧹 User stats repaired: {len(drifted)} of {len(totals)} users fixed, {len(orphans)} removed")
+    return {
+        'users': len(totals),
+        'drifted': len(drifted),
+        'removed': len(orphans),
+        'dry_run': dry_run,
+        'sample': [
+            {'user_id': user_id, 'differences': {name: list(values) for name, values in differences.items()}}
+            for user_id, differences in drifted[:20]
+        ]
+    }
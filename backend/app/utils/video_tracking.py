@@ -0,0 +1,246 @@
+import time
+import logging
+import cv2
+import numpy as np
+from app.utils.face_quality import pose_scores, sharpness_scores
+
+logger = logging.getLogger(__name__)
+
+# Crops are scored against these when picking the best one of a track
+BEST_CROP_SIZE = 160  # FaceNet input side; larger crops are not better
+BEST_CROP_SHARPNESS = 100.0  # Laplacian variance treated as fully sharp
+
+
+def box_iou(boxes_a, boxes_b):
+    """Pairwise IoU of two sets of [x, y, w, h] boxes, shape (len(a), len(b))"""
+    a = np.asarray(boxes_a, dtype=np.float32).reshape(-1, 4)
+    b = np.asarray(boxes_b, dtype=np.float32).reshape(-1, 4)
+    ax2, ay2 = a[:, 0] + a[:, 2], a[:, 1] + a[:, 3]
+    bx2, by2 = b[:, 0] + b[:, 2], b[:, 1] + b[:, 3]
+    inter_w = np.clip(np.minimum(ax2[:, None], bx2[None]) - np.maximum(a[:, 0, None], b[None, :, 0]), 0, None)
+    inter_h = np.clip(np.minimum(ay2[:, None], by2[None]) - np.maximum(a[:, 1, None], b[None, :, 1]), 0, None)
+    inter = inter_w * inter_h
+    union = (a[:, 2] * a[:, 3])[:, None] + (b[:, 2] * b[:, 3])[None] - inter
+    return np.where(union > 0, inter / np.maximum(union, 1e-6), 0.0)
+
+
+def crop_scores(crops, confidences, keypoints_list):
+    """Relative quality of face crops for choosing one per track
+
+    Product of detector confidence, size and sharpness (each capped at 1)
+    and frontalness from the landmarks (1 when there are none).
+    """
+    sizes = np.array([min(crop.shape[:2]) for crop in crops], dtype=np.float32)
+    sharpness = sharpness_scores(crops)
+    yaw, _ = pose_scores(keypoints_list)
+    frontal = 1.0 - np.clip(np.nan_to_num(yaw, nan=0.0), 0.0, 1.0)
+    return (np.asarray(confidences, dtype=np.float32)
+            * np.minimum(sizes / BEST_CROP_SIZE, 1.0)
+            * np.minimum(sharpness / BEST_CROP_SHARPNESS, 1.0)
+            * frontal)
+
+
+class Track:
+    """One face followed across keyframes, holding only its best crop"""
+
+    def __init__(self, track_id, frame, timestamp, box):
+        self.track_id = track_id
+        self.box = box
+        self.first_frame = self.last_frame = frame
+        self.start_s = self.end_s = timestamp
+        self.hits = 0
+        self.missed = 0
+        self.best_score = -1.0
+        self.best = None  # dict of crop, box, confidence, keypoints, frame, timestamp
+
+    def observe(self, frame, timestamp, detection, crop, score):
+        self.box = detection['box']
+        self.last_frame, self.end_s = frame, timestamp
+        self.hits += 1
+        self.missed = 0
+        if score > self.best_score:
+            self.best_score = float(score)
+            self.best = {
+                'crop': crop.copy(),
+                'box': detection['box'],
+                'confidence': detection['confidence'],
+                'keypoints': detection.get('keypoints'),
+                'frame': frame,
+                'timestamp': timestamp
+            }
+
+
+class FaceTracker:
+    """Associates keyframe detections into tracks by IoU
+
+    Before matching, each live track's box is moved by the median sparse
+    optical flow (Lucas-Kanade) of corner points inside it, from the
+    previous keyframe to this one, so faces that moved more than their own
+    width between keyframes still overlap their new detection. Detections
+    are then assigned greedily by IoU. A track that goes unmatched for more
+    than max_missed keyframes is finished.
+    """
+
+    def __init__(self, iou_threshold=0.3, max_missed=2, optical_flow=True):
+        self.iou_threshold = iou_threshold
+        self.max_missed = max_missed
+        self.optical_flow = optical_flow
+        self.active = []
+        self._next_id = 0
+        self._previous_gray = None
+
+    def _predict(self, gray):
+        """Shift live track boxes by the optical flow since the last keyframe"""
+        if not self.optical_flow or self._previous_gray is None or not self.active:
+            return [track.box for track in self.active]
+        predicted = []
+        for track in self.active:
+            x, y, w, h = track.box
+            mask = np.zeros_like(self._previous_gray)
+            mask[max(0, y):y + h, max(0, x):x + w] = 255
+            points = cv2.goodFeaturesToTrack(self._previous_gray, 20, 0.01, 3, mask=mask)
+            if points is None:
+                predicted.append(track.box)
+                continue
+            moved, status, _ = cv2.calcOpticalFlowPyrLK(self._previous_gray, gray, points, None)
+            good = status.reshape(-1) == 1
+            if not good.any():
+                predicted.append(track.box)
+                continue
+            dx, dy = np.median((moved - points).reshape(-1, 2)[good], axis=0)
+            predicted.append([int(round(x + dx)), int(round(y + dy)), w, h])
+        return predicted
+
+    def update(self, frame, timestamp, gray, detections, crops, scores):
+        """Feed one keyframe; returns (finished tracks, number of new tracks)"""
+        predicted = self._predict(gray)
+        self._previous_gray = gray
+
+        unmatched_tracks = set(range(len(self.active)))
+        unmatched_detections = set(range(len(detections)))
+        if self.active and detections:
+            iou = box_iou(predicted, [d['box'] for d in detections])
+            for flat in np.argsort(iou, axis=None)[::-1]:
+                t, d = np.unravel_index(flat, iou.shape)
+                if iou[t, d] < self.iou_threshold:
+                    break
+                if t in unmatched_tracks and d in unmatched_detections:
+                    self.active[t].observe(frame, timestamp, detections[d], crops[d], scores[d])
+                    unmatched_tracks.discard(t)
+                    unmatched_detections.discard(d)
+
+        finished = []
+        for t in sorted(unmatched_tracks, reverse=True):
+            track = self.active[t]
+            track.missed += 1
+            if track.missed > self.max_missed:
+                finished.append(self.active.pop(t))
+
+        for d in sorted(unmatched_detections):
+            track = Track(self._next_id, frame, timestamp, detections[d]['box'])
+            track.observe(frame, timestamp, detections[d], crops[d], scores[d])
+            self.active.append(track)
+            self._next_id += 1
+        return finished, len(unmatched_detections)
+
+    def finish(self):
+        """End every live track (end of video)"""
+        finished, self.active = self.active, []
+        return finished
+
+
+class AdaptiveStride:
+    """Keyframe spacing that follows how much the scene is changing
+
+    Starts at the minimum interval. A keyframe where faces appeared or
+    tracks were lost halves the stride; a keyframe where every face was
+    already tracked (or there were none) grows it by half, up to the
+    maximum interval.
+    """
+
+    def __init__(self, fps, min_interval_s=0.2, max_interval_s=2.0):
+        self.min_stride = max(1, int(round(fps * min_interval_s)))
+        self.max_stride = max(self.min_stride, int(round(fps * max_interval_s)))
+        self.stride = self.min_stride
+
+    def update(self, new_tracks, lost_tracks):
+        if new_tracks or lost_tracks:
+            self.stride = max(self.min_stride, self.stride // 2)
+        else:
+            self.stride = min(self.max_stride, max(self.stride + 1, int(self.stride * 1.5)))
+        return self.stride
+
+
+def scan_video(video_path, detect, tracker, min_interval_s=0.2, max_interval_s=2.0):
+    """Detect on keyframes of a video and track faces between them
+
+    detect(rgb_frame) returns detections in the make_detection() format.
+    Frames between keyframes are only grabbed, never retrieved or converted.
+    Returns (finished tracks, stats) where stats include the video
+    duration and video-seconds processed per wall-second.
+    """
+    capture = cv2.VideoCapture(video_path)
+    if not capture.isOpened():
+        raise ValueError(f"Could not open video: {video_path}")
+
+    started = time.perf_counter()
+    fps = capture.get(cv2.CAP_PROP_FPS) or 25.0
+    stride = AdaptiveStride(fps, min_interval_s, max_interval_s)
+    finished = []
+    frame = 0  # frames grabbed so far
+    next_keyframe = 0
+    keyframes = 0
+    detections_total = 0
+    try:
+        while capture.grab():
+            index = frame
+            frame += 1
+            if index < next_keyframe:
+                continue
+            ok, image = capture.retrieve()
+            if not ok:
+                break
+            timestamp = index / fps
+            rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+            del image
+
+            h_img, w_img = rgb.shape[:2]
+            detections, crops = [], []
+            for detection in detect(rgb) or []:
+                x, y, w, h = detection['box']
+                x, y = min(max(0, x), w_img - 1), min(max(0, y), h_img - 1)
+                w, h = min(w, w_img - x), min(h, h_img - y)
+                if w <= 0 or h <= 0:
+                    continue
+                detections.append(dict(detection, box=[x, y, w, h]))
+                crops.append(rgb[y:y + h, x:x + w])
+            scores = crop_scores(crops, [d['confidence'] for d in detections],
+                                 [d.get('keypoints') for d in detections]) if crops else []
+
+            ended, new_tracks = tracker.update(index, timestamp, gray, detections, crops, scores)
+            finished.extend(ended)
+            next_keyframe = index + stride.update(new_tracks, len(ended))
+            keyframes += 1
+            detections_total += len(detections)
+    finally:
+        capture.release()
+    finished.extend(tracker.finish())
+
+    wall_s = time.perf_counter() - started
+    duration_s = frame / fps
+    stats = {
+        'fps': round(fps, 3),
+        'frames': frame,
+        'keyframes': keyframes,
+        'detections': detections_total,
+        'tracks': len(finished),
+        'duration_s': round(duration_s, 3),
+        'wall_s': round(wall_s, 3),
+        'video_s_per_wall_s': round(duration_s / wall_s, 2) if wall_s > 0 else None
+    }
+    logger.info(
+        f"📈 {video_path}: {frame} frames, {keyframes} keyframes, {len(finished)} tracks, "
+        f"{stats['video_s_per_wall_s']} video-s/wall-s"
+    )
+    return finished, stats
@@ -0,0 +1,5 @@
+import os
+from app.asgi import create_asgi_app
+
+# Create ASGI application instance (serve with e.g. `hypercorn asgi:app`)
+app = create_asgi_app(os.getenv('FLASK_ENV', 'production'))
@@ -3,16 +3,191 @@ from datetime import timedelta
 
 class Config:
     # MongoDB Configuration
-    MONGO_URI = 'mongodb://localhost:27017/facial_recognition'
+    MONGO_URI = os.getenv('MONGO_URI', 'mongodb://localhost:27017/facial_recognition')
     
     # JWT Configuration
     JWT_SECRET_KEY = 'your-secret-key-change-in-production'
     JWT_ACCESS_TOKEN_EXPIRES = timedelta(hours=24)
     
     # Upload Configuration
-    UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads')
+    UPLOAD_FOLDER = os.getenv('UPLOAD_FOLDER', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads'))
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
     
+    # Content-addressed photo storage (deduplicated, reference counted)
+    PHOTO_STORE_BACKEND = os.getenv('PHOTO_STORE_BACKEND', 'local')  # local or object_store_standin
+    PHOTO_STORE_ROOT = os.getenv('PHOTO_STORE_ROOT', os.path.join(UPLOAD_FOLDER, 'photos'))
+    PHOTO_STORE_FANOUT = int(os.getenv('PHOTO_STORE_FANOUT', '2'))  # levels of 2-hex-digit subdirectories
+    PHOTO_STORE_GC_GRACE_S = int(os.getenv('PHOTO_STORE_GC_GRACE_S', '3600'))  # unreferenced photos kept this long
+    
+    # Memory-mapped gallery snapshot shared by all workers on a host
+    GALLERY_SNAPSHOT_ENABLED = os.getenv('GALLERY_SNAPSHOT_ENABLED', 'true').lower() == 'true'
+    GALLERY_DIR = os.getenv('GALLERY_DIR', os.path.join(UPLOAD_FOLDER, 'gallery'))
+    GALLERY_REFRESH_INTERVAL_S = float(os.getenv('GALLERY_REFRESH_INTERVAL_S', '1'))  # how often workers look for new versions/deltas
+    GALLERY_COMPACT_INTERVAL_S = float(os.getenv('GALLERY_COMPACT_INTERVAL_S', '30'))
+    GALLERY_COMPACT_MIN_DELTAS = int(os.getenv('GALLERY_COMPACT_MIN_DELTAS', '100'))  # enrollments before a new snapshot
+    GALLERY_PQ_ENABLED = os.getenv('GALLERY_PQ_ENABLED', 'true').lower() == 'true'  # product-quantized snapshot codes
+    GALLERY_PQ_SUBSPACES = int(os.getenv('GALLERY_PQ_SUBSPACES', '16'))  # code bytes per user; must divide 128
+    GALLERY_PQ_MIN_USERS = int(os.getenv('GALLERY_PQ_MIN_USERS', '5000'))  # smaller snapshots are matched exactly
+    GALLERY_PQ_RERANK = int(os.getenv('GALLERY_PQ_RERANK', '64'))  # candidates per face re-scored exactly
+    GALLERY_PQ_TRAIN_SAMPLE = int(os.getenv('GALLERY_PQ_TRAIN_SAMPLE', '65536'))  # embeddings used for k-means
+    GALLERY_MATCH_SHARDS = int(os.getenv('GALLERY_MATCH_SHARDS', '1'))  # threads splitting each search; 0 = one per budgeted core
+    GALLERY_SHARD_MIN_ROWS = int(os.getenv('GALLERY_SHARD_MIN_ROWS', '20000'))  # smaller galleries use one thread
+    
+    # Enrollment change feed keeping the galleries of all API nodes in sync
+    GALLERY_FEED_ENABLED = os.getenv('GALLERY_FEED_ENABLED', 'true').lower() == 'true'
+    GALLERY_FEED_POLL_INTERVAL_S = float(os.getenv('GALLERY_FEED_POLL_INTERVAL_S', '0.5'))  # also the change stream await time
+    GALLERY_FEED_GAP_TIMEOUT_S = float(os.getenv('GALLERY_FEED_GAP_TIMEOUT_S', '5'))  # wait for in-flight sequence numbers
+    GALLERY_FEED_RETENTION_S = int(os.getenv('GALLERY_FEED_RETENTION_S', str(7 * 24 * 3600)))  # older nodes rebuild from db.users
+    
+    # Async (ASGI) serving mode, see asgi.py
+    ASYNC_ML_WORKERS = int(os.getenv('ASYNC_ML_WORKERS', '0'))  # 0 = ML scheduler slots + ML_SHED_MAX_QUEUED
+    ASYNC_IO_WORKERS = int(os.getenv('ASYNC_IO_WORKERS', '16'))  # photo store and database calls
+    ASYNC_BODY_TIMEOUT = int(os.getenv('ASYNC_BODY_TIMEOUT', '300'))  # seconds allowed for slow uploads
+    
+    # Authenticated-identity cache shared by all blueprints
+    USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', '10000'))
+    USER_CACHE_TTL = float(os.getenv('USER_CACHE_TTL', '30'))  # seconds
+    
+    # Password hashing runs on its own small pool so login bursts cannot starve uploads
+    PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', '2'))
+    PASSWORD_HASH_MAX_PENDING = int(os.getenv('PASSWORD_HASH_MAX_PENDING', '32'))
+    
+    # Cached /my-photos results
+    MY_PHOTOS_CACHE_SIZE = int(os.getenv('MY_PHOTOS_CACHE_SIZE', '10000'))  # users kept in memory
+    MY_PHOTOS_DEFAULT_PER_PAGE = 50
+    MY_PHOTOS_MAX_PER_PAGE = 200
+    
+    # Face Detection Configuration
+    FACE_DETECTOR_BACKEND = os.getenv('FACE_DETECTOR_BACKEND', 'mtcnn')  # mtcnn, opencv_dnn or stub
+    FACE_DETECTOR_MODEL_PATH = os.getenv(
+        'FACE_DETECTOR_MODEL_PATH',
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models', 'face_detection_yunet_2023mar.onnx')
+    )
+    FACE_DETECTOR_SCORE_THRESHOLD = float(os.getenv('FACE_DETECTOR_SCORE_THRESHOLD', '0.9'))
+    
+    # Cascade prefilter on a grayscale thumbnail before detection (group photos)
+    FACE_PREFILTER_ENABLED = os.getenv('FACE_PREFILTER_ENABLED', 'false').lower() == 'true'
+    FACE_PREFILTER_ACTION = os.getenv('FACE_PREFILTER_ACTION', 'roi')  # roi, or skip (face-free images only)
+    FACE_PREFILTER_CASCADES = os.getenv(
+        'FACE_PREFILTER_CASCADES', 'haarcascade_frontalface_default.xml,haarcascade_profileface.xml'
+    )
+    FACE_PREFILTER_CASCADE_DIR = os.getenv('FACE_PREFILTER_CASCADE_DIR')  # default: cv2.data.haarcascades
+    FACE_PREFILTER_THUMBNAIL_SIZE = int(os.getenv('FACE_PREFILTER_THUMBNAIL_SIZE', '640'))  # long side, px
+    FACE_PREFILTER_SCALE_FACTOR = float(os.getenv('FACE_PREFILTER_SCALE_FACTOR', '1.1'))
+    FACE_PREFILTER_MIN_NEIGHBORS = int(os.getenv('FACE_PREFILTER_MIN_NEIGHBORS', '2'))  # 1 = most conservative
+    FACE_PREFILTER_MIN_SIZE = int(os.getenv('FACE_PREFILTER_MIN_SIZE', '20'))  # thumbnail px
+    FACE_PREFILTER_ROI_MARGIN = float(os.getenv('FACE_PREFILTER_ROI_MARGIN', '0.75'))  # times the hit's side
+    FACE_PREFILTER_MAX_ROI_FRACTION = float(os.getenv('FACE_PREFILTER_MAX_ROI_FRACTION', '0.5'))  # else full image
+    FACE_PREFILTER_AUDIT_RATE = float(os.getenv('FACE_PREFILTER_AUDIT_RATE', '0.01'))  # full detection to check skips
+    
+    # Face quality gate between detection and embedding (group photos)
+    FACE_QUALITY_ENABLED = os.getenv('FACE_QUALITY_ENABLED', 'true').lower() == 'true'
+    FACE_QUALITY_ACTION = os.getenv('FACE_QUALITY_ACTION', 'drop')  # drop, or defer (stored without embedding)
+    FACE_QUALITY_MIN_SIZE = int(os.getenv('FACE_QUALITY_MIN_SIZE', '40'))  # shorter box side, full-resolution px
+    FACE_QUALITY_MIN_CONFIDENCE = float(os.getenv('FACE_QUALITY_MIN_CONFIDENCE', '0.9'))
+    FACE_QUALITY_MIN_SHARPNESS = float(os.getenv('FACE_QUALITY_MIN_SHARPNESS', '40'))  # Laplacian variance, 64 px gray
+    FACE_QUALITY_MAX_YAW = float(os.getenv('FACE_QUALITY_MAX_YAW', '0.35'))  # nose offset / eye distance
+    FACE_QUALITY_MAX_ROLL = float(os.getenv('FACE_QUALITY_MAX_ROLL', '30'))  # degrees
+    
+    # Event video ingestion: detection on adaptive keyframes, tracking in between
+    VIDEO_MIN_KEYFRAME_INTERVAL_S = float(os.getenv('VIDEO_MIN_KEYFRAME_INTERVAL_S', '0.2'))  # while faces come and go
+    VIDEO_MAX_KEYFRAME_INTERVAL_S = float(os.getenv('VIDEO_MAX_KEYFRAME_INTERVAL_S', '2'))  # while the scene is stable
+    VIDEO_TRACK_IOU_THRESHOLD = float(os.getenv('VIDEO_TRACK_IOU_THRESHOLD', '0.3'))
+    VIDEO_TRACK_MAX_MISSED = int(os.getenv('VIDEO_TRACK_MAX_MISSED', '2'))  # keyframes before a track ends
+    VIDEO_MIN_TRACK_HITS = int(os.getenv('VIDEO_MIN_TRACK_HITS', '1'))  # shorter tracks are not embedded
+    VIDEO_OPTICAL_FLOW = os.getenv('VIDEO_OPTICAL_FLOW', 'true').lower() == 'true'
+    
+    # Face Embedding Configuration
+    EMBEDDING_BACKEND = os.getenv('EMBEDDING_BACKEND', 'keras')  # keras, onnx, opencv_dnn or synthetic
+    EMBEDDING_KERAS_PATH = os.getenv('EMBEDDING_KERAS_PATH')  # searched in the usual places when unset
+    EMBEDDING_ONNX_PATH = os.getenv(
+        'EMBEDDING_ONNX_PATH',
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models', 'facenet.onnx')
+    )
+    EMBEDDING_PRECISION = os.getenv('EMBEDDING_PRECISION', 'float32')  # float32 or int8 (onnx/opencv_dnn only)
+    EMBEDDING_INT8_PATH = os.getenv(
+        'EMBEDDING_INT8_PATH',
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models', 'facenet_int8.onnx')
+    )
+    EMBEDDING_BATCH_BUCKETS = (1, 2, 4, 8, 16, 32)
+    EMBEDDING_INTRA_OP_THREADS = int(os.getenv('EMBEDDING_INTRA_OP_THREADS', '0'))  # 0 = thread budget (process cores)
+    
+    # Model-versioned embeddings and re-embedding migrations (scripts/reembed_faces.py)
+    EMBEDDING_MODEL_VERSION = os.getenv('EMBEDDING_MODEL_VERSION', 'facenet-v1')  # tag of the EMBEDDING_BACKEND model
+    EMBEDDING_LEGACY_VERSION = os.getenv('EMBEDDING_LEGACY_VERSION', 'facenet-v1')  # embeddings stored before versioning
+    EMBEDDING_TARGET_VERSION = os.getenv('EMBEDDING_TARGET_VERSION')  # set to migrate to a new model
+    EMBEDDING_TARGET_BACKEND = os.getenv('EMBEDDING_TARGET_BACKEND', 'onnx')
+    EMBEDDING_TARGET_MODEL_PATH = os.getenv('EMBEDDING_TARGET_MODEL_PATH')
+    EMBEDDING_VERSION_CHECK_INTERVAL_S = float(os.getenv('EMBEDDING_VERSION_CHECK_INTERVAL_S', '5'))  # cut-over pickup
+    REEMBED_BATCH_SIZE = int(os.getenv('REEMBED_BATCH_SIZE', '32'))
+    REEMBED_MAX_PHOTOS_PER_S = float(os.getenv('REEMBED_MAX_PHOTOS_PER_S', '5'))  # 0 = unthrottled
+    REEMBED_ALLOW_FAILURES = os.getenv('REEMBED_ALLOW_FAILURES', 'false').lower() == 'true'  # cut over despite failures
+    
+    # Cross-request micro-batching of embedding inference
+    INFERENCE_BATCHING_ENABLED = os.getenv('INFERENCE_BATCHING_ENABLED', 'true').lower() == 'true'
+    INFERENCE_MAX_BATCH_SIZE = int(os.getenv('INFERENCE_MAX_BATCH_SIZE', '32'))  # keep <= largest bucket
+    INFERENCE_MAX_WAIT_MS = float(os.getenv('INFERENCE_MAX_WAIT_MS', '5'))
+    
+    # Priority / fair-share scheduling of ML jobs (enrollment > group upload > bulk)
+    ML_SCHEDULER_SLOTS = int(os.getenv('ML_SCHEDULER_SLOTS', '0'))  # concurrent ML jobs, 0 = one per budgeted core
+    ML_SCHEDULER_MAX_PER_USER = int(os.getenv('ML_SCHEDULER_MAX_PER_USER', '2'))
+    ML_SCHEDULER_AGING_S = float(os.getenv('ML_SCHEDULER_AGING_S', '10'))  # waiting this long promotes a job one class
+    ML_SCHEDULER_TIMEOUT = float(os.getenv('ML_SCHEDULER_TIMEOUT', '60'))  # seconds queued before 503
+    GROUP_UPLOAD_DEADLINE_S = float(os.getenv('GROUP_UPLOAD_DEADLINE_S', '120'))  # 0 = none; X-Request-Timeout-Ms shortens it
+    
+    # CPU thread budget: the host's cores split among worker processes and their
+    # TensorFlow, OpenCV and BLAS pools (applied when the app package is imported)
+    CPU_BUDGET_ENABLED = os.getenv('CPU_BUDGET_ENABLED', 'true').lower() == 'true'
+    CPU_BUDGET_CORES = int(os.getenv('CPU_BUDGET_CORES', '0'))  # 0 = CPU affinity, capped by the container quota
+    CPU_BUDGET_WORKERS = int(os.getenv('CPU_BUDGET_WORKERS', os.getenv('WEB_CONCURRENCY', '1')))  # processes per host
+    CPU_BUDGET_THREADS_PER_JOB = int(os.getenv('CPU_BUDGET_THREADS_PER_JOB', '0'))  # 0 = process cores / ML slots
+    TF_INTRA_OP_THREADS = int(os.getenv('TF_INTRA_OP_THREADS', '0'))  # 0 = process cores (one pool shared by jobs)
+    TF_INTER_OP_THREADS = int(os.getenv('TF_INTER_OP_THREADS', '0'))  # 0 = 1
+    OPENCV_THREADS = int(os.getenv('OPENCV_THREADS', '0'))  # 0 = threads per job
+    BLAS_THREADS = int(os.getenv('BLAS_THREADS', '0'))  # 0 = threads per job
+    
+    # Token-bucket rate limits per user (or IP when anonymous), as advertised by /api/docs
+    RATE_LIMIT_ENABLED = os.getenv('RATE_LIMIT_ENABLED', 'true').lower() == 'true'
+    RATE_LIMIT_BACKEND = os.getenv('RATE_LIMIT_BACKEND', 'memory')  # memory (per process) or mongo (shared by all nodes)
+    RATE_LIMIT_MONGO_URI = os.getenv('RATE_LIMIT_MONGO_URI', MONGO_URI)  # mongomock:// for a local stand-in
+    RATE_LIMIT_MAX_KEYS = int(os.getenv('RATE_LIMIT_MAX_KEYS', '100000'))  # in-process buckets kept
+    RATE_LIMIT_PER_IP = os.getenv('RATE_LIMIT_PER_IP', '300 per minute')  # per client IP across all limited endpoints
+    RATE_LIMIT_TRUST_FORWARDED = os.getenv('RATE_LIMIT_TRUST_FORWARDED', 'false').lower() == 'true'  # behind a proxy
+    RATE_LIMITS = {
+        'register': os.getenv('RATE_LIMIT_REGISTER', '5 per minute'),
+        'login': os.getenv('RATE_LIMIT_LOGIN', '10 per minute'),
+        'profile': os.getenv('RATE_LIMIT_PROFILE', '100 per hour'),
+        'upload_profile': os.getenv('RATE_LIMIT_UPLOAD_PROFILE', '20 per hour'),
+        'upload_group': os.getenv('RATE_LIMIT_UPLOAD_GROUP', '50 per hour'),
+        'my_photos': os.getenv('RATE_LIMIT_MY_PHOTOS', '100 per hour'),
+        'test_ml': os.getenv('RATE_LIMIT_TEST_ML', '10 per minute'),
+        'stats': os.getenv('RATE_LIMIT_STATS', '50 per hour')
+    }
+    
+    # Load shedding: new uploads get 503 + Retry-After while the ML scheduler is overloaded
+    ML_SHED_MAX_QUEUED = int(os.getenv('ML_SHED_MAX_QUEUED', '32'))  # queued jobs; 0 = never shed on depth
+    ML_SHED_MAX_LATENCY_MS = float(os.getenv('ML_SHED_MAX_LATENCY_MS', '15000'))  # recent enqueue-to-done time; 0 = off
+    
+    # Memory admission control for image decoding and detection
+    MEMORY_BUDGET_MB = int(os.getenv('MEMORY_BUDGET_MB', '1024'))  # per process, for in-flight images
+    MEMORY_ADMISSION_TIMEOUT = float(os.getenv('MEMORY_ADMISSION_TIMEOUT', '30'))  # seconds queued before giving up
+    MAX_DECODE_PIXELS = int(os.getenv('MAX_DECODE_PIXELS', str(16 * 1000 * 1000)))  # larger images are decoded reduced
+    RSS_SAMPLE_INTERVAL_MS = float(os.getenv('RSS_SAMPLE_INTERVAL_MS', '0'))  # 0 = start/end only; >0 = a thread per image
+    
+    # On-demand profiling of upload requests (profiles land in request_profiles)
+    PROFILING_TOKEN = os.getenv('PROFILING_TOKEN')  # X-Profile-Token value; unset disables header and admin control
+    PROFILING_SAMPLE_RATE = float(os.getenv('PROFILING_SAMPLE_RATE', '0'))  # fraction of uploads profiled at random
+    PROFILING_MODE = os.getenv('PROFILING_MODE', 'sampling')  # sampling or cprofile
+    PROFILING_INTERVAL_MS = float(os.getenv('PROFILING_INTERVAL_MS', '5'))  # stack sampling interval
+    
+    # Synthetic embeddings (EMBEDDING_BACKEND=synthetic, and the fallback when no model loads)
+    SYNTHETIC_POPULATION = int(os.getenv('SYNTHETIC_POPULATION', '10000'))  # distinct identities
+    SYNTHETIC_SEED = int(os.getenv('SYNTHETIC_SEED', '0'))
+    SYNTHETIC_NOISE = float(os.getenv('SYNTHETIC_NOISE', '0.05'))  # per-face spread around the identity
+    SYNTHETIC_LATENCY_MS = float(os.getenv('SYNTHETIC_LATENCY_MS', '0'))  # per forward pass
+    SYNTHETIC_LATENCY_PER_FACE_MS = float(os.getenv('SYNTHETIC_LATENCY_PER_FACE_MS', '0'))
+    SYNTHETIC_LATENCY_JITTER = float(os.getenv('SYNTHETIC_LATENCY_JITTER', '0'))  # lognormal sigma
+    
     # Security
     SECRET_KEY = 'dev-secret-key-change-in-production'
     
@@ -31,3 +206,7 @@ config = {
     'production': ProductionConfig,
     'default': DevelopmentConfig
 }
+
+def get_active_config():
+    """Get the config class selected by FLASK_ENV"""
+    return config.get(os.getenv('FLASK_ENV', 'default'), config['default'])
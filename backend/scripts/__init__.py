@@ -0,0 +1 @@
+# Scripts package initialization - keep this file empty
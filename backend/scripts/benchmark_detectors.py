@@ -0,0 +1,139 @@
+"""Compare face detector backends on the bundled sample images.
+
+Usage (from the backend directory):
+    python -m scripts.benchmark_detectors [--backends mtcnn opencv_dnn stub]
+                                          [--reference mtcnn] [--repeat 3]
+
+Every profile photo is assumed to contain exactly one face. Group photos are
+scored against the reference backend's boxes, or against a labels file
+({"filename": [[x, y, w, h], ...]}) passed with --labels.
+"""
+import argparse
+import json
+import os
+import statistics
+import time
+
+import cv2
+
+from app.utils.face_detectors import create_detector, detector_options
+from config import get_active_config
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.gif')
+
+
+def iou(box_a, box_b):
+    """Intersection over union of two [x, y, w, h] boxes"""
+    ax, ay, aw, ah = box_a
+    bx, by, bw, bh = box_b
+    ix = max(0, min(ax + aw, bx + bw) - max(ax, bx))
+    iy = max(0, min(ay + ah, by + bh) - max(ay, by))
+    inter = ix * iy
+    union = aw * ah + bw * bh - inter
+    return inter / union if union > 0 else 0.0
+
+
+def count_hits(truth, predicted, threshold=0.5):
+    """Count ground-truth boxes matched by a prediction with IoU >= threshold"""
+    hits = 0
+    unused = list(predicted)
+    for gt_box in truth:
+        best = max(unused, key=lambda p: iou(gt_box, p), default=None)
+        if best is not None and iou(gt_box, best) >= threshold:
+            hits += 1
+            unused.remove(best)
+    return hits
+
+
+def load_images(upload_folder):
+    """Load sample images as (kind, filename, rgb_image) tuples"""
+    images = []
+    for kind in ('profiles', 'groups'):
+        folder = os.path.join(upload_folder, kind)
+        if not os.path.isdir(folder):
+            continue
+        for name in sorted(os.listdir(folder)):
+            if not name.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            image = cv2.imread(os.path.join(folder, name))
+            if image is None:
+                print(f"⚠️ Skipping unreadable image: {name}")
+                continue
+            images.append((kind, name, cv2.cvtColor(image, cv2.COLOR_BGR2RGB)))
+    return images
+
+
+def run_backend(detector, images, repeat):
+    """Return per-image boxes and latencies (ms) for one backend"""
+    boxes, latencies = {}, []
+    for _, name, rgb_image in images:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            detections = detector.detect(rgb_image)
+            latencies.append((time.perf_counter() - start) * 1000)
+        boxes[name] = [d['box'] for d in detections]
+    return boxes, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--backends', nargs='+', default=['mtcnn', 'opencv_dnn', 'stub'])
+    parser.add_argument('--reference', default='mtcnn',
+                        help='Backend whose group-photo boxes are used as ground truth')
+    parser.add_argument('--labels', help='JSON file with ground-truth boxes per filename')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    settings = get_active_config()
+    images = load_images(settings.UPLOAD_FOLDER)
+    print(f"📂 Loaded {len(images)} sample images")
+
+    results = {}
+    for backend in args.backends:
+        try:
+            start = time.perf_counter()
+            detector = create_detector(backend, **detector_options(settings, backend))
+            load_ms = (time.perf_counter() - start) * 1000
+        except Exception as e:
+            print(f"⚠️ Backend '{backend}' unavailable: {e}")
+            continue
+        # Warm up once so lazy graph construction is not timed
+        if images:
+            detector.detect(images[0][2])
+        boxes, latencies = run_backend(detector, images, args.repeat)
+        results[backend] = {'boxes': boxes, 'latencies': latencies, 'load_ms': load_ms}
+
+    labels = {}
+    if args.labels:
+        with open(args.labels) as f:
+            labels = json.load(f)
+    elif args.reference in results:
+        labels = {
+            name: results[args.reference]['boxes'][name]
+            for kind, name, _ in images if kind == 'groups'
+        }
+
+    print(f"\n{'backend':<12} {'load ms':>9} {'p50 ms':>8} {'p95 ms':>8} "
+          f"{'profile recall':>15} {'group recall':>13}")
+    for backend, result in results.items():
+        latencies = sorted(result['latencies'])
+        p50 = statistics.median(latencies) if latencies else 0.0
+        p95 = latencies[int(0.95 * (len(latencies) - 1))] if latencies else 0.0
+
+        profile_names = [name for kind, name, _ in images if kind == 'profiles']
+        profile_hits = sum(1 for name in profile_names if result['boxes'][name])
+        profile_recall = profile_hits / len(profile_names) if profile_names else 0.0
+
+        truth_total = sum(len(b) for b in labels.values())
+        truth_hits = sum(
+            count_hits(truth, result['boxes'].get(name, []))
+            for name, truth in labels.items()
+        )
+        group_recall = f"{truth_hits / truth_total:.2%}" if truth_total else 'n/a'
+
+        print(f"{backend:<12} {result['load_ms']:>9.1f} {p50:>8.1f} {p95:>8.1f} "
+              f"{profile_recall:>15.2%} {group_recall:>13}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""Measure cold start, memory and per-face latency of each embedding runtime.
+
+Usage (from the backend directory):
+    python -m scripts.benchmark_embedders [--backends keras onnx opencv_dnn]
+                                          [--batch-sizes 1 8 32] [--iterations 20]
+
+Each backend is measured in a fresh interpreter so import time and resident
+memory are not shared between runtimes.
+"""
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import time
+
+
+def measure(backend, batch_sizes, iterations):
+    """Run inside a child process and return the measurements as a dict"""
+    start = time.perf_counter()
+    import numpy as np
+    from app.utils.face_embedders import create_embedder, embedder_options
+    from config import get_active_config
+
+    settings = get_active_config()
+    embedder = create_embedder(backend, **embedder_options(settings, backend))
+    embedder.embed(np.zeros((1, 160, 160, 3), dtype='float32'))
+    cold_start_s = time.perf_counter() - start
+
+    rng = np.random.default_rng(0)
+    per_face_ms = {}
+    for batch_size in batch_sizes:
+        batch = rng.standard_normal((batch_size, 160, 160, 3)).astype('float32')
+        embedder.embed(batch)  # warm up this bucket
+        begin = time.perf_counter()
+        for _ in range(iterations):
+            embedder.embed(batch)
+        elapsed = time.perf_counter() - begin
+        per_face_ms[batch_size] = elapsed * 1000 / (iterations * batch_size)
+
+    # ru_maxrss is reported in kilobytes on Linux
+    rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return {'cold_start_s': cold_start_s, 'rss_mb': rss_mb, 'per_face_ms': per_face_ms}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--backends', nargs='+', default=['keras', 'onnx', 'opencv_dnn'])
+    parser.add_argument('--batch-sizes', nargs='+', type=int, default=[1, 8, 32])
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(measure(args.child, args.batch_sizes, args.iterations)))
+        return
+
+    header = f"{'backend':<12} {'cold start s':>13} {'peak RSS MB':>12}"
+    header += ''.join(f" {'ms/face @' + str(b):>13}" for b in args.batch_sizes)
+    print(header)
+
+    for backend in args.backends:
+        command = [sys.executable, '-m', 'scripts.benchmark_embedders', '--child', backend,
+                   '--iterations', str(args.iterations), '--batch-sizes',
+                   *map(str, args.batch_sizes)]
+        proc = subprocess.run(command, capture_output=True, text=True)
+        if proc.returncode != 0:
+            reason = proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else 'failed'
+            print(f"{backend:<12} unavailable: {reason}")
+            continue
+        result = json.loads(proc.stdout.strip().splitlines()[-1])
+        row = f"{backend:<12} {result['cold_start_s']:>13.2f} {result['rss_mb']:>12.0f}"
+        row += ''.join(f" {result['per_face_ms'][str(b)]:>13.2f}" for b in args.batch_sizes)
+        print(row)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+"""Measure memory, recall and threshold agreement of the product-quantized gallery.
+
+Usage (from the backend directory):
+    python -m scripts.benchmark_pq_gallery [--users 100000] [--queries 2000] [--subspaces 16]
+                                           [--rerank 8 16 32 64 128] [--json]
+
+A synthetic gallery of unit-norm identities is matched twice with the same
+GalleryView code used in production: exactly (float32 dot products against
+every row) and through PQ codes with an exact re-rank of the top candidates.
+Half of the queries are noisy views of enrolled identities, with noise
+spread so their true cosine straddles the 0.6 threshold; the rest are
+impostors. Reported per re-rank depth: recall@1 (on the genuine queries) of
+the ADC ranking alone and after re-ranking, and how often the final
+decision over all queries (no match, or which user) equals the exact one.
+"""
+import json
+import time
+import argparse
+
+import numpy as np
+
+from app.utils.gallery import GalleryView, normalize_rows
+from app.utils.pq import ProductQuantizer
+
+THRESHOLD = 0.6
+
+
+def synthetic_identities(users, dim, intrinsic_dim, rng):
+    """Unit vectors; with intrinsic_dim, concentrated near a subspace as real embeddings are"""
+    if not intrinsic_dim:
+        return normalize_rows(rng.standard_normal((users, dim)))
+    basis = rng.standard_normal((intrinsic_dim, dim))
+    return normalize_rows(rng.standard_normal((users, intrinsic_dim)) @ basis + 0.3 * rng.standard_normal((users, dim)))
+
+
+def decisions(matches):
+    return [match['user_id'] if match else None for match in matches]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--queries', type=int, default=2000)
+    parser.add_argument('--dim', type=int, default=128)
+    parser.add_argument('--subspaces', type=int, default=16)
+    parser.add_argument('--rerank', type=int, nargs='+', default=[8, 16, 32, 64, 128])
+    parser.add_argument('--intrinsic-dim', type=int, default=32,
+                        help='Rank of the structure in the synthetic identities; 0 = isotropic (worst case for PQ)')
+    parser.add_argument('--train-sample', type=int, default=65536)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    identities = synthetic_identities(args.users, args.dim, args.intrinsic_dim, rng)
+    user_ids = np.array([f"{i:024x}" for i in range(args.users)], dtype='U24')
+    usernames = np.array([f"user{i}" for i in range(args.users)])
+
+    genuine = args.queries // 2
+    targets = rng.choice(args.users, genuine, replace=False)
+    # Per-dimension noise for cosines of about 0.85 down to 0.5 around the 0.6 threshold
+    sigma = rng.uniform(0.05, 0.15, size=(genuine, 1)) / np.sqrt(args.dim / 128)
+    queries = np.concatenate([
+        identities[targets] + sigma * rng.standard_normal((genuine, args.dim)),
+        synthetic_identities(args.queries - genuine, args.dim, args.intrinsic_dim, rng)
+    ]).astype('float32')
+
+    exact_view = GalleryView(1, identities, user_ids, usernames)
+    started = time.perf_counter()
+    exact = decisions(exact_view.best_matches(queries, threshold=THRESHOLD))
+    exact_ms = (time.perf_counter() - started) * 1000 / len(queries)
+    exact_rows = (normalize_rows(queries) @ identities.T).argmax(axis=1)
+
+    started = time.perf_counter()
+    quantizer = ProductQuantizer.train(identities, args.subspaces, sample=args.train_sample, seed=args.seed)
+    train_s = time.perf_counter() - started
+    started = time.perf_counter()
+    codes = quantizer.encode(identities)
+    encode_s = time.perf_counter() - started
+
+    tables = quantizer.adc_tables(normalize_rows(queries))
+    adc_rows = np.array([quantizer.scores(table, codes).argmax() for table in tables])
+
+    results = []
+    for rerank in args.rerank:
+        view = GalleryView(1, identities, user_ids, usernames, codes=codes, quantizer=quantizer, rerank=rerank)
+        started = time.perf_counter()
+        approximate = decisions(view.best_matches(queries, threshold=THRESHOLD))
+        pq_ms = (time.perf_counter() - started) * 1000 / len(queries)
+        rows, _ = view._reranked_best(normalize_rows(queries))
+        results.append({
+            'rerank': rerank,
+            'recall_at_1': round(float((rows[:genuine] == exact_rows[:genuine]).mean()), 4),
+            'decision_agreement': round(float(np.mean([a == b for a, b in zip(approximate, exact)])), 4),
+            'decisions_changed': int(sum(a != b for a, b in zip(approximate, exact))),
+            'ms_per_face': round(pq_ms, 3),
+            'exact_bytes_read_per_face': rerank * args.dim * 4
+        })
+
+    exact_bytes = args.dim * 4
+    code_bytes = args.subspaces + quantizer.codebooks.nbytes / args.users
+    report = {
+        'users': args.users,
+        'queries': args.queries,
+        'genuine_queries': genuine,
+        'exact_matches': int(sum(d is not None for d in exact)),
+        'subspaces': args.subspaces,
+        'train_s': round(train_s, 2),
+        'encode_s': round(encode_s, 2),
+        'reconstruction_mse': round(quantizer.reconstruction_error(identities[:10000]), 4),
+        'memory': {
+            'exact_bytes_per_user': exact_bytes,
+            # A Python list of 128 floats as read from Mongo
+            'mongo_list_bytes_per_user': 56 + 8 * args.dim + 24 * args.dim,
+            'pq_resident_bytes_per_user': round(code_bytes, 2),
+            'reduction_vs_float32': round(exact_bytes / code_bytes, 1),
+            'exact_total_mb': round(args.users * exact_bytes / 2 ** 20, 1),
+            'pq_total_mb': round(args.users * code_bytes / 2 ** 20, 2)
+        },
+        'exact_ms_per_face': round(exact_ms, 3),
+        'adc_only_recall_at_1': round(float((adc_rows[:genuine] == exact_rows[:genuine]).mean()), 4),
+        'reranked': results
+    }
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    memory = report['memory']
+    print(f"{args.users} users, {args.queries} queries ({genuine} genuine, {report['exact_matches']} exact matches)")
+    print(f"Codebooks: {args.subspaces} x 256, trained in {report['train_s']} s, encoded in {report['encode_s']} s, "
+          f"reconstruction MSE {report['reconstruction_mse']}")
+    print(f"Memory per user: {memory['exact_bytes_per_user']} B float32 "
+          f"({memory['mongo_list_bytes_per_user']} B as a Mongo list) -> {memory['pq_resident_bytes_per_user']} B codes "
+          f"({memory['reduction_vs_float32']}x); gallery {memory['exact_total_mb']} MB -> {memory['pq_total_mb']} MB")
+    print(f"Exact: {report['exact_ms_per_face']} ms/face; ADC-only recall@1 {report['adc_only_recall_at_1']:.2%}")
+    print(f"{'rerank':>7} {'recall@1':>9} {'0.6 agreement':>14} {'changed':>8} {'ms/face':>8}")
+    for row in results:
+        print(f"{row['rerank']:>7} {row['recall_at_1']:>9.2%} {row['decision_agreement']:>14.2%} "
+              f"{row['decisions_changed']:>8} {row['ms_per_face']:>8}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""Measure how gallery matching scales with the number of search shards.
+
+Usage (from the backend directory):
+    python -m scripts.benchmark_sharded_matching [--users 500000] [--faces 12] [--shards 1 2 4 8]
+                                                 [--pq] [--repeat 20] [--json]
+
+A synthetic gallery is searched with the production GalleryView code, once
+per shard count, for batches of --faces faces (one group photo each). Shard
+count 1 runs on the calling thread as with GALLERY_MATCH_SHARDS=1; larger
+counts use a ShardPool. Reported per shard count: photos per second, ms per
+photo, speedup and parallel efficiency against one shard, and whether every
+match equals the single-shard result. The curve flattens where the host's
+memory bandwidth (or its core count) runs out; BLAS threads compete with
+the shards, so compare runs with OPENBLAS_NUM_THREADS=1 as well.
+"""
+import os
+import json
+import time
+import argparse
+
+import numpy as np
+
+from app.utils.gallery import GalleryView, ShardPool
+from app.utils.pq import ProductQuantizer
+from scripts.benchmark_pq_gallery import synthetic_identities
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=500000)
+    parser.add_argument('--faces', type=int, default=12, help='Faces per photo (one search batch)')
+    parser.add_argument('--dim', type=int, default=128)
+    parser.add_argument('--shards', type=int, nargs='+',
+                        default=sorted({1, 2, 4, 8, os.cpu_count() or 1}))
+    parser.add_argument('--pq', action='store_true', help='Search PQ codes with exact re-rank')
+    parser.add_argument('--rerank', type=int, default=64)
+    parser.add_argument('--repeat', type=int, default=20, help='Photos timed per shard count')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    identities = synthetic_identities(args.users, args.dim, 32, rng)
+    user_ids = np.array([f"{i:024x}" for i in range(args.users)], dtype='U24')
+    usernames = np.array([f"user{i}" for i in range(args.users)])
+    codes = quantizer = None
+    if args.pq:
+        quantizer = ProductQuantizer.train(identities, seed=args.seed)
+        codes = quantizer.encode(identities)
+    view = GalleryView(1, identities, user_ids, usernames, codes=codes, quantizer=quantizer, rerank=args.rerank)
+
+    photos = []
+    for _ in range(args.repeat):
+        targets = rng.choice(args.users, args.faces, replace=False)
+        photos.append(identities[targets] + 0.08 * rng.standard_normal((args.faces, args.dim)))
+
+    results = []
+    reference = None
+    for shards in args.shards:
+        pool = ShardPool(shards, min_rows=0) if shards > 1 else None
+        view.best_matches(photos[0], pool=pool)  # warm up threads and page cache
+        started = time.perf_counter()
+        matches = [view.best_matches(faces, pool=pool) for faces in photos]
+        elapsed = time.perf_counter() - started
+        if pool is not None:
+            pool.shutdown()
+        if reference is None:
+            reference = matches
+        per_photo_ms = elapsed * 1000 / len(photos)
+        results.append({
+            'shards': shards,
+            'photos_per_s': round(len(photos) / elapsed, 2),
+            'ms_per_photo': round(per_photo_ms, 2),
+            'identical_to_one_shard': matches == reference
+        })
+    base_ms = results[0]['ms_per_photo']
+    for row in results:
+        row['speedup'] = round(base_ms / row['ms_per_photo'], 2)
+        row['efficiency'] = round(row['speedup'] / (row['shards'] / results[0]['shards']), 2)
+
+    report = {
+        'users': args.users,
+        'faces_per_photo': args.faces,
+        'mode': 'pq' if args.pq else 'exact',
+        'cpu_count': os.cpu_count(),
+        'gallery_mb': round(identities.nbytes / 2 ** 20, 1),
+        'results': results
+    }
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f"{args.users} users ({report['gallery_mb']} MB float32, {report['mode']}), "
+          f"{args.faces} faces per photo, {report['cpu_count']} CPUs")
+    print(f"{'shards':>6} {'photos/s':>9} {'ms/photo':>9} {'speedup':>8} {'efficiency':>11} {'identical':>10}")
+    for row in results:
+        print(f"{row['shards']:>6} {row['photos_per_s']:>9} {row['ms_per_photo']:>9} {row['speedup']:>8} "
+              f"{row['efficiency']:>11.0%} {str(row['identical_to_one_shard']):>10}")
+
+
+if __name__ == '__main__':
+    main()
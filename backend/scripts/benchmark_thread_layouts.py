@@ -0,0 +1,202 @@
+"""Find the worker x thread layout that gets the most ML work out of this host.
+
+Usage (from the backend directory):
+    python -m scripts.benchmark_thread_layouts [--workers 1 2 4] [--slots 1 2 4] [--threads 1 2 4]
+                                               [--seconds 10] [--embedder] [--json]
+
+Every combination of worker processes, ML slots per worker and threads per
+job that fits the host's cores (workers x slots x threads <= cores, plus one
+layout per worker count that lets the libraries pick their own thread counts)
+is started as that many fresh processes. Each sets the layout through the
+CPU_BUDGET_* variables before importing the app, exactly as gunicorn workers
+would, and runs its slots as concurrent jobs for --seconds: image decode-size
+OpenCV work, a matrix product standing in for inference and a gallery search.
+--embedder runs the configured embedding backend instead of the stand-in.
+Thread-count variables already set in the shell (OMP_NUM_THREADS etc.) are
+cleared for the workers so that each layout is applied as planned.
+Reported per layout: jobs per second across all workers, p50/p95 job latency
+and the thread counts the budget applied; the layout with the best
+throughput is recommended as CPU_BUDGET_WORKERS (gunicorn -w),
+ML_SCHEDULER_SLOTS and CPU_BUDGET_THREADS_PER_JOB.
+"""
+import os
+import json
+import time
+import argparse
+import itertools
+import multiprocessing
+
+
+def layouts(cores, workers, slots, threads):
+    """(workers, slots, threads) combinations that fit cores; threads 0 = unmanaged"""
+    found = []
+    for w in workers:
+        found.append((w, 1, 0))
+        for s, t in itertools.product(slots, threads):
+            if w * s * t <= cores:
+                found.append((w, s, t))
+    return found
+
+
+def run_worker(layout, cores, seconds, use_embedder, ready, start, results):
+    """One worker process: apply the layout, then run its slots until time is up"""
+    workers, slots, threads = layout
+    os.environ['CPU_BUDGET_CORES'] = str(cores)
+    if threads:
+        os.environ['CPU_BUDGET_WORKERS'] = str(workers)
+        os.environ['ML_SCHEDULER_SLOTS'] = str(slots)
+        os.environ['CPU_BUDGET_THREADS_PER_JOB'] = str(threads)
+    else:
+        os.environ['CPU_BUDGET_ENABLED'] = 'false'
+
+    from app.utils.thread_budget import apply_thread_budget
+    budget = apply_thread_budget()
+
+    import threading
+    import cv2
+    import numpy as np
+
+    rng = np.random.default_rng(os.getpid())
+    image = rng.integers(0, 255, (1080, 1440, 3), dtype=np.uint8)
+    weights = rng.standard_normal((1024, 1024)).astype(np.float32)
+    gallery = rng.standard_normal((50000, 128)).astype(np.float32)
+    embedder = None
+    if use_embedder:
+        from config import get_active_config
+        from app.utils.face_embedders import create_embedder, embedder_options
+        settings = get_active_config()
+        embedder = create_embedder(settings.EMBEDDING_BACKEND,
+                                   **embedder_options(settings, settings.EMBEDDING_BACKEND))
+        faces = rng.standard_normal((8, 160, 160, 3)).astype(np.float32)
+
+    def job():
+        resized = cv2.resize(image, (720, 540), interpolation=cv2.INTER_AREA)
+        gray = cv2.GaussianBlur(cv2.cvtColor(resized, cv2.COLOR_BGR2GRAY), (5, 5), 0)
+        if embedder is not None:
+            embeddings = np.asarray(embedder.embed(faces), dtype=np.float32)
+        else:
+            activations = gray[:256, :256].astype(np.float32).reshape(64, 1024) @ weights
+            embeddings = np.tanh(activations[:, :128])
+        np.argmax(embeddings @ gallery.T, axis=1)
+
+    job()  # warm up pools and caches
+    latencies = []
+    lock = threading.Lock()
+
+    def slot(deadline):
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            job()
+            with lock:
+                latencies.append(time.perf_counter() - started)
+
+    ready.wait()
+    start.wait()
+    deadline = time.perf_counter() + seconds
+    pool = [threading.Thread(target=slot, args=(deadline,)) for _ in range(slots)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    results.put({
+        'latencies': latencies,
+        'applied': {
+            'opencv': cv2.getNumThreads(),
+            'blas': os.environ.get('OPENBLAS_NUM_THREADS') or os.environ.get('OMP_NUM_THREADS'),
+            'tf_intra_op': budget.tf_intra_op if budget else None
+        }
+    })
+
+
+def measure(layout, cores, seconds, use_embedder):
+    workers, slots, threads = layout
+    context = multiprocessing.get_context('spawn')
+    ready = context.Barrier(workers + 1)
+    start = context.Event()
+    results = context.Queue()
+    processes = [
+        context.Process(target=run_worker, args=(layout, cores, seconds, use_embedder, ready, start, results))
+        for _ in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    ready.wait()
+    start.set()
+    reports = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    latencies = sorted(latency for report in reports for latency in report['latencies'])
+    if not latencies:
+        return None
+    return {
+        'workers': workers,
+        'slots': slots,
+        'threads_per_job': threads or 'unmanaged',
+        'jobs_per_s': round(len(latencies) / seconds, 2),
+        'p50_ms': round(latencies[len(latencies) // 2] * 1000, 1),
+        'p95_ms': round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000, 1),
+        'applied': reports[0]['applied']
+    }
+
+
+def main():
+    # Importing the app applies this process's own budget to the environment
+    # the workers would inherit; plan with it, then hand them a clean one
+    environ = dict(os.environ)
+    from app.utils.thread_budget import available_cores, BLAS_ENV_VARS, TF_INTRA_OP_ENV, TF_INTER_OP_ENV
+    os.environ.clear()
+    os.environ.update({
+        name: value for name, value in environ.items()
+        if name not in BLAS_ENV_VARS + (TF_INTRA_OP_ENV, TF_INTER_OP_ENV) and not name.startswith('CPU_BUDGET_')
+        and name != 'ML_SCHEDULER_SLOTS'
+    })
+
+    cores = available_cores()
+    powers = sorted({2 ** i for i in range(cores.bit_length())} | {cores})
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, nargs='+', default=powers)
+    parser.add_argument('--slots', type=int, nargs='+', default=powers)
+    parser.add_argument('--threads', type=int, nargs='+', default=powers)
+    parser.add_argument('--cores', type=int, default=cores, help='Cores to plan for (default: available)')
+    parser.add_argument('--seconds', type=float, default=10.0, help='Measured time per layout')
+    parser.add_argument('--embedder', action='store_true', help='Run the configured embedder in each job')
+    parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+    args = parser.parse_args()
+
+    results = []
+    for layout in layouts(args.cores, args.workers, args.slots, args.threads):
+        row = measure(layout, args.cores, args.seconds, args.embedder)
+        if row is not None:
+            results.append(row)
+            if not args.json:
+                print(f"  measured {layout[0]} workers x {layout[1]} slots x {row['threads_per_job']} threads: "
+                      f"{row['jobs_per_s']} jobs/s")
+
+    managed = [row for row in results if row['threads_per_job'] != 'unmanaged']
+    best = max(managed or results, key=lambda row: row['jobs_per_s'], default=None)
+    report = {
+        'cores': args.cores,
+        'workload': 'embedder' if args.embedder else 'synthetic',
+        'seconds_per_layout': args.seconds,
+        'results': results,
+        'recommended': {
+            'CPU_BUDGET_WORKERS': best['workers'],
+            'ML_SCHEDULER_SLOTS': best['slots'],
+            'CPU_BUDGET_THREADS_PER_JOB': best['threads_per_job']
+        } if best and best['threads_per_job'] != 'unmanaged' else None
+    }
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f"{args.cores} cores, {report['workload']} workload, {args.seconds:g} s per layout")
+    print(f"{'workers':>7} {'slots':>6} {'threads':>10} {'jobs/s':>8} {'p50 ms':>8} {'p95 ms':>8}")
+    for row in sorted(results, key=lambda row: -row['jobs_per_s']):
+        print(f"{row['workers']:>7} {row['slots']:>6} {str(row['threads_per_job']):>10} {row['jobs_per_s']:>8} "
+              f"{row['p50_ms']:>8} {row['p95_ms']:>8}")
+    if report['recommended']:
+        print('Recommended: ' + ' '.join(f"{name}={value}" for name, value in report['recommended'].items()))
+
+
+if __name__ == '__main__':
+    main()
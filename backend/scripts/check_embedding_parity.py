@@ -0,0 +1,69 @@
+"""Check that a non-Keras runtime reproduces the Keras FaceNet embeddings.
+
+Usage (from the backend directory):
+    python -m scripts.check_embedding_parity [--backends onnx opencv_dnn]
+                                             [--tolerance 1e-3]
+
+Embeds the face crops of uploads/profiles (plus random inputs, to exercise
+every batch bucket) with Keras and each backend, and exits non-zero if any
+embedding's cosine similarity to the Keras one falls below 1 - tolerance.
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+
+from app.utils.face_embedders import create_embedder, embedder_options
+from config import get_active_config
+from scripts.face_crops import load_face_crops
+
+
+def cosine_rows(a, b):
+    """Row-wise cosine similarity of two embedding matrices"""
+    a = a / np.maximum(np.linalg.norm(a, axis=1, keepdims=True), 1e-12)
+    b = b / np.maximum(np.linalg.norm(b, axis=1, keepdims=True), 1e-12)
+    return np.sum(a * b, axis=1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--backends', nargs='+', default=['onnx', 'opencv_dnn'])
+    parser.add_argument('--tolerance', type=float, default=1e-3)
+    parser.add_argument('--random', type=int, default=19,
+                        help='Extra random inputs (odd count exercises padding)')
+    args = parser.parse_args()
+
+    settings = get_active_config()
+    _, crops = load_face_crops(os.path.join(settings.UPLOAD_FOLDER, 'profiles'), settings)
+    rng = np.random.default_rng(0)
+    inputs = np.concatenate([
+        crops, rng.standard_normal((args.random, 160, 160, 3)).astype('float32')
+    ])
+    print(f"📂 {len(crops)} face crops + {args.random} random inputs")
+
+    reference = create_embedder('keras', **embedder_options(settings, 'keras'))
+    expected = reference.embed(inputs)
+
+    failed = False
+    for backend in args.backends:
+        try:
+            embedder = create_embedder(backend, **embedder_options(settings, backend))
+        except Exception as e:
+            print(f"⚠️ Backend '{backend}' unavailable: {e}")
+            failed = True
+            continue
+
+        actual = embedder.embed(inputs)
+        cosine = cosine_rows(expected, actual)
+        max_abs = float(np.max(np.abs(expected - actual)))
+        ok = bool(np.all(cosine >= 1.0 - args.tolerance))
+        failed = failed or not ok
+        print(f"{'✅' if ok else '❌'} {backend}: min cosine {cosine.min():.6f}, "
+              f"max abs diff {max_abs:.2e}")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
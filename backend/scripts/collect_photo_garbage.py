@@ -0,0 +1,28 @@
+"""Delete stored photos that no upload has referenced for a while.
+
+Usage (from the backend directory):
+    python -m scripts.collect_photo_garbage [--grace-seconds 3600]
+
+Safe to run from cron on any node: a photo is only deleted after its
+reference count has been zero for the whole grace period.
+"""
+import argparse
+
+from app.utils.db import get_client
+from app.utils.storage import photo_store
+from config import get_active_config
+
+
+def main():
+    settings = get_active_config()
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--grace-seconds', type=int, default=settings.PHOTO_STORE_GC_GRACE_S)
+    args = parser.parse_args()
+
+    db = get_client(settings.MONGO_URI).get_default_database()
+    removed = photo_store.collect_garbage(db, grace_seconds=args.grace_seconds)
+    print(f"Removed {removed} unreferenced photos")
+
+
+if __name__ == '__main__':
+    main()
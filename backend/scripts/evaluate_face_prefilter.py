@@ -0,0 +1,166 @@
+"""Measure false skips and savings of the cascade face prefilter on a labelled sample.
+
+Usage (from the backend directory):
+    python -m scripts.evaluate_face_prefilter --faces DIR --no-faces DIR
+                                              [--labels boxes.json] [--min-neighbors 1 2 3 5]
+                                              [--detector mtcnn] [--json]
+
+Images under --faces contain at least one face, images under --no-faces
+none (scenery, food, slides). For every min_neighbors value the prefilter is
+run as configured otherwise (FACE_PREFILTER_* settings) and reports the
+false skip rate (face images it would not send to the detector, the number
+to keep at or near zero), the skip rate on face-free images (the detector
+work saved) and its own cost. With --labels ({"filename": [[x, y, w, h],
+...]}) labelled faces whose center falls outside the planned regions are
+counted too. With --detector, the detector is also run as planned and on
+full images, comparing faces found and detector time.
+"""
+import os
+import json
+import time
+import argparse
+import statistics
+
+import cv2
+
+from app.utils.face_detectors import create_detector, detector_options
+from app.utils.face_prefilter import FacePrefilter, center_inside
+from config import get_active_config
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.gif')
+
+
+def load_folder(folder, has_faces):
+    """(filename, has_faces, bgr_image) for every readable image in a folder"""
+    images = []
+    for name in sorted(os.listdir(folder)):
+        if not name.lower().endswith(IMAGE_EXTENSIONS):
+            continue
+        image = cv2.imread(os.path.join(folder, name))
+        if image is None:
+            print(f"⚠️ Skipping unreadable image: {name}")
+            continue
+        images.append((name, has_faces, image))
+    return images
+
+
+def evaluate(prefilter, images, labels, detector):
+    """Plan every image once; count skips, misses and (with a detector) time"""
+    face_images = [item for item in images if item[1]]
+    empty_images = [item for item in images if not item[1]]
+    screen_ms, false_skips, true_skips, decisions = [], [], 0, {'skip': 0, 'roi': 0, 'full': 0}
+    labelled, outside = 0, 0
+    detector_ms = {'planned': 0.0, 'full': 0.0}
+    faces_found = {'planned': 0, 'full': 0}
+
+    for name, has_faces, image in images:
+        started = time.perf_counter()
+        decision, regions = prefilter.plan(image)
+        screen_ms.append((time.perf_counter() - started) * 1000)
+        decisions[decision] += 1
+        if decision == 'skip':
+            if has_faces:
+                false_skips.append(name)
+            else:
+                true_skips += 1
+        for box in labels.get(name, []):
+            labelled += 1
+            if decision == 'skip' or (decision == 'roi' and not center_inside(box, regions)):
+                outside += 1
+
+        if detector is not None:
+            rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+            started = time.perf_counter()
+            planned = prefilter.detect(detector.detect, rgb_image, decision, regions)
+            detector_ms['planned'] += (time.perf_counter() - started) * 1000
+            started = time.perf_counter()
+            full = detector.detect(rgb_image)
+            detector_ms['full'] += (time.perf_counter() - started) * 1000
+            faces_found['planned'] += len(planned)
+            faces_found['full'] += len(full)
+
+    result = {
+        'min_neighbors': prefilter.min_neighbors,
+        'face_images': len(face_images),
+        'face_free_images': len(empty_images),
+        'false_skips': len(false_skips),
+        'false_skip_rate': round(len(false_skips) / len(face_images), 4) if face_images else None,
+        'false_skipped_images': false_skips[:20],
+        'face_free_skip_rate': round(true_skips / len(empty_images), 4) if empty_images else None,
+        'decisions': decisions,
+        'screen_ms_p50': round(statistics.median(screen_ms), 2) if screen_ms else None,
+        'labelled_faces': labelled,
+        'labelled_faces_missed': outside
+    }
+    if detector is not None:
+        result['detector'] = {
+            'faces_found_planned': faces_found['planned'],
+            'faces_found_full': faces_found['full'],
+            'detector_ms_planned': round(detector_ms['planned'], 1),
+            'detector_ms_full': round(detector_ms['full'], 1),
+            'screen_ms_total': round(sum(screen_ms), 1)
+        }
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--faces', required=True, help='Folder of images that contain faces')
+    parser.add_argument('--no-faces', required=True, help='Folder of face-free images')
+    parser.add_argument('--labels', help='JSON file with ground-truth boxes per filename')
+    parser.add_argument('--min-neighbors', type=int, nargs='+', default=[1, 2, 3, 5])
+    parser.add_argument('--detector', help='Also run this detector backend as planned and on full images')
+    parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+    args = parser.parse_args()
+
+    settings = get_active_config()
+    images = load_folder(args.faces, True) + load_folder(args.no_faces, False)
+    labels = {}
+    if args.labels:
+        with open(args.labels) as f:
+            labels = json.load(f)
+    detector = None
+    if args.detector:
+        detector = create_detector(args.detector, **detector_options(settings, args.detector))
+
+    results = []
+    for min_neighbors in args.min_neighbors:
+        prefilter = FacePrefilter(
+            cascades=[name.strip() for name in settings.FACE_PREFILTER_CASCADES.split(',') if name.strip()],
+            cascade_dir=settings.FACE_PREFILTER_CASCADE_DIR,
+            thumbnail_size=settings.FACE_PREFILTER_THUMBNAIL_SIZE,
+            scale_factor=settings.FACE_PREFILTER_SCALE_FACTOR,
+            min_neighbors=min_neighbors,
+            min_size=settings.FACE_PREFILTER_MIN_SIZE,
+            roi_margin=settings.FACE_PREFILTER_ROI_MARGIN,
+            max_roi_fraction=settings.FACE_PREFILTER_MAX_ROI_FRACTION,
+            action=settings.FACE_PREFILTER_ACTION
+        )
+        results.append(evaluate(prefilter, images, labels, detector))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"📂 {sum(1 for item in images if item[1])} face images, "
+          f"{sum(1 for item in images if not item[1])} face-free images")
+    print(f"{'neighbors':>9} {'false skips':>12} {'free skipped':>13} {'roi/full/skip':>14} "
+          f"{'screen ms':>10} {'labels missed':>14}")
+    for row in results:
+        decisions = row['decisions']
+        false_skip_rate = f"{row['false_skip_rate']:.2%}" if row['false_skip_rate'] is not None else 'n/a'
+        free_rate = f"{row['face_free_skip_rate']:.2%}" if row['face_free_skip_rate'] is not None else 'n/a'
+        missed = f"{row['labelled_faces_missed']}/{row['labelled_faces']}" if row['labelled_faces'] else 'n/a'
+        print(f"{row['min_neighbors']:>9} {false_skip_rate:>12} {free_rate:>13} "
+              f"{decisions['roi']:>4}/{decisions['full']}/{decisions['skip']:<5} "
+              f"{row['screen_ms_p50']:>10} {missed:>14}")
+        if row['false_skipped_images']:
+            print(f"          skipped with faces: {', '.join(row['false_skipped_images'])}")
+        if 'detector' in row:
+            d = row['detector']
+            print(f"          {args.detector}: {d['faces_found_planned']} faces as planned in "
+                  f"{d['detector_ms_planned'] + d['screen_ms_total']:.0f} ms (incl. screening), "
+                  f"{d['faces_found_full']} on full images in {d['detector_ms_full']:.0f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""Report the accuracy cost and throughput gain of the INT8 FaceNet model.
+
+Usage (from the backend directory):
+    python -m scripts.evaluate_quantized [--backend onnx] [--threshold 0.6]
+
+Embeds every face crop in uploads/profiles and uploads/groups with the float
+and int8 models, then reports per-face cosine drift between the two,
+agreement of all pairwise match decisions at the matching threshold, and
+faces/second for each model.
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+
+from app.utils.face_embedders import create_embedder, embedder_options
+from config import get_active_config
+from scripts.face_crops import load_face_crops
+
+
+def normalize(embeddings):
+    """L2-normalize embedding rows"""
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return embeddings / np.maximum(norms, 1e-12)
+
+
+def throughput(embedder, crops, batch_size, iterations):
+    """Faces per second at a given batch size"""
+    batch = crops[:batch_size]
+    if len(batch) < batch_size:
+        batch = np.resize(crops, (batch_size,) + crops.shape[1:])
+    embedder.embed(batch)
+    start = time.perf_counter()
+    for _ in range(iterations):
+        embedder.embed(batch)
+    return iterations * batch_size / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--backend', default='onnx', choices=['onnx', 'opencv_dnn'])
+    parser.add_argument('--threshold', type=float, default=0.6)
+    parser.add_argument('--batch-size', type=int, default=16)
+    parser.add_argument('--iterations', type=int, default=20)
+    args = parser.parse_args()
+
+    settings = get_active_config()
+    crops = []
+    for kind in ('profiles', 'groups'):
+        _, kind_crops = load_face_crops(os.path.join(settings.UPLOAD_FOLDER, kind), settings)
+        crops.append(kind_crops)
+    crops = np.concatenate(crops)
+    if len(crops) < 2:
+        raise SystemExit("❌ Need at least two face crops to compare match decisions")
+    print(f"📂 Evaluating on {len(crops)} face crops")
+
+    float_model = create_embedder(args.backend, **embedder_options(settings, args.backend, 'float32'))
+    int8_model = create_embedder(args.backend, **embedder_options(settings, args.backend, 'int8'))
+
+    float_emb = normalize(float_model.embed(crops))
+    int8_emb = normalize(int8_model.embed(crops))
+
+    # Drift of each face's embedding between the two models
+    drift = np.sum(float_emb * int8_emb, axis=1)
+
+    # Every pairwise match decision, as made by process_group_photo
+    upper = np.triu_indices(len(crops), k=1)
+    float_sim = (float_emb @ float_emb.T)[upper]
+    int8_sim = (int8_emb @ int8_emb.T)[upper]
+    float_match = float_sim > args.threshold
+    int8_match = int8_sim > args.threshold
+    agreement = np.mean(float_match == int8_match)
+    lost = int(np.sum(float_match & ~int8_match))
+    gained = int(np.sum(~float_match & int8_match))
+
+    float_fps = throughput(float_model, crops, args.batch_size, args.iterations)
+    int8_fps = throughput(int8_model, crops, args.batch_size, args.iterations)
+
+    print("\nAccuracy")
+    print(f"  cosine(float, int8) per face: mean {drift.mean():.4f}, "
+          f"p5 {np.percentile(drift, 5):.4f}, min {drift.min():.4f}")
+    print(f"  pairwise similarity abs error: mean {np.mean(np.abs(float_sim - int8_sim)):.4f}, "
+          f"max {np.max(np.abs(float_sim - int8_sim)):.4f}")
+    print(f"  match decisions @ {args.threshold}: {agreement:.2%} agree over {len(float_sim)} pairs "
+          f"({lost} matches lost, {gained} gained)")
+    print(f"\nThroughput ({args.backend}, batch {args.batch_size})")
+    print(f"  float32: {float_fps:8.1f} faces/s")
+    print(f"  int8:    {int8_fps:8.1f} faces/s  ({int8_fps / float_fps:.2f}x)")
+
+
+if __name__ == '__main__':
+    main()
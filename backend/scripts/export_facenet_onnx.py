@@ -0,0 +1,55 @@
+"""Export the Keras FaceNet model to ONNX for the onnx/opencv_dnn runtimes.
+
+Usage (from the backend directory):
+    python -m scripts.export_facenet_onnx [--keras facenet_keras.h5]
+                                          [--output models/facenet.onnx]
+
+Requires tensorflow and tf2onnx at export time only; serving the exported
+model needs onnxruntime (EMBEDDING_BACKEND=onnx) or just OpenCV
+(EMBEDDING_BACKEND=opencv_dnn).
+"""
+import argparse
+import os
+
+from app.utils.face_embedders import FACE_INPUT_SIZE, find_model_file, keras_model_candidates
+from config import get_active_config
+
+
+def export(keras_path, output_path, opset):
+    """Convert a Keras FaceNet model to ONNX with a dynamic batch dimension"""
+    import keras
+    import tensorflow as tf
+    import tf2onnx
+
+    try:
+        keras.config.enable_unsafe_deserialization()
+    except Exception:
+        pass
+    model = keras.models.load_model(keras_path, safe_mode=False)
+
+    # Dynamic batch so the runtime can be fed any of the batch buckets
+    spec = (tf.TensorSpec((None,) + FACE_INPUT_SIZE + (3,), tf.float32, name='input'),)
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    tf2onnx.convert.from_keras(model, input_signature=spec, opset=opset, output_path=output_path)
+
+
+def main():
+    settings = get_active_config()
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--keras', help='Path to facenet_keras.h5 (searched when omitted)')
+    parser.add_argument('--output', default=settings.EMBEDDING_ONNX_PATH)
+    parser.add_argument('--opset', type=int, default=13)
+    args = parser.parse_args()
+
+    keras_path = args.keras or find_model_file(keras_model_candidates(settings))
+    if not keras_path:
+        raise SystemExit("❌ Keras FaceNet model not found, pass --keras")
+
+    print(f"🔄 Exporting {keras_path} -> {args.output}")
+    export(keras_path, args.output, args.opset)
+    print(f"✅ ONNX model written to {args.output}")
+    print("   Verify with: python -m scripts.check_embedding_parity")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+"""Load preprocessed face crops from a folder of photos for model tooling."""
+import os
+
+import cv2
+import numpy as np
+
+from app.utils.face_detectors import create_detector, detector_options
+from app.utils.face_embedders import preprocess_face
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.gif')
+
+
+def load_face_crops(folder, settings, limit=None):
+    """Detect faces in every photo of a folder and return (names, crops)
+
+    Falls back to the stub detector (central crop) when the configured
+    detector cannot be loaded, so the tooling still runs without MTCNN.
+    """
+    backend = settings.FACE_DETECTOR_BACKEND
+    try:
+        detector = create_detector(backend, **detector_options(settings, backend))
+    except Exception as e:
+        print(f"⚠️ Detector '{backend}' unavailable ({e}), using central crops")
+        detector = create_detector('stub')
+
+    names, crops = [], []
+    for name in sorted(os.listdir(folder)):
+        if not name.lower().endswith(IMAGE_EXTENSIONS):
+            continue
+        image = cv2.imread(os.path.join(folder, name))
+        if image is None:
+            continue
+        rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        for i, det in enumerate(detector.detect(rgb_image)):
+            x, y, w, h = det['box']
+            x, y = max(0, x), max(0, y)
+            face = rgb_image[y:y + h, x:x + w]
+            if face.size == 0:
+                continue
+            names.append(f"{name}#{i}")
+            crops.append(preprocess_face(face))
+            if limit and len(crops) >= limit:
+                return names, np.stack(crops).astype('float32')
+
+    if not crops:
+        return names, np.zeros((0, 160, 160, 3), dtype='float32')
+    return names, np.stack(crops).astype('float32')
@@ -0,0 +1,322 @@
+"""End-to-end load generator for the auth, upload and my-photos endpoints.
+
+Usage (from the backend directory):
+    python -m scripts.load_test --users 50 --rps 20 --duration 30
+    python -m scripts.load_test --users 50 --saturate --start-rps 5 --step 5 --slo-ms 1000
+    python -m scripts.load_test --base-url http://staging:5000 --users 20 --rps 10
+
+Without --base-url the real app is started in-process on a local port,
+backed by the mongomock stand-in (MONGO_URI=mongomock://...), the stub face
+detector and the synthetic embedder, with uploads written to a temporary
+directory and rate limiting off (RATE_LIMIT_ENABLED=false). Setup registers the synthetic users and enrolls a profile photo
+for each; the run then replays the request mix open-loop at the target rate
+and reports latency percentiles, error rates and throughput per endpoint.
+Latency is measured from each request's scheduled start, so a backed-up
+server is not hidden by the generator slowing down.
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_MIX = 'login:0.1,profile:0.05,group:0.25,poll:0.6'
+
+
+def configure_standins(upload_folder):
+    """Point the in-process app at local stand-ins before it is imported"""
+    os.environ.setdefault('MONGO_URI', f"mongomock://localhost/loadtest_{uuid.uuid4().hex[:8]}")
+    os.environ.setdefault('FACE_DETECTOR_BACKEND', 'stub')
+    os.environ.setdefault('EMBEDDING_BACKEND', 'synthetic')
+    os.environ.setdefault('UPLOAD_FOLDER', upload_folder)
+    # Setup registers and logs in every synthetic user from one address
+    os.environ.setdefault('RATE_LIMIT_ENABLED', 'false')
+
+
+def start_local_server(config_name):
+    """Run the real Flask app on a background thread; returns its base URL"""
+    import logging
+    from werkzeug.serving import make_server
+    from app import create_app
+
+    app = create_app(config_name)
+    # Per-request INFO logs would dominate the run's cost and output
+    logging.getLogger().setLevel(logging.WARNING)
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}"
+
+
+def synthetic_photo(seed, size=192):
+    """JPEG bytes of a deterministic block pattern standing in for a face"""
+    import cv2
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    blocks = rng.integers(0, 256, size=(6, 6, 3), dtype=np.uint8)
+    image = cv2.resize(blocks, (size, size), interpolation=cv2.INTER_NEAREST)
+    return cv2.imencode('.jpg', image)[1].tobytes()
+
+
+class Client:
+    """Minimal HTTP client for the JSON and multipart endpoints"""
+
+    def __init__(self, base_url, timeout):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+
+    def request(self, method, path, token=None, json_body=None, file_bytes=None, headers=None):
+        """Send a request; returns (status, headers, parsed JSON or None)"""
+        headers = dict(headers or {})
+        data = None
+        if token:
+            headers['Authorization'] = f"Bearer {token}"
+        if json_body is not None:
+            data = json.dumps(json_body).encode()
+            headers['Content-Type'] = 'application/json'
+        elif file_bytes is not None:
+            boundary = uuid.uuid4().hex
+            data = (
+                f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; "
+                f"filename=\"photo.jpg\"\r\nContent-Type: image/jpeg\r\n\r\n"
+            ).encode() + file_bytes + f"\r\n--{boundary}--\r\n".encode()
+            headers['Content-Type'] = f"multipart/form-data; boundary={boundary}"
+
+        req = urllib.request.Request(self.base_url + path, data=data, headers=headers, method=method)
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+                body = resp.read()
+                return resp.status, resp.headers, json.loads(body) if body else None
+        except urllib.error.HTTPError as e:
+            body = e.read()
+            try:
+                payload = json.loads(body) if body else None
+            except ValueError:
+                payload = None
+            return e.code, e.headers, payload
+
+
+class SyntheticUser:
+    """A registered user with its enrolled photo and last seen ETag"""
+
+    def __init__(self, index, run_id):
+        self.username = f"load_{run_id}_{index}"
+        self.password = 'load-test-password'
+        self.photo = synthetic_photo(index)
+        self.token = None
+        self.etag = None
+
+
+class Recorder:
+    """Thread-safe per-endpoint latency and error accounting"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = {}
+
+    def record(self, endpoint, latency_ms, ok):
+        with self._lock:
+            self.samples.setdefault(endpoint, []).append((latency_ms, ok))
+
+    def report(self, elapsed_s):
+        """Summarize every endpoint (and the total) over the run"""
+        with self._lock:
+            samples = {name: list(values) for name, values in self.samples.items()}
+        samples['TOTAL'] = [s for values in samples.values() for s in values]
+
+        summary = {}
+        for endpoint, values in samples.items():
+            if not values:
+                continue
+            latencies = sorted(latency for latency, _ in values)
+            errors = sum(1 for _, ok in values if not ok)
+
+            def percentile(p):
+                return latencies[min(len(latencies) - 1, int(p / 100 * len(latencies)))]
+
+            summary[endpoint] = {
+                'requests': len(values),
+                'throughput_rps': len(values) / elapsed_s if elapsed_s else 0.0,
+                'error_rate': errors / len(values),
+                'p50_ms': percentile(50),
+                'p90_ms': percentile(90),
+                'p95_ms': percentile(95),
+                'p99_ms': percentile(99),
+                'max_ms': latencies[-1]
+            }
+        return summary
+
+
+def setup_users(client, count, run_id, concurrency):
+    """Register and enroll the synthetic user population"""
+    users = [SyntheticUser(i, run_id) for i in range(count)]
+
+    def enroll(user):
+        status, _, body = client.request('POST', '/api/auth/register', json_body={
+            'username': user.username,
+            'email': f"{user.username}@loadtest.local",
+            'password': user.password
+        })
+        if status != 201:
+            raise RuntimeError(f"register {user.username} failed: {status} {body}")
+        user.token = body['data']['access_token']
+        status, _, body = client.request('POST', '/api/upload/profile', token=user.token,
+                                         file_bytes=user.photo)
+        if status != 200:
+            raise RuntimeError(f"enroll {user.username} failed: {status} {body}")
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(enroll, users))
+    return users
+
+
+def run_operation(client, operation, users, rng):
+    """Issue one request of the given kind; returns True on success"""
+    user = rng.choice(users)
+    if operation == 'login':
+        status, _, _ = client.request('POST', '/api/auth/login', json_body={
+            'username': user.username, 'password': user.password
+        })
+        return status == 200
+    if operation == 'profile':
+        status, _, _ = client.request('POST', '/api/upload/profile', token=user.token,
+                                      file_bytes=user.photo)
+        return status == 200
+    if operation == 'group':
+        # Mostly photos of enrolled users (so matches land), some strangers
+        subject = rng.choice(users).photo if rng.random() < 0.8 else synthetic_photo(rng.randrange(10 ** 9))
+        status, _, _ = client.request('POST', '/api/upload/group', token=user.token,
+                                      file_bytes=subject)
+        return status == 200
+    if operation == 'poll':
+        headers = {'If-None-Match': user.etag} if user.etag else None
+        status, resp_headers, _ = client.request('GET', '/api/upload/my-photos', token=user.token,
+                                                 headers=headers)
+        if status == 200:
+            user.etag = resp_headers.get('ETag')
+        return status in (200, 304)
+    raise ValueError(f"Unknown operation '{operation}'")
+
+
+def run_load(client, users, mix, rps, duration, max_in_flight, seed):
+    """Replay the mix open-loop at rps for duration seconds"""
+    recorder = Recorder()
+    operations, weights = zip(*mix.items())
+    rng = random.Random(seed)
+    in_flight = threading.BoundedSemaphore(max_in_flight)
+
+    def execute(operation, scheduled_at, op_seed):
+        try:
+            ok = run_operation(client, operation, users, random.Random(op_seed))
+        except Exception:
+            ok = False
+        finally:
+            in_flight.release()
+        recorder.record(operation, (time.perf_counter() - scheduled_at) * 1000, ok)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_in_flight) as pool:
+        sent = 0
+        while True:
+            scheduled_at = start + sent / rps
+            if scheduled_at - start >= duration:
+                break
+            delay = scheduled_at - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            operation = rng.choices(operations, weights)[0]
+            if not in_flight.acquire(blocking=False):
+                # Generator saturated: count it as a failed request
+                recorder.record(operation, 0.0, False)
+            else:
+                pool.submit(execute, operation, scheduled_at, rng.randrange(2 ** 32))
+            sent += 1
+    return recorder.report(time.perf_counter() - start)
+
+
+def print_report(title, summary):
+    print(f"\n{title}")
+    print(f"{'endpoint':<10} {'reqs':>7} {'rps':>8} {'errors':>8} {'p50':>8} "
+          f"{'p90':>8} {'p95':>8} {'p99':>8} {'max':>8}")
+    for endpoint, row in sorted(summary.items(), key=lambda item: item[0] == 'TOTAL'):
+        print(f"{endpoint:<10} {row['requests']:>7} {row['throughput_rps']:>8.1f} "
+              f"{row['error_rate']:>8.2%} {row['p50_ms']:>8.1f} {row['p90_ms']:>8.1f} "
+              f"{row['p95_ms']:>8.1f} {row['p99_ms']:>8.1f} {row['max_ms']:>8.1f}")
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        name, weight = part.split(':')
+        mix[name.strip()] = float(weight)
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--base-url', help='Target server; omitted = in-process app with stand-ins')
+    parser.add_argument('--config', default='development', help='Config name for the in-process app')
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--mix', default=DEFAULT_MIX, help='operation:weight list')
+    parser.add_argument('--rps', type=float, default=10.0)
+    parser.add_argument('--duration', type=float, default=30.0, help='Seconds per run or step')
+    parser.add_argument('--max-in-flight', type=int, default=256)
+    parser.add_argument('--timeout', type=float, default=60.0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--saturate', action='store_true', help='Step the rate up to find max sustainable RPS')
+    parser.add_argument('--start-rps', type=float, default=5.0)
+    parser.add_argument('--step', type=float, default=5.0)
+    parser.add_argument('--max-rps', type=float, default=1000.0)
+    parser.add_argument('--slo-ms', type=float, default=1000.0, help='p95 latency SLO for --saturate')
+    parser.add_argument('--max-error-rate', type=float, default=0.01)
+    parser.add_argument('--json', help='Write the raw results to this file')
+    args = parser.parse_args()
+
+    base_url = args.base_url
+    if base_url is None:
+        configure_standins(tempfile.mkdtemp(prefix='loadtest_uploads_'))
+        base_url = start_local_server(args.config)
+        print(f"🧪 In-process app with stand-ins at {base_url}")
+
+    client = Client(base_url, args.timeout)
+    run_id = uuid.uuid4().hex[:6]
+    start = time.perf_counter()
+    users = setup_users(client, args.users, run_id, concurrency=8)
+    print(f"👥 Registered and enrolled {len(users)} users in {time.perf_counter() - start:.1f}s")
+
+    mix = parse_mix(args.mix)
+    results = []
+    if not args.saturate:
+        summary = run_load(client, users, mix, args.rps, args.duration, args.max_in_flight, args.seed)
+        print_report(f"Load at {args.rps:g} RPS for {args.duration:g}s", summary)
+        results.append({'rps': args.rps, 'summary': summary})
+    else:
+        rps, sustainable = args.start_rps, None
+        while rps <= args.max_rps:
+            summary = run_load(client, users, mix, rps, args.duration, args.max_in_flight, args.seed)
+            total = summary['TOTAL']
+            ok = total['p95_ms'] <= args.slo_ms and total['error_rate'] <= args.max_error_rate
+            results.append({'rps': rps, 'summary': summary, 'within_slo': ok})
+            print(f"{'✅' if ok else '❌'} {rps:>7.1f} RPS offered -> {total['throughput_rps']:.1f} RPS, "
+                  f"p95 {total['p95_ms']:.0f} ms, errors {total['error_rate']:.2%}")
+            if not ok:
+                break
+            sustainable = rps
+            rps += args.step
+        print(f"\n📈 Max sustainable rate: {sustainable if sustainable is not None else 'below start rate'} RPS "
+              f"(p95 <= {args.slo_ms:g} ms, errors <= {args.max_error_rate:.0%})")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""Produce an INT8 post-training quantized FaceNet model for CPU serving.
+
+Usage (from the backend directory):
+    python -m scripts.quantize_facenet [--calibration uploads/profiles]
+                                       [--input models/facenet.onnx]
+                                       [--output models/facenet_int8.onnx]
+
+Static quantization with ONNX Runtime: weights are quantized per channel to
+int8 and activation ranges are calibrated on face crops detected in the
+calibration folder. Serve the result with EMBEDDING_PRECISION=int8 and
+check the accuracy cost with scripts.evaluate_quantized.
+"""
+import argparse
+import os
+
+from config import get_active_config
+from scripts.face_crops import load_face_crops
+
+
+class FaceCropReader:
+    """Calibration data reader feeding one face crop per inference"""
+
+    def __init__(self, input_name, crops):
+        self._inputs = iter([{input_name: crop[None]} for crop in crops])
+
+    def get_next(self):
+        return next(self._inputs, None)
+
+
+def quantize(input_path, output_path, crops, method):
+    """Run static int8 quantization of an ONNX model"""
+    import onnxruntime as ort
+    from onnxruntime.quantization import (
+        CalibrationMethod, QuantFormat, QuantType, quantize_static
+    )
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    input_name = ort.InferenceSession(
+        input_path, providers=['CPUExecutionProvider']
+    ).get_inputs()[0].name
+
+    # Shape inference + graph cleanup make more nodes quantizable
+    prepared_path = output_path + '.prep.onnx'
+    quant_pre_process(input_path, prepared_path)
+    try:
+        quantize_static(
+            prepared_path,
+            output_path,
+            FaceCropReader(input_name, crops),
+            quant_format=QuantFormat.QDQ,
+            per_channel=True,
+            activation_type=QuantType.QUInt8,
+            weight_type=QuantType.QInt8,
+            calibrate_method=getattr(CalibrationMethod, method)
+        )
+    finally:
+        os.remove(prepared_path)
+
+
+def main():
+    settings = get_active_config()
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--calibration', default=os.path.join(settings.UPLOAD_FOLDER, 'profiles'),
+                        help='Folder of photos whose face crops calibrate activations')
+    parser.add_argument('--input', default=settings.EMBEDDING_ONNX_PATH)
+    parser.add_argument('--output', default=settings.EMBEDDING_INT8_PATH)
+    parser.add_argument('--limit', type=int, default=500, help='Max calibration crops')
+    parser.add_argument('--method', default='MinMax', choices=['MinMax', 'Entropy', 'Percentile'])
+    args = parser.parse_args()
+
+    if not os.path.exists(args.input):
+        raise SystemExit(f"❌ Float model not found: {args.input} "
+                         "(run python -m scripts.export_facenet_onnx first)")
+
+    _, crops = load_face_crops(args.calibration, settings, limit=args.limit)
+    if len(crops) == 0:
+        raise SystemExit(f"❌ No face crops found in {args.calibration}")
+    print(f"📂 Calibrating on {len(crops)} face crops from {args.calibration}")
+
+    quantize(args.input, args.output, crops, args.method)
+    size_in = os.path.getsize(args.input) / 2 ** 20
+    size_out = os.path.getsize(args.output) / 2 ** 20
+    print(f"✅ INT8 model written to {args.output} ({size_in:.1f} MB -> {size_out:.1f} MB)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,40 @@
+"""Rebuild the precomputed per-user statistics from group photos and event videos.
+
+Usage (from the backend directory):
+    python -m scripts.rebuild_user_stats [--dry-run] [--json]
+
+The matcher keeps user_stats current with atomic increments as photos and
+videos are processed; this repair job recomputes every counter from the
+source documents and rewrites the ones that drifted (e.g. after a failed
+stats write or a manual data fix). Best run while uploads are quiet.
+"""
+import json
+import argparse
+
+from app.utils.db import get_client
+from app.utils.user_stats import rebuild_user_stats
+from config import get_active_config
+
+
+def main():
+    settings = get_active_config()
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--dry-run', action='store_true', help='Only report drifted counters, do not fix them')
+    parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+    args = parser.parse_args()
+
+    db = get_client(settings.MONGO_URI).get_default_database()
+    report = rebuild_user_stats(db, dry_run=args.dry_run)
+
+    if args.json:
+        print(json.dumps(report, indent=2, default=str))
+        return
+    action = 'would fix' if args.dry_run else 'fixed'
+    print(f"Users: {report['users']}, drifted: {report['drifted']} ({action}), stale removed: {report['removed']}")
+    for entry in report['sample']:
+        changes = ', '.join(f"{name} {old} -> {new}" for name, (old, new) in entry['differences'].items())
+        print(f"  {entry['user_id']}: {changes}")
+
+
+if __name__ == '__main__':
+    main()
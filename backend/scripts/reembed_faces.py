@@ -0,0 +1,82 @@
+"""Re-embed every stored face with a new model, then cut over to it.
+
+Usage (from the backend directory):
+    EMBEDDING_TARGET_VERSION=facenet-v2 EMBEDDING_TARGET_MODEL_PATH=models/facenet_v2.onnx \\
+        python -m scripts.reembed_faces [--max-photos-per-s 5] [--retry-failed] [--allow-failures]
+                                        [--status] [--json]
+
+Users are re-embedded from their stored profile photo and group photos
+from the stored original at the already detected boxes. Progress is kept
+in Mongo, so the job can be stopped (Ctrl-C) and started again, and may be
+restarted on another host. API nodes configured with the same target
+write both versions for new uploads in the meantime; once every face has
+a target embedding the target becomes the active version and the nodes
+switch over on their own.
+
+Users or photos that could not be re-embedded (original missing, no face
+found) block the cut-over, since they would stop matching. --retry-failed
+queues them again; --allow-failures (REEMBED_ALLOW_FAILURES) cuts over
+without them.
+"""
+import json
+import argparse
+
+from app.utils import ml_processor
+from app.utils.db import get_client
+from app.utils.embedding_versions import ReembedMigration, get_active_version
+from app.utils.ml_scheduler import BULK
+from config import get_active_config
+
+
+def main():
+    settings = get_active_config()
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--batch-size', type=int, default=settings.REEMBED_BATCH_SIZE)
+    parser.add_argument('--max-photos-per-s', type=float, default=settings.REEMBED_MAX_PHOTOS_PER_S)
+    parser.add_argument('--progress-interval', type=float, default=10.0, help='Seconds between progress lines')
+    parser.add_argument('--retry-failed', action='store_true', help='Re-embed documents that failed before')
+    parser.add_argument('--allow-failures', action='store_true', default=settings.REEMBED_ALLOW_FAILURES,
+                        help='Cut over even if some documents could not be re-embedded')
+    parser.add_argument('--status', action='store_true', help='Only report progress, do not re-embed')
+    parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+    args = parser.parse_args()
+
+    db = get_client(settings.MONGO_URI).get_default_database()
+    source = get_active_version(db, ml_processor.model_version)
+    target = ml_processor.target_model_version
+    if target is None:
+        parser.error('set EMBEDDING_TARGET_VERSION (and a loadable target model) to migrate')
+
+    migration = ReembedMigration(
+        db, source, target, ml_processor.reembed_document,
+        run_job=lambda fn, *job_args: ml_processor.run_scheduled(BULK, None, fn, *job_args),
+        batch_size=args.batch_size,
+        max_photos_per_s=args.max_photos_per_s,
+        allow_failures=args.allow_failures
+    )
+    if args.retry_failed and not args.status:
+        print(f"Retrying {migration.retry_failed()} documents that failed before")
+    if args.status:
+        progress = migration.progress()
+    else:
+        try:
+            progress = migration.run(progress_interval=args.progress_interval)
+        except KeyboardInterrupt:
+            # The position is already saved; running again resumes from it
+            progress = migration.progress()
+
+    if args.json:
+        print(json.dumps(progress, indent=2, default=str))
+        return
+    print(f"Migration {progress['source_version']} -> {progress['target_version']}: phase {progress['phase']}")
+    print(f"Coverage: {progress['coverage']:.2%}, remaining {progress['remaining']}, failed {progress['failed']}")
+    if progress['phase'] == 'blocked':
+        print("Cut-over blocked by documents that could not be re-embedded: "
+              "fix their originals and run with --retry-failed, or use --allow-failures")
+    print(f"Throughput: {progress['photos_per_s']} photos/s, ETA {progress['eta_s']} s")
+    if progress['cut_over_at']:
+        print(f"Cut over to {progress['target_version']} at {progress['cut_over_at']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+"""Simulate several API nodes keeping their galleries in sync through the
+enrollment feed, in one process against the in-memory Mongo stand-in.
+
+Usage (from the backend directory):
+    python -m scripts.simulate_gallery_sync [--nodes 3] [--seed-users 500]
+                                            [--enrollments 200] [--json]
+
+Each node gets its own gallery directory and FeedTailer. The run seeds
+users directly in Mongo, has every node catch up from a snapshot, enrolls
+new users round-robin through the nodes, takes the last node down while
+more users enroll and the feed is trimmed behind it, leaves one sequence
+number allocated but never written (a crashed publisher), then checks that
+every node matches every enrolled user to themselves.
+"""
+import argparse
+import json
+import shutil
+import tempfile
+import time
+
+import mongomock
+import numpy as np
+
+from app.utils.enrollment_feed import (
+    FEED_COLLECTION, FeedTailer, next_sequence, publish_enrollment, latest_sequence
+)
+from app.utils.gallery import Gallery
+
+
+class Node:
+    """One simulated API node: a private gallery directory and a feed tailer"""
+
+    def __init__(self, name, db, root, gap_timeout):
+        self.name = name
+        self.gallery = Gallery(f"{root}/{name}", refresh_interval=0)
+        self.tailer = FeedTailer(db, self.gallery, gap_timeout=gap_timeout, use_change_stream=False)
+
+    def sync(self):
+        return self.tailer.sync_once()
+
+
+def enroll(db, node, rng, index):
+    """Enroll a new user through a node, like upload_profile does"""
+    embedding = rng.standard_normal(128)
+    user_id = db.users.insert_one({'username': f'user{index}', 'face_embedding': embedding.tolist()}).inserted_id
+    publish_enrollment(db, user_id, f'user{index}', embedding)
+    node.sync()
+
+
+def check(db, node):
+    """Fraction of enrolled users the node matches to themselves"""
+    users = list(db.users.find({}, {'face_embedding': 1}))
+    matches = node.gallery.view().best_matches([u['face_embedding'] for u in users])
+    correct = sum(1 for user, match in zip(users, matches) if match and match['user_id'] == str(user['_id']))
+    return correct / len(users)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--nodes', type=int, default=3)
+    parser.add_argument('--seed-users', type=int, default=500)
+    parser.add_argument('--enrollments', type=int, default=200)
+    parser.add_argument('--gap-timeout', type=float, default=0.2)
+    parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    db = mongomock.MongoClient().facial_recognition
+    root = tempfile.mkdtemp(prefix='gallery-sync-')
+    report = {}
+    try:
+        for i in range(args.seed_users):
+            db.users.insert_one({'username': f'seed{i}', 'face_embedding': rng.standard_normal(128).tolist()})
+
+        nodes = [Node(f'node{i}', db, root, args.gap_timeout) for i in range(args.nodes)]
+        start = time.perf_counter()
+        for node in nodes:
+            node.sync()
+        report['initial_catch_up_ms'] = round((time.perf_counter() - start) * 1000, 2)
+
+        start = time.perf_counter()
+        for i in range(args.enrollments):
+            enroll(db, nodes[i % len(nodes)], rng, i)
+        for node in nodes:
+            node.sync()
+        report['enrollments_per_s'] = round(args.enrollments / (time.perf_counter() - start), 1)
+
+        # The last node goes down; enrollments continue and the feed is
+        # trimmed past the point where it stopped
+        down = nodes[-1]
+        for i in range(args.enrollments, 2 * args.enrollments):
+            enroll(db, nodes[i % (len(nodes) - 1)], rng, i)
+        report['lag_while_down'] = down.tailer.stats()['lag_entries']
+        db[FEED_COLLECTION].delete_many({'_id': {'$lte': latest_sequence(db) - 10}})
+
+        # A publisher that crashed after allocating a sequence number
+        next_sequence(db)
+        enroll(db, nodes[0], rng, 2 * args.enrollments)
+
+        # Nodes hold back behind the gap until it times out
+        for node in nodes:
+            node.sync()
+        time.sleep(args.gap_timeout)
+        for node in nodes:
+            node.sync()
+        report['nodes'] = {
+            node.name: {
+                'match_rate': round(check(db, node), 4),
+                'catch_ups': node.tailer.catch_ups,
+                'gaps_skipped': node.tailer.gaps_skipped,
+                'lag_entries': node.tailer.stats()['lag_entries'],
+                'gallery_version': node.gallery.current_version()
+            }
+            for node in nodes
+        }
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f"Initial catch-up of {args.nodes} nodes: {report['initial_catch_up_ms']} ms")
+    print(f"Enrollment throughput: {report['enrollments_per_s']} /s")
+    print(f"Lag of the downed node before restart: {report['lag_while_down']} entries")
+    for name, node in report['nodes'].items():
+        print(f"{name}: match rate {node['match_rate']:.2%}, catch-ups {node['catch_ups']}, "
+              f"gaps skipped {node['gaps_skipped']}, lag {node['lag_entries']}, v{node['gallery_version']}")
+
+
+if __name__ == '__main__':
+    main()